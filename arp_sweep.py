@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+ARP Sweep - Concurrent ARP host discovery across several networks
+Shared by scanner.py and multi_network_scanner.py
+"""
+
+import ipaddress
+import itertools
+import select
+import socket
+import struct
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+ETH_P_ARP = 0x0806
+BROADCAST = b'\xff' * 6
+ARP_REQUEST, ARP_REPLY = 1, 2
+# Ethernet header + ARP payload for IPv4 over Ethernet
+ARP_FRAME = struct.Struct('!6s6sHHHBBH6s4s6s4s')
+
+DEFAULT_RATE = 2000  # requests per second; bursts beyond this get dropped by switches
+CHUNK_SIZE = 256  # requests generated and sent per burst
+
+
+@dataclass
+class ArpReply:
+    """One host that answered an ARP request"""
+    ip: str
+    mac: str
+    network: str  # the swept network the reply is attributed to
+
+
+@dataclass
+class SweepPlan:
+    """Where and how one network is swept"""
+    network: ipaddress.IPv4Network
+    iface: str
+    src_ip: str
+    src_mac: str
+    
+    def hosts(self) -> Iterator[str]:
+        if self.network.num_addresses == 1:
+            return iter([str(self.network.network_address)])
+        return (str(ip) for ip in self.network.hosts())
+    
+    def requests(self) -> Iterator[Tuple['SweepPlan', str]]:
+        for ip in self.hosts():
+            yield self, ip
+
+
+def coalesce_networks(networks: Iterable) -> List[ipaddress.IPv4Network]:
+    """
+    Merge overlapping and adjacent IPv4 networks into the minimal set of
+    CIDRs covering exactly the same addresses.
+
+    Networks become [first, last] address intervals, which are sorted and
+    merged in one pass; each merged interval is then split back into the
+    fewest aligned CIDRs. Invalid and IPv6 entries are dropped.
+    """
+    intervals = []
+    for network in networks:
+        try:
+            net = ipaddress.ip_network(network, strict=False)
+        except ValueError:
+            continue
+        if net.version == 4:
+            intervals.append((int(net.network_address), int(net.broadcast_address)))
+    intervals.sort()
+    
+    merged: List[List[int]] = []
+    for first, last in intervals:
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], last)
+        else:
+            merged.append([first, last])
+    
+    result = []
+    for first, last in merged:
+        result.extend(ipaddress.summarize_address_range(ipaddress.IPv4Address(first),
+                                                        ipaddress.IPv4Address(last)))
+    return result
+
+
+def _roundrobin(iterators: List[Iterator]) -> Iterator:
+    """Interleave several iterators one item at a time"""
+    active = list(iterators)
+    while active:
+        still_active = []
+        for it in active:
+            try:
+                yield next(it)
+            except StopIteration:
+                continue
+            still_active.append(it)
+        active = still_active
+
+
+class ArpSweeper:
+    """
+    Sweep several networks at once.
+
+    Networks routed through the same interface are first coalesced, so
+    overlapping ranges (a /16 and a /24 inside it, a repeated network) are
+    only swept once. Requests are generated lazily, CHUNK_SIZE at a time,
+    and interleaved across networks and interfaces, so memory stays flat
+    even for a /16. Transmission is paced at `rate` requests per second,
+    and hosts that stay silent are asked again up to `retries` more times.
+    One shared receiver collects all replies and attributes each to the most
+    specific swept network containing it. After each round the sweep waits
+    for stragglers, but stops as soon as no new reply has arrived for
+    `settle` seconds (and never waits longer than `timeout`). On Linux, one
+    AF_PACKET socket per interface sends and receives raw ARP frames (the
+    kernel filters by ethertype); elsewhere Scapy sends and an AsyncSniffer
+    receives.
+    """
+    
+    def __init__(self, timeout: float = 2.0, rate: Optional[int] = DEFAULT_RATE,
+                 retries: int = 1, settle: float = 0.5, chunk_size: int = CHUNK_SIZE):
+        self.timeout = timeout
+        self.rate = rate
+        self.retries = max(0, retries)
+        self.settle = min(settle, timeout)
+        self.chunk_size = max(1, chunk_size)
+        self._replies: Dict[Tuple[str, str], ArpReply] = {}
+        self._answered: Set[str] = set()
+        self._last_reply = 0.0
+        self._lock = threading.Lock()
+        self._plans: List[SweepPlan] = []  # as requested; replies are attributed to these
+        self._send_plans: List[SweepPlan] = []  # coalesced per interface; requests go to these
+        self._on_reply: Optional[Callable[[ArpReply], None]] = None
+    
+    # -- planning -------------------------------------------------------------
+    
+    @staticmethod
+    def plan(network: str) -> Optional[SweepPlan]:
+        """Pick the interface and source addresses used to sweep a network"""
+        from scapy.config import conf
+        from scapy.arch import get_if_hwaddr
+        import scapy.route  # noqa: F401  (populates conf.route)
+        
+        try:
+            net = ipaddress.ip_network(network, strict=False)
+        except ValueError:
+            return None
+        if net.version != 4:
+            return None
+        probe = net.network_address + (1 if net.num_addresses > 1 else 0)
+        iface, src_ip, _ = conf.route.route(str(probe))
+        iface = getattr(iface, 'name', iface)
+        try:
+            src_mac = get_if_hwaddr(iface)
+        except Exception:
+            return None
+        return SweepPlan(net, iface, src_ip, src_mac)
+    
+    def _attribute(self, ip: str, mac: str, iface: Optional[str] = None):
+        """Record a reply against the most specific swept network containing ip"""
+        try:
+            addr = ipaddress.ip_address(ip)
+        except ValueError:
+            return
+        best = None
+        for plan in self._plans:
+            if addr in plan.network and (iface is None or plan.iface == iface):
+                if best is None or plan.network.prefixlen > best.network.prefixlen:
+                    best = plan
+        if best is None:
+            return
+        key = (str(best.network), ip)
+        with self._lock:
+            if key in self._replies:
+                return
+            reply = self._replies[key] = ArpReply(ip=ip, mac=mac, network=str(best.network))
+            self._answered.add(ip)
+            self._last_reply = time.monotonic()
+        if self._on_reply:
+            self._on_reply(reply)
+    
+    @staticmethod
+    def _coalesce_plans(plans: List[SweepPlan]) -> List[SweepPlan]:
+        """Merge the plans sharing an interface into the minimal set of networks"""
+        by_iface: Dict[str, List[SweepPlan]] = {}
+        for plan in plans:
+            by_iface.setdefault(plan.iface, []).append(plan)
+        coalesced = []
+        for iface, group in by_iface.items():
+            first = group[0]
+            for net in coalesce_networks(plan.network for plan in group):
+                coalesced.append(SweepPlan(net, iface, first.src_ip, first.src_mac))
+        return coalesced
+    
+    def _requests(self) -> Iterator[Tuple[SweepPlan, str]]:
+        """(plan, target ip) pairs still unanswered, interleaved across networks"""
+        requests = _roundrobin([plan.requests() for plan in self._send_plans])
+        return ((plan, ip) for plan, ip in requests if ip not in self._answered)
+    
+    # -- pacing and rounds ----------------------------------------------------
+    
+    def _send_round(self, send: Callable[[SweepPlan, str], None]) -> int:
+        """Send one request to every silent host, paced; returns the number sent"""
+        requests = self._requests()
+        started = time.monotonic()
+        sent = 0
+        while True:
+            chunk = list(itertools.islice(requests, self.chunk_size))
+            if not chunk:
+                return sent
+            for plan, target in chunk:
+                try:
+                    send(plan, target)
+                except OSError:
+                    continue
+            sent += len(chunk)
+            if self.rate:
+                ahead = started + sent / self.rate - time.monotonic()
+                if ahead > 0:
+                    time.sleep(ahead)
+    
+    def _wait_for_replies(self):
+        """Wait up to `timeout`, returning early once replies stop arriving"""
+        last_sent = time.monotonic()
+        deadline = last_sent + self.timeout
+        while True:
+            now = time.monotonic()
+            if now >= deadline or now - max(last_sent, self._last_reply) >= self.settle:
+                return
+            time.sleep(min(0.05, deadline - now))
+    
+    def _run_rounds(self, send: Callable[[SweepPlan, str], None]):
+        for _ in range(self.retries + 1):
+            if not self._send_round(send):
+                return
+            self._wait_for_replies()
+    
+    # -- Linux AF_PACKET path -------------------------------------------------
+    
+    @staticmethod
+    def _build_request(plan: SweepPlan, target: str) -> bytes:
+        src_mac = bytes.fromhex(plan.src_mac.replace(':', ''))
+        return ARP_FRAME.pack(BROADCAST, src_mac, ETH_P_ARP, 1, 0x0800, 6, 4, ARP_REQUEST,
+                              src_mac, socket.inet_aton(plan.src_ip),
+                              b'\x00' * 6, socket.inet_aton(target))
+    
+    def _receive_raw(self, sockets: Dict[str, socket.socket], stop: threading.Event):
+        by_fd = {sock.fileno(): (iface, sock) for iface, sock in sockets.items()}
+        while not stop.is_set():
+            readable, _, _ = select.select(list(by_fd), [], [], 0.1)
+            for fd in readable:
+                iface, sock = by_fd[fd]
+                try:
+                    frame = sock.recv(65535)
+                except OSError:
+                    continue
+                if len(frame) < ARP_FRAME.size:
+                    continue
+                fields = ARP_FRAME.unpack_from(frame)
+                if fields[7] != ARP_REPLY:
+                    continue
+                mac = ':'.join(f'{b:02x}' for b in fields[8])
+                self._attribute(socket.inet_ntoa(fields[9]), mac, iface)
+    
+    def _sweep_raw(self):
+        sockets: Dict[str, socket.socket] = {}
+        for plan in self._plans:
+            if plan.iface not in sockets:
+                sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ARP))
+                sock.bind((plan.iface, ETH_P_ARP))
+                sockets[plan.iface] = sock
+        stop = threading.Event()
+        receiver = threading.Thread(target=self._receive_raw, args=(sockets, stop), daemon=True)
+        receiver.start()
+        try:
+            self._run_rounds(lambda plan, target:
+                             sockets[plan.iface].send(self._build_request(plan, target)))
+        finally:
+            stop.set()
+            receiver.join()
+            for sock in sockets.values():
+                sock.close()
+    
+    # -- Portable Scapy path --------------------------------------------------
+    
+    def _sweep_scapy(self):
+        from scapy.layers.l2 import ARP, Ether
+        from scapy.sendrecv import AsyncSniffer
+        from scapy.config import conf
+        
+        def on_packet(packet):
+            if ARP in packet and packet[ARP].op == ARP_REPLY:
+                self._attribute(packet[ARP].psrc, packet[ARP].hwsrc)
+        
+        ifaces = sorted({plan.iface for plan in self._plans})
+        ready = threading.Event()
+        sniffer = AsyncSniffer(iface=ifaces, filter='arp', prn=on_packet, store=False,
+                               started_callback=ready.set)
+        sniffer.start()
+        ready.wait(timeout=2.0)
+        sockets = {iface: conf.L2socket(iface=iface) for iface in ifaces}
+        
+        def send(plan, target):
+            sockets[plan.iface].send(Ether(dst='ff:ff:ff:ff:ff:ff', src=plan.src_mac) /
+                                     ARP(op=ARP_REQUEST, hwsrc=plan.src_mac, psrc=plan.src_ip,
+                                         pdst=target))
+        
+        try:
+            self._run_rounds(send)
+        finally:
+            for sock in sockets.values():
+                sock.close()
+            sniffer.stop()
+    
+    # -------------------------------------------------------------------------
+    
+    def sweep(self, networks: List[str],
+              on_reply: Optional[Callable[[ArpReply], None]] = None) -> List[ArpReply]:
+        """
+        ARP-sweep every network concurrently; blocking.
+
+        on_reply, if given, is called from the receiver thread with each new
+        reply as it arrives, so callers can stream results before the sweep
+        ends. Networks that can't be planned (IPv6, no usable interface) are
+        skipped. Raises PermissionError without raw-socket privileges.
+        """
+        self._on_reply = on_reply
+        self._plans = [plan for plan in (self.plan(n) for n in dict.fromkeys(networks)) if plan]
+        self._send_plans = self._coalesce_plans(self._plans)
+        self._replies = {}
+        self._answered = set()
+        self._last_reply = 0.0
+        if not self._plans:
+            return []
+        if sys.platform.startswith('linux'):
+            self._sweep_raw()
+        else:
+            self._sweep_scapy()
+        return list(self._replies.values())
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+Scan Benchmark - Discovery and port-scan throughput against local targets
+
+Starts stand-in hosts on 127.0.0.0/8 addresses (Linux routes the whole block
+to loopback) in a separate process, each with a few open ports, a few
+blackholed ports (listeners whose accept queue is full, so SYNs are dropped)
+and everything else refused. ARP discovery is replaced by a sweeper that
+replays synthetic replies, so no privileges or network are needed. The
+scanner is then driven end to end (scan_pipeline) and per host
+(scan_device_ports), and ports/s, hosts/s, p50/p99 probe latency, peak RSS
+and peak open fds are reported and compared against a saved baseline. A
+check without a baseline fails; record one on the target machine first.
+
+Usage:
+    python benchmarks/scan_benchmark.py                  # check
+    python benchmarks/scan_benchmark.py --save-baseline  # record baseline
+"""
+
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import socket
+import sys
+import time
+
+import click
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(ROOT, 'benchmarks', 'scan_baseline.json')
+sys.path.insert(0, ROOT)
+
+# Metrics compared against the baseline: name -> True if higher is better
+CHECKED_METRICS = {
+    'ports_per_sec': True,
+    'hosts_per_sec': True,
+    'p99_ms': False,
+}
+
+
+# ============================================================================
+# STAND-IN TARGETS
+# ============================================================================
+
+def target_layout(hosts, port_count, open_per_host, blackholed_per_host, seed):
+    """{ip: (open ports, blackholed ports)} for hosts 127.77.0.2 onwards"""
+    rng = random.Random(seed)
+    layout = {}
+    for i in range(hosts):
+        ip = f"127.77.{(i + 2) // 256}.{(i + 2) % 256}"
+        chosen = rng.sample(range(1, port_count + 1), open_per_host + blackholed_per_host)
+        layout[ip] = (sorted(chosen[:open_per_host]), sorted(chosen[open_per_host:]))
+    return layout
+
+
+def serve_targets(layout, ready, stop):
+    """Child process: accept-and-close on open ports, never accept on blackholed ones"""
+    import selectors
+    
+    selector = selectors.DefaultSelector()
+    keep = []
+    for ip, (open_ports, blackholed) in layout.items():
+        for port in open_ports:
+            sock = socket.socket()
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind((ip, port))
+            sock.listen(1024)
+            sock.setblocking(False)
+            selector.register(sock, selectors.EVENT_READ)
+            keep.append(sock)
+        for port in blackholed:
+            sock = socket.socket()
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind((ip, port))
+            sock.listen(0)
+            keep.append(sock)
+            # Fill the accept queue; further SYNs are silently dropped
+            for _ in range(2):
+                filler = socket.socket()
+                filler.setblocking(False)
+                try:
+                    filler.connect((ip, port))
+                except BlockingIOError:
+                    pass
+                keep.append(filler)
+    ready.set()
+    while not stop.is_set():
+        for key, _ in selector.select(timeout=0.1):
+            try:
+                conn, _ = key.fileobj.accept()
+                conn.close()
+            except OSError:
+                pass
+
+
+# ============================================================================
+# INSTRUMENTATION
+# ============================================================================
+
+def open_fd_count():
+    try:
+        return len(os.listdir('/proc/self/fd'))
+    except OSError:
+        return None
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 if sys.platform.startswith('linux') else peak / (1024 * 1024)
+
+
+class Probe:
+    """Times every scan_port call and samples open fds while a scan runs"""
+    
+    def __init__(self, scanner):
+        self.latencies = []
+        self.peak_fds = open_fd_count()
+        original = scanner.scan_port
+        
+        async def timed(ip, port):
+            started = time.perf_counter()
+            try:
+                return await original(ip, port)
+            finally:
+                self.latencies.append(time.perf_counter() - started)
+        
+        scanner.scan_port = timed
+    
+    async def sample_fds(self):
+        while True:
+            count = open_fd_count()
+            if count is None:
+                return
+            self.peak_fds = max(self.peak_fds, count)
+            await asyncio.sleep(0.01)
+    
+    def percentile(self, q):
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+
+
+def replay_sweeper(layout):
+    """ArpSweeper stand-in replaying one synthetic reply per stand-in host"""
+    from arp_sweep import ArpReply
+    
+    class ReplayArpSweeper:
+        def __init__(self, **kwargs):
+            pass
+        
+        def sweep(self, networks, on_reply=None):
+            replies = []
+            for i, ip in enumerate(layout):
+                reply = ArpReply(ip=ip, mac=f"02:00:00:00:{i // 256:02x}:{i % 256:02x}",
+                                 network=networks[0])
+                replies.append(reply)
+                if on_reply:
+                    on_reply(reply)
+                time.sleep(0.001)  # replies trickle in as on a real LAN
+            return replies
+    
+    return ReplayArpSweeper
+
+
+# ============================================================================
+# SCENARIOS
+# ============================================================================
+
+def make_scanner(ports, timing, seed, probe):
+    import scanner
+    # A fixed probe order keeps runs comparable: with adaptive timeouts, how
+    # long a blackholed port costs depends on whether an RTT was measured yet.
+    # Discovery is pinned to the replayed ARP sweep: 'auto' would fall back to
+    # a ping sweep of the whole /16 without raw-socket access.
+    config = scanner.ScanConfig(network='127.77.0.0/16', ports=ports, timing=timing,
+                                seed=seed, probe=probe, service_detection=False,
+                                resolve_hostnames=False, discovery='arp', db_path=None)
+    return scanner, scanner.NetworkScanner(config)
+
+
+def time_wait_count():
+    """Sockets in TIME_WAIT system-wide (Linux), or None"""
+    count = 0
+    for path in ('/proc/net/tcp', '/proc/net/tcp6'):
+        try:
+            with open(path) as f:
+                count += sum(1 for line in f if line.split()[3:4] == ['06'])
+        except OSError:
+            return None
+    return count
+
+
+def summarize(probe, elapsed, hosts, probes):
+    return {
+        'ports_per_sec': probes / elapsed,
+        'hosts_per_sec': hosts / elapsed,
+        'p50_ms': probe.percentile(0.50),
+        'p99_ms': probe.percentile(0.99),
+        'peak_fds': probe.peak_fds,
+        'seconds': elapsed,
+    }
+
+
+async def run_pipeline(layout, ports, timing, seed, probe_kind):
+    """End to end: replayed discovery -> enrichment -> port scan"""
+    scanner, net = make_scanner(ports, timing, seed, probe_kind)
+    scanner.SCAPY_AVAILABLE = True
+    scanner.ArpSweeper = replay_sweeper(layout)
+    scanner.console.quiet = True
+    probe = Probe(net)
+    sampler = asyncio.ensure_future(probe.sample_fds())
+    started = time.perf_counter()
+    results = await net.scan_pipeline()
+    elapsed = time.perf_counter() - started
+    sampler.cancel()
+    scanner.console.quiet = False
+    found = sum(len(host.open_ports()) for host in results)
+    expected = sum(len(open_ports) for open_ports, _ in layout.values())
+    result = summarize(probe, elapsed, len(results), len(probe.latencies))
+    result['open_found'] = f"{found}/{expected}"
+    return result
+
+
+async def run_single_host(layout, ports, timing, seed, probe_kind):
+    """scan_device_ports on one host"""
+    scanner, net = make_scanner(ports, timing, seed, probe_kind)
+    scanner.console.quiet = True
+    ip = next(iter(layout))
+    device = scanner.Device(ip=ip)
+    probe = Probe(net)
+    sampler = asyncio.ensure_future(probe.sample_fds())
+    started = time.perf_counter()
+    await net.scan_device_ports(device)
+    elapsed = time.perf_counter() - started
+    sampler.cancel()
+    scanner.console.quiet = False
+    result = summarize(probe, elapsed, 1, len(probe.latencies))
+    result['open_found'] = f"{len(device.get_open_ports())}/{len(layout[ip][0])}"
+    return result
+
+
+@click.command()
+@click.option('--hosts', default=32, help='Stand-in hosts on 127.77.0.0/16')
+@click.option('--ports', 'port_count', default=1000, help='Scan ports 1..N on every host')
+@click.option('--open', 'open_per_host', default=5, help='Open ports per host')
+@click.option('--blackholed', default=2, help='Blackholed (dropped) ports per host')
+@click.option('--timing', default='normal', help='Timing profile passed to the scanner')
+@click.option('--seed', default=1, help='Seed for the port layout and probe order')
+@click.option('--probe', 'probes', multiple=True, default=['socket', 'stream'],
+              type=click.Choice(['socket', 'stream']), help='Connect probe(s) to measure')
+@click.option('--loop', 'loops', multiple=True, default=['auto'],
+              type=click.Choice(['auto', 'asyncio', 'uvloop']), help='Event loop(s) to measure')
+@click.option('--tolerance', default=0.25, help='Allowed regression vs baseline (0.25 = 25%)')
+@click.option('--save-baseline', is_flag=True, help='Record current results as the baseline')
+def main(hosts, port_count, open_per_host, blackholed, timing, seed, probes, loops,
+         tolerance, save_baseline):
+    """Measure discovery and port-scan throughput against local stand-in hosts
+
+    Every scenario runs once per --probe and --loop combination; results
+    are keyed scenario/probe/loop, so baselines compare like with like.
+    """
+    from scanner import install_event_loop
+    
+    if not sys.platform.startswith('linux'):
+        click.echo("note: stand-in hosts need the whole 127.0.0.0/8 block on loopback (Linux)")
+    
+    layout = target_layout(hosts, port_count, open_per_host, blackholed, seed)
+    ready, stop = multiprocessing.Event(), multiprocessing.Event()
+    server = multiprocessing.Process(target=serve_targets, args=(layout, ready, stop), daemon=True)
+    server.start()
+    if not ready.wait(timeout=30):
+        click.echo("FAIL  stand-in targets did not start")
+        sys.exit(1)
+    
+    ports = f"1-{port_count}"
+    results = {}
+    try:
+        for loop_name in dict.fromkeys(loops):
+            try:
+                loop_name = install_event_loop(loop_name)
+            except ImportError:
+                click.echo(f"skip  {loop_name} is not installed")
+                continue
+            for probe_kind in probes:
+                for scenario, run in (('pipeline', run_pipeline), ('single_host', run_single_host)):
+                    time_wait = time_wait_count()
+                    result = asyncio.run(run(layout, ports, timing, seed, probe_kind))
+                    if time_wait is not None:
+                        result['time_wait'] = max(0, time_wait_count() - time_wait)
+                    results[f"{scenario}/{probe_kind}/{loop_name}"] = result
+    finally:
+        stop.set()
+        server.join(timeout=5)
+    rss = peak_rss_mb()
+    
+    baseline = {}
+    if os.path.exists(BASELINE_PATH) and not save_baseline:
+        with open(BASELINE_PATH) as f:
+            baseline = json.load(f)
+    # Nothing to compare against must not pass as "no regression"
+    failed = not baseline and not save_baseline
+    for scenario, metrics in results.items():
+        line = (f"{scenario}: {metrics['open_found']} open ports found in {metrics['seconds']:.2f} s, "
+                f"peak fds {metrics['peak_fds']}")
+        if 'time_wait' in metrics:
+            line += f", {metrics['time_wait']} new TIME_WAIT"
+        click.echo(line)
+        reference = baseline.get(scenario, {})
+        for name in ('ports_per_sec', 'hosts_per_sec', 'p50_ms', 'p99_ms'):
+            value = metrics[name]
+            line = f"  {name:<14} {value:10.1f}"
+            if name in CHECKED_METRICS and reference.get(name):
+                ref = reference[name]
+                line += f"   (baseline {ref:.1f})"
+                if CHECKED_METRICS[name]:
+                    regressed = value < ref * (1 - tolerance)
+                else:
+                    regressed = value > ref * (1 + tolerance)
+                line = ("FAIL" if regressed else "ok  ") + line
+                failed = failed or regressed
+            else:
+                line = "    " + line
+            click.echo(line)
+    if rss is not None:
+        click.echo(f"peak RSS {rss:.1f} MB")
+    
+    if save_baseline:
+        with open(BASELINE_PATH, 'w') as f:
+            json.dump(results, f, indent=2)
+        click.echo(f"Baseline saved to {BASELINE_PATH}")
+    elif not baseline:
+        click.echo(f"FAIL  no baseline at {BASELINE_PATH}; record one with --save-baseline")
+    
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Startup Benchmark - Guards CLI start-up time against regressions
+
+Runs each entry point in a fresh interpreter, reports the median wall time,
+and fails if a heavy dependency is imported eagerly again or if start-up got
+slower than the saved baseline. A check without a baseline fails; record
+one on the target machine first.
+
+Usage:
+    python benchmarks/startup_benchmark.py                  # check
+    python benchmarks/startup_benchmark.py --save-baseline  # record baseline
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import click
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(ROOT, 'benchmarks', 'startup_baseline.json')
+
+# Modules that must only be imported inside the code paths that need them
+HEAVY_MODULES = ['scapy', 'nmap', 'netaddr', 'urllib.request', 'aiohttp']
+
+ENTRY_POINTS = {
+    'scanner --help': [sys.executable, 'scanner.py', '--help'],
+    'scanner scan --help': [sys.executable, 'scanner.py', 'scan', '--help'],
+    'multi --help': [sys.executable, 'multi_network_scanner.py', '--help'],
+}
+
+
+def time_command(cmd, runs):
+    """Median wall time of a command in milliseconds"""
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run(cmd, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                       check=True)
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def eager_imports(module):
+    """Heavy modules pulled in by merely importing `module`"""
+    code = (
+        "import sys, json\n"
+        f"import {module}\n"
+        f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))\n"
+    )
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True,
+                            text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+@click.command()
+@click.option('--runs', default=7, help='Runs per entry point (median is reported)')
+@click.option('--tolerance', default=0.25, help='Allowed slowdown vs baseline (0.25 = 25%)')
+@click.option('--save-baseline', is_flag=True, help='Record current timings as the baseline')
+def main(runs, tolerance, save_baseline):
+    """Measure CLI start-up time and check for regressions"""
+    failed = False
+    
+    for module in ('scanner', 'multi_network_scanner'):
+        eager = eager_imports(module)
+        if eager:
+            click.echo(f"FAIL  import {module} eagerly loads: {', '.join(eager)}")
+            failed = True
+        else:
+            click.echo(f"ok    import {module} loads no heavy dependencies")
+    
+    timings = {name: time_command(cmd, runs) for name, cmd in ENTRY_POINTS.items()}
+    
+    baseline = {}
+    if os.path.exists(BASELINE_PATH) and not save_baseline:
+        with open(BASELINE_PATH) as f:
+            baseline = json.load(f)
+    
+    for name, ms in timings.items():
+        line = f"{name:<24} {ms:8.1f} ms"
+        reference = baseline.get(name)
+        if reference:
+            line += f"   (baseline {reference:.1f} ms)"
+            if ms > reference * (1 + tolerance):
+                line = "FAIL  " + line
+                failed = True
+            else:
+                line = "ok    " + line
+        click.echo(line)
+    
+    if save_baseline:
+        with open(BASELINE_PATH, 'w') as f:
+            json.dump(timings, f, indent=2)
+        click.echo(f"Baseline saved to {BASELINE_PATH}")
+    elif not baseline:
+        click.echo(f"FAIL  no baseline at {BASELINE_PATH}; record one with --save-baseline")
+        failed = True
+    
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
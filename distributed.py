@@ -0,0 +1,450 @@
+#!/usr/bin/env python3
+"""
+Distributed Scan - Coordinator/agent protocol for scanning many segments over HTTP
+Used by scanner.py (the coordinate and agent commands)
+"""
+
+import asyncio
+import hmac
+import ipaddress
+import secrets
+import socket
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from arp_sweep import coalesce_networks
+
+API = '/api/v1'
+DEFAULT_PORT = 8765
+UNIT_PREFIX = 24  # networks are split into work units of at most this size
+LEASE_SECONDS = 30.0  # a unit is requeued this long after its agent was last heard from
+MAX_ATTEMPTS = 3  # leases per unit before it is given up as failed
+POLL_INTERVAL = 2.0  # idle agents ask for work this often
+REPORT_INTERVAL = 1.0  # agents post results (and so renew their lease) this often
+PORT_FIELDS = ('open_ports', 'udp_ports')  # device record fields merged as port sets
+
+aiohttp = web = None
+
+
+def load_aiohttp():
+    """Import aiohttp on first use (aiohttp.web alone takes about a third of a second)"""
+    global aiohttp, web
+    if web is None:
+        import aiohttp
+        from aiohttp import web
+
+
+def split_plan(networks: List[str], unit_prefix: int = UNIT_PREFIX) -> List[str]:
+    """Split networks into work units no larger than /unit_prefix (overlaps merged first)"""
+    units = []
+    for net in coalesce_networks(networks):
+        if net.prefixlen >= unit_prefix:
+            units.append(str(net))
+        else:
+            units.extend(str(subnet) for subnet in net.subnets(new_prefix=unit_prefix))
+    return units
+
+
+def merge_record(inventory: Dict[Tuple[str, str], Dict], record: Dict) -> bool:
+    """
+    Merge one device record into an inventory keyed by (MAC, IP).
+
+    Open ports and services are unioned and non-empty fields win, so a
+    partial report from an agent that later died is completed, not
+    replaced, by the rescan. Returns True for a device not seen before.
+    """
+    key = ((record.get('mac') or '').lower(), record['ip'])
+    existing = inventory.get(key)
+    if existing is None:
+        inventory[key] = dict(record)
+        return True
+    for name, value in record.items():
+        if name not in PORT_FIELDS + ('services',) and value not in (None, '', 'Unknown'):
+            existing[name] = value
+    for name in PORT_FIELDS:
+        if name in existing or name in record:
+            existing[name] = sorted(set(existing.get(name) or []) | set(record.get(name) or []))
+    services = {(s.get('protocol', 'tcp'), s['port']): s for s in existing.get('services') or []}
+    for service in record.get('services') or []:
+        key = (service.get('protocol', 'tcp'), service['port'])
+        if key not in services or service.get('version'):
+            services[key] = service
+    existing['services'] = [services[key] for key in sorted(services)]
+    return False
+
+
+# ============================================================================
+# COORDINATOR
+# ============================================================================
+
+@dataclass
+class WorkUnit:
+    """One network to be swept and port-scanned by a single agent"""
+    id: int
+    network: str
+    state: str = 'pending'  # pending, leased, done, failed
+    agent: Optional[str] = None
+    expires: float = 0.0
+    attempts: int = 0
+    devices: int = 0
+
+
+@dataclass
+class AgentInfo:
+    """A registered agent and the networks it can reach"""
+    id: str
+    name: str
+    networks: List[ipaddress.IPv4Network]
+    last_seen: float
+    units_done: int = 0
+    
+    def can_scan(self, network: str) -> bool:
+        net = ipaddress.ip_network(network)
+        return any(net.overlaps(own) for own in self.networks)
+
+
+class Coordinator:
+    """
+    Hands out work units to scan agents and merges what they find.
+
+    Agents pull work: they register with the networks they can reach (ARP
+    only works inside a broadcast domain), then repeatedly lease a unit
+    overlapping one of those networks, post device records while scanning
+    it and mark it complete. Every post renews the agent's lease; a unit
+    whose lease runs out (agent crashed, hung or lost the network) goes
+    back to the queue for the next capable agent, up to max_attempts
+    leases. Late posts for a unit that was reassigned are refused with 409.
+    Records are merged into one inventory with merge_record().
+    """
+    
+    def __init__(self, networks: List[str], ports: str, options: Optional[Dict] = None,
+                 unit_prefix: int = UNIT_PREFIX, lease: float = LEASE_SECONDS,
+                 max_attempts: int = MAX_ATTEMPTS, token: Optional[str] = None,
+                 on_record: Optional[Callable[[Dict], None]] = None,
+                 log: Callable[[str], None] = print):
+        self.units = [WorkUnit(i, net) for i, net in enumerate(split_plan(networks, unit_prefix))]
+        self.ports = ports
+        self.options = options or {}  # scan options forwarded to agents
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.token = token
+        self.on_record = on_record
+        self.log = log
+        self.agents: Dict[str, AgentInfo] = {}
+        self.inventory: Dict[Tuple[str, str], Dict] = {}
+        self._finished: Optional[asyncio.Event] = None
+        load_aiohttp()
+    
+    # -- scheduling -----------------------------------------------------------
+    
+    @property
+    def finished(self) -> bool:
+        return all(unit.state in ('done', 'failed') for unit in self.units)
+    
+    def _check_finished(self):
+        if self._finished is not None and self.finished:
+            self._finished.set()
+    
+    def expire_leases(self, now: Optional[float] = None):
+        """Requeue units whose agent has gone quiet"""
+        now = now or time.monotonic()
+        for unit in self.units:
+            if unit.state != 'leased' or unit.expires > now:
+                continue
+            agent = self.agents.get(unit.agent)
+            name = agent.name if agent else unit.agent
+            unit.agent = None
+            if unit.attempts >= self.max_attempts:
+                unit.state = 'failed'
+                self.log(f"[red]✗ {unit.network}: lease expired on {name}, "
+                         f"giving up after {unit.attempts} attempts[/red]")
+            else:
+                unit.state = 'pending'
+                self.log(f"[yellow]⟳ {unit.network}: lease expired on {name}, requeued[/yellow]")
+        self._check_finished()
+    
+    def _touch(self, agent_id: str) -> AgentInfo:
+        agent = self.agents.get(agent_id)
+        if agent is None:
+            raise web.HTTPNotFound(text='unknown agent, register again')
+        agent.last_seen = now = time.monotonic()
+        for unit in self.units:
+            if unit.state == 'leased' and unit.agent == agent_id:
+                unit.expires = now + self.lease
+        return agent
+    
+    def _leased_unit(self, unit_id: int, agent_id: str) -> WorkUnit:
+        if not 0 <= unit_id < len(self.units):
+            raise web.HTTPNotFound(text='unknown unit')
+        unit = self.units[unit_id]
+        if unit.state != 'leased' or unit.agent != agent_id:
+            raise web.HTTPConflict(text='unit is no longer leased to this agent')
+        return unit
+    
+    def lease_unit(self, agent: AgentInfo) -> Optional[WorkUnit]:
+        """Next pending unit this agent can reach, or None"""
+        for unit in self.units:
+            if unit.state == 'pending' and agent.can_scan(unit.network):
+                unit.state = 'leased'
+                unit.agent = agent.id
+                unit.expires = time.monotonic() + self.lease
+                unit.attempts += 1
+                return unit
+        return None
+    
+    # -- HTTP API -------------------------------------------------------------
+    
+    async def _register(self, request: 'web.Request') -> 'web.Response':
+        body = await request.json()
+        try:
+            networks = [ipaddress.ip_network(n, strict=False) for n in body.get('networks', [])]
+        except ValueError as e:
+            raise web.HTTPBadRequest(text=str(e))
+        agent = AgentInfo(id=secrets.token_hex(16), name=body.get('name') or request.remote,
+                          networks=networks, last_seen=time.monotonic())
+        self.agents[agent.id] = agent
+        self.log(f"[cyan]+ agent {agent.name} registered for "
+                 f"{', '.join(map(str, networks)) or 'no networks'}[/cyan]")
+        return web.json_response({'agent_id': agent.id, 'lease': self.lease,
+                                  'report_interval': REPORT_INTERVAL})
+    
+    async def _lease(self, request: 'web.Request') -> 'web.Response':
+        body = await request.json()
+        agent = self._touch(body.get('agent_id'))
+        if self.finished:
+            return web.Response(status=410, text='scan finished')
+        unit = self.lease_unit(agent)
+        if unit is None:
+            return web.Response(status=204)
+        self.log(f"[cyan]→ {unit.network} leased to {agent.name}[/cyan]")
+        return web.json_response({'unit': {'id': unit.id, 'network': unit.network,
+                                           'ports': self.ports, 'options': self.options}})
+    
+    async def _devices(self, request: 'web.Request') -> 'web.Response':
+        body = await request.json()
+        self._touch(body.get('agent_id'))
+        unit = self._leased_unit(int(request.match_info['unit_id']), body.get('agent_id'))
+        for record in body.get('devices', []):
+            record['network'] = unit.network
+            merge_record(self.inventory, record)
+            unit.devices += 1
+            if self.on_record:
+                self.on_record(record)
+        return web.json_response({'ok': True})
+    
+    async def _complete(self, request: 'web.Request') -> 'web.Response':
+        body = await request.json()
+        agent = self._touch(body.get('agent_id'))
+        unit = self._leased_unit(int(request.match_info['unit_id']), agent.id)
+        unit.agent = None
+        done = sum(1 for u in self.units if u.state == 'done') + 1
+        if body.get('error'):
+            unit.state = 'failed' if unit.attempts >= self.max_attempts else 'pending'
+            self.log(f"[yellow]✗ {unit.network} failed on {agent.name}: {body['error']}[/yellow]")
+        else:
+            unit.state = 'done'
+            agent.units_done += 1
+            self.log(f"[green]✓ {unit.network} done by {agent.name}: {unit.devices} devices "
+                     f"({done}/{len(self.units)} units)[/green]")
+        self._check_finished()
+        return web.json_response({'ok': True})
+    
+    async def _status(self, request: 'web.Request') -> 'web.Response':
+        now = time.monotonic()
+        return web.json_response({
+            'units': [{'id': u.id, 'network': u.network, 'state': u.state, 'attempts': u.attempts,
+                       'devices': u.devices,
+                       'agent': self.agents[u.agent].name if u.agent in self.agents else None}
+                      for u in self.units],
+            'agents': [{'name': a.name, 'networks': [str(n) for n in a.networks],
+                        'units_done': a.units_done, 'idle_seconds': now - a.last_seen}
+                       for a in self.agents.values()],
+            'devices': len(self.inventory),
+        })
+    
+    def app(self) -> 'web.Application':
+        @web.middleware
+        async def authenticate(request, handler):
+            if self.token:
+                expected = f'Bearer {self.token}'
+                if not hmac.compare_digest(request.headers.get('Authorization', ''), expected):
+                    raise web.HTTPUnauthorized(text='bad or missing token')
+            return await handler(request)
+        
+        app = web.Application(middlewares=[authenticate])
+        app.router.add_post(f'{API}/agents', self._register)
+        app.router.add_post(f'{API}/lease', self._lease)
+        app.router.add_post(f'{API}/units/{{unit_id:\\d+}}/devices', self._devices)
+        app.router.add_post(f'{API}/units/{{unit_id:\\d+}}/complete', self._complete)
+        app.router.add_get(f'{API}/status', self._status)
+        return app
+    
+    async def serve(self, host: str = '0.0.0.0', port: int = DEFAULT_PORT,
+                    linger: float = 2 * POLL_INTERVAL) -> List[Dict]:
+        """
+        Serve agents until every unit is done or failed; returns the merged
+        inventory. The API stays up for `linger` seconds afterwards so
+        polling agents learn that the scan is over.
+        """
+        self._finished = asyncio.Event()
+        self._check_finished()
+        runner = web.AppRunner(self.app())
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        self.log(f"[cyan]Coordinator listening on http://{host}:{port}{API}, "
+                 f"{len(self.units)} work units[/cyan]")
+        
+        async def reaper():
+            while True:
+                await asyncio.sleep(1.0)
+                self.expire_leases()
+        
+        reaping = asyncio.ensure_future(reaper())
+        try:
+            await self._finished.wait()
+            await asyncio.sleep(linger)
+        finally:
+            reaping.cancel()
+            await runner.cleanup()
+        return list(self.inventory.values())
+
+
+# ============================================================================
+# AGENT
+# ============================================================================
+
+class LeaseLost(Exception):
+    """The coordinator reassigned the unit being scanned"""
+
+
+class ScanAgent:
+    """
+    Agent mode: lease units from a coordinator, scan them, stream results.
+
+    scan(unit) is an async iterator of device records for one unit (see
+    scanner.py). While it runs, records found so far are posted every
+    report interval, and an empty post still goes out as a heartbeat. A
+    409 means the lease was lost and the unit's scan is abandoned. The
+    agent re-registers when the coordinator forgets it (404) and retries
+    with backoff while the coordinator is unreachable, so one agent can
+    serve successive scans. With exit_when_done it stops once the
+    coordinator reports the scan finished (410).
+    """
+    
+    def __init__(self, url: str, networks: List[str],
+                 scan: Callable[[Dict], AsyncIterator[Dict]], name: Optional[str] = None,
+                 token: Optional[str] = None, poll_interval: float = POLL_INTERVAL,
+                 exit_when_done: bool = False, log: Callable[[str], None] = print):
+        self.url = url.rstrip('/') + API
+        self.networks = networks
+        self.scan = scan
+        self.name = name or socket.gethostname()
+        self.headers = {'Authorization': f'Bearer {token}'} if token else {}
+        self.poll_interval = poll_interval
+        self.exit_when_done = exit_when_done
+        self.log = log
+        self.agent_id: Optional[str] = None
+        self.report_interval = REPORT_INTERVAL
+        load_aiohttp()
+    
+    async def _post(self, session: 'aiohttp.ClientSession', path: str, payload: Dict):
+        async with session.post(self.url + path, json=payload, headers=self.headers) as response:
+            if response.status in (404, 409):
+                raise LeaseLost(await response.text())
+            if response.status in (204, 410):
+                return response.status
+            response.raise_for_status()
+            return await response.json()
+    
+    async def _register(self, session: 'aiohttp.ClientSession'):
+        reply = await self._post(session, '/agents', {'name': self.name, 'networks': self.networks})
+        self.agent_id = reply['agent_id']
+        self.report_interval = min(reply.get('report_interval', REPORT_INTERVAL), reply['lease'] / 3)
+        self.log(f"[green]✓ Registered with {self.url} as {self.name}[/green]")
+    
+    async def run(self):
+        backoff = self.poll_interval
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30)) as session:
+            while True:
+                try:
+                    if self.agent_id is None:
+                        await self._register(session)
+                    reply = await self._post(session, '/lease', {'agent_id': self.agent_id})
+                    backoff = self.poll_interval
+                except LeaseLost:
+                    self.agent_id = None  # coordinator restarted: register again
+                    continue
+                except aiohttp.ClientResponseError as e:
+                    if e.status == 401:
+                        raise PermissionError('coordinator rejected the agent token') from e
+                    reply = None
+                    self.log(f"[yellow]Coordinator error: {e.status} {e.message}[/yellow]")
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    self.agent_id = None
+                    self.log(f"[yellow]Coordinator unreachable ({e.__class__.__name__}), "
+                             f"retrying in {backoff:.0f}s[/yellow]")
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, 30.0)
+                    continue
+                if reply == 410:
+                    if self.exit_when_done:
+                        return
+                    self.agent_id = None  # the next scan will be a new coordinator run
+                    await asyncio.sleep(self.poll_interval)
+                elif isinstance(reply, dict):
+                    await self.run_unit(session, reply['unit'])
+                else:
+                    await asyncio.sleep(self.poll_interval)
+    
+    async def run_unit(self, session: 'aiohttp.ClientSession', unit: Dict):
+        """Scan one leased unit, posting results as they come in"""
+        self.log(f"[cyan]Scanning {unit['network']} (unit {unit['id']})...[/cyan]")
+        base = f"/units/{unit['id']}"
+        pending: List[Dict] = []
+        scan_done = asyncio.Event()
+        
+        async def scan():
+            try:
+                async for record in self.scan(unit):
+                    pending.append(record)
+            finally:
+                scan_done.set()
+        
+        async def report():
+            while True:
+                try:
+                    await asyncio.wait_for(scan_done.wait(), self.report_interval)
+                except asyncio.TimeoutError:
+                    pass
+                batch = pending[:]
+                del pending[:]
+                await self._post(session, base + '/devices', {'agent_id': self.agent_id,
+                                                              'devices': batch})
+                if scan_done.is_set() and not pending:
+                    return
+        
+        scanning = asyncio.ensure_future(scan())
+        reporting = asyncio.ensure_future(report())
+        error = None
+        try:
+            await asyncio.gather(scanning, reporting)
+        except LeaseLost:
+            self.log(f"[yellow]Lost the lease on {unit['network']}, abandoning it[/yellow]")
+            return
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.log(f"[yellow]Could not report {unit['network']}: {e.__class__.__name__}[/yellow]")
+            return
+        except Exception as e:
+            error = f"{e.__class__.__name__}: {e}"
+        finally:
+            scanning.cancel()
+            reporting.cancel()
+        try:
+            await self._post(session, base + '/complete', {'agent_id': self.agent_id, 'error': error})
+        except (LeaseLost, aiohttp.ClientError, asyncio.TimeoutError):
+            return
+        if error:
+            self.log(f"[red]✗ {unit['network']} failed: {error}[/red]")
+        else:
+            self.log(f"[green]✓ {unit['network']} reported[/green]")
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Hostname Resolver - Concurrent reverse-DNS lookups with a persistent cache
+Shared by scanner.py and multi_network_scanner.py
+"""
+
+import asyncio
+import json
+import os
+import socket
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'network_scanner')
+DEFAULT_CACHE_PATH = os.path.join(CACHE_DIR, 'rdns_cache.json')
+
+# h_errno values (netdb.h) that mean the address really has no name
+HOST_NOT_FOUND, NO_DATA = 1, 4
+
+
+class HostnameResolver:
+    """
+    Reverse-DNS resolution stage.
+
+    socket.gethostbyaddr blocks, so each lookup runs on its own daemon thread
+    (daemon so a hung resolver can never delay exit), at most max_concurrent
+    at a time, behind a per-lookup deadline. Hosts without a PTR record cost
+    at most one timeout each and never stall discovery or port scanning.
+    Answers are kept in a TTL'd positive/negative cache that is persisted
+    between runs. Only a resolver that says the name does not exist earns
+    the long negative TTL; timeouts and server failures are retried after
+    retry_ttl.
+    """
+    
+    def __init__(self, max_concurrent: int = 32, timeout: float = 2.0,
+                 positive_ttl: float = 24 * 3600, negative_ttl: float = 3600,
+                 retry_ttl: float = 60, cache_path: Optional[str] = DEFAULT_CACHE_PATH):
+        self.max_concurrent = max(1, max_concurrent)
+        self.timeout = timeout
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.retry_ttl = retry_ttl
+        self.cache_path = cache_path
+        self.cache: Dict[str, list] = {}  # ip -> [hostname or None, expires_at]
+        self._dirty = False
+        self._loop = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._pending: Dict[str, asyncio.Future] = {}
+        self.load()
+    
+    def load(self):
+        """Load the on-disk cache, dropping expired entries"""
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        now = time.time()
+        self.cache = {ip: entry for ip, entry in data.items()
+                      if isinstance(entry, list) and len(entry) == 2 and entry[1] > now}
+    
+    def save(self):
+        """Persist the cache (atomically) if anything changed"""
+        if not self.cache_path or not self._dirty:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            tmp = f"{self.cache_path}.tmp"
+            with open(tmp, 'w') as f:
+                json.dump(self.cache, f)
+            os.replace(tmp, self.cache_path)
+            self._dirty = False
+        except OSError:
+            pass
+    
+    def cached(self, ip: str):
+        """Return (hit, hostname) from the cache"""
+        entry = self.cache.get(ip)
+        if entry and entry[1] > time.time():
+            return True, entry[0]
+        return False, None
+    
+    def _store(self, ip: str, hostname: Optional[str], answered: bool = True):
+        if hostname:
+            ttl = self.positive_ttl
+        else:
+            ttl = self.negative_ttl if answered else self.retry_ttl
+        self.cache[ip] = [hostname, time.time() + ttl]
+        self._dirty = True
+    
+    @staticmethod
+    def _lookup(ip: str) -> Tuple[Optional[str], bool]:
+        """(hostname, answered) - answered is False when the lookup itself failed"""
+        try:
+            return socket.gethostbyaddr(ip)[0], True
+        except socket.herror as e:
+            return None, e.errno in (HOST_NOT_FOUND, NO_DATA)
+        except socket.gaierror as e:
+            return None, e.errno == socket.EAI_NONAME
+        except OSError:
+            return None, False
+    
+    def _bind_loop(self):
+        """(Re)create loop-bound state when used from a new event loop"""
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+            self._pending = {}
+        return loop
+    
+    def _start_lookup(self, loop, ip: str) -> asyncio.Future:
+        future = loop.create_future()
+        
+        def run():
+            answer = self._lookup(ip)
+            try:
+                loop.call_soon_threadsafe(
+                    lambda: future.done() or future.set_result(answer))
+            except RuntimeError:
+                pass  # loop already closed
+        
+        threading.Thread(target=run, name=f'rdns-{ip}', daemon=True).start()
+        return future
+    
+    async def _resolve_uncached(self, ip: str) -> Optional[str]:
+        loop = self._bind_loop()
+        semaphore = self._semaphore
+        await semaphore.acquire()
+        future = self._start_lookup(loop, ip)
+        # The slot is only freed once the thread really finishes, so timed-out
+        # lookups can't pile up behind the concurrency bound.
+        future.add_done_callback(lambda _: semaphore.release())
+        try:
+            hostname, answered = await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            hostname, answered = None, False
+        self._store(ip, hostname, answered)
+        return hostname
+    
+    async def resolve(self, ip: str) -> Optional[str]:
+        """Resolve one address, sharing in-flight lookups for the same IP"""
+        hit, hostname = self.cached(ip)
+        if hit:
+            return hostname
+        self._bind_loop()
+        pending = self._pending.get(ip)
+        if pending is None:
+            pending = self._pending[ip] = asyncio.ensure_future(self._resolve_uncached(ip))
+            pending.add_done_callback(lambda _: self._pending.pop(ip, None))
+        return await pending
+    
+    async def resolve_many(self, ips: Iterable[str]) -> Dict[str, Optional[str]]:
+        """Resolve many addresses concurrently"""
+        ips = list(dict.fromkeys(ips))
+        results = await asyncio.gather(*(self.resolve(ip) for ip in ips))
+        return dict(zip(ips, results))
+    
+    async def resolve_devices(self, devices: Iterable) -> None:
+        """Fill in .hostname on every device, then persist the cache"""
+        devices = list(devices)
+        names = await self.resolve_many(d.ip for d in devices)
+        for device in devices:
+            device.hostname = names.get(device.ip)
+        self.save()
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Local Networks - Interface, address and route discovery read from the kernel
+Used by multi_network_scanner.py
+"""
+
+import ipaddress
+import os
+import socket
+import struct
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Interface flags (/sys/class/net/<name>/flags)
+IFF_UP = 0x1
+IFF_LOOPBACK = 0x8
+IFF_POINTOPOINT = 0x10
+IFF_NOARP = 0x80
+
+# Route flags (/proc/net/route)
+RTF_UP = 0x1
+RTF_GATEWAY = 0x2
+RTF_REJECT = 0x200
+
+# rtnetlink address dump
+NETLINK_ROUTE = 0
+RTM_NEWADDR, RTM_GETADDR = 20, 22
+NLMSG_ERROR, NLMSG_DONE = 2, 3
+NLM_F_REQUEST, NLM_F_DUMP = 0x1, 0x300
+IFA_ADDRESS, IFA_LOCAL = 1, 2
+NLMSG_HEADER = struct.Struct('=IHHII')
+IFADDRMSG = struct.Struct('=BBBBI')
+RTATTR = struct.Struct('=HH')
+
+LINK_LOCAL = ipaddress.ip_network('169.254.0.0/16')
+
+
+@dataclass
+class Interface:
+    """One network interface"""
+    name: str
+    index: int
+    flags: int
+    mac: Optional[str]
+    
+    @property
+    def arp(self) -> bool:
+        """Whether hosts on this link can be found by ARP"""
+        return bool(self.flags & IFF_UP) and not self.flags & (IFF_LOOPBACK | IFF_POINTOPOINT | IFF_NOARP)
+
+
+@dataclass
+class Route:
+    """One IPv4 route of the main table"""
+    network: ipaddress.IPv4Network
+    interface: str
+    gateway: Optional[str]  # None for networks on the link itself
+    metric: int
+
+
+@dataclass
+class LocalNetwork:
+    """A network this host has an address on"""
+    network: str
+    interface: str
+    address: Optional[str]  # None when only known from its route
+
+
+def _align(length: int) -> int:
+    return (length + 3) & ~3
+
+
+def _attributes(data: bytes, offset: int, end: int) -> Iterator[Tuple[int, bytes]]:
+    while offset + RTATTR.size <= end:
+        length, kind = RTATTR.unpack_from(data, offset)
+        if length < RTATTR.size:
+            return
+        yield kind, data[offset + RTATTR.size:offset + length]
+        offset += _align(length)
+
+
+def read_interfaces() -> Dict[str, Interface]:
+    """Interfaces by name, with flags and MAC from /sys/class/net"""
+    interfaces = {}
+    for index, name in socket.if_nameindex():
+        base = os.path.join('/sys/class/net', name)
+        try:
+            with open(os.path.join(base, 'flags')) as f:
+                flags = int(f.read(), 16)
+        except (OSError, ValueError):
+            continue
+        try:
+            with open(os.path.join(base, 'address')) as f:
+                mac = f.read().strip().lower() or None
+        except OSError:
+            mac = None
+        interfaces[name] = Interface(name, index, flags, mac)
+    return interfaces
+
+
+def read_addresses() -> List[Tuple[int, str, int]]:
+    """(interface index, address, prefix length) of every IPv4 address, over rtnetlink"""
+    sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+    try:
+        sock.bind((0, 0))
+        body = IFADDRMSG.pack(socket.AF_INET, 0, 0, 0, 0)
+        sock.send(NLMSG_HEADER.pack(NLMSG_HEADER.size + len(body), RTM_GETADDR,
+                                    NLM_F_REQUEST | NLM_F_DUMP, 1, 0) + body)
+        addresses = []
+        while True:
+            data = sock.recv(65536)
+            offset = 0
+            while offset + NLMSG_HEADER.size <= len(data):
+                length, kind, _, _, _ = NLMSG_HEADER.unpack_from(data, offset)
+                if length < NLMSG_HEADER.size:
+                    return addresses
+                if kind == NLMSG_DONE:
+                    return addresses
+                if kind == NLMSG_ERROR:
+                    raise OSError('rtnetlink address dump failed')
+                if kind == RTM_NEWADDR:
+                    start = offset + NLMSG_HEADER.size
+                    family, prefixlen, _, _, index = IFADDRMSG.unpack_from(data, start)
+                    attrs = dict(_attributes(data, start + IFADDRMSG.size, offset + length))
+                    # IFA_LOCAL is this host's own address; on a point-to-point
+                    # link IFA_ADDRESS is the peer's
+                    raw = attrs.get(IFA_LOCAL) or attrs.get(IFA_ADDRESS)
+                    if family == socket.AF_INET and raw and len(raw) == 4:
+                        addresses.append((index, socket.inet_ntoa(raw), prefixlen))
+                offset += _align(length)
+    finally:
+        sock.close()
+
+
+def read_routes() -> List[Route]:
+    """The main IPv4 routing table from /proc/net/route"""
+    routes = []
+    with open('/proc/net/route') as f:
+        for line in f.read().splitlines()[1:]:
+            # Iface, Destination, Gateway, Flags, RefCnt, Use, Metric, Mask, ...
+            fields = line.split()
+            if len(fields) < 8:
+                continue
+            flags = int(fields[3], 16)
+            if not flags & RTF_UP or flags & RTF_REJECT:
+                continue
+            # Addresses are printed as the raw in-memory word
+            destination, gateway, mask = (socket.inet_ntoa(struct.pack('=I', int(fields[i], 16)))
+                                          for i in (1, 2, 7))
+            routes.append(Route(ipaddress.ip_network(f'{destination}/{mask}', strict=False),
+                                fields[0], gateway if flags & RTF_GATEWAY else None,
+                                int(fields[6])))
+    return routes
+
+
+class LocalLinks:
+    """
+    Snapshot of this host's interfaces, addresses and routes.
+
+    Everything is read straight from the kernel - rtnetlink for the
+    addresses, /proc/net/route and /sys/class/net for the rest - so no
+    ip/ifconfig process is started. Only Linux is supported; check
+    supported() first.
+    """
+    
+    def __init__(self):
+        self.interfaces = read_interfaces()
+        self.routes = read_routes()
+        try:
+            self.addresses = read_addresses()
+        except OSError:
+            self.addresses = []  # the on-link routes still give the networks
+    
+    @staticmethod
+    def supported() -> bool:
+        return hasattr(socket, 'AF_NETLINK') and os.path.exists('/proc/net/route')
+    
+    def networks(self) -> List[LocalNetwork]:
+        """The networks of the links hosts can be ARP-swept on, each with its interface"""
+        by_index = {i.index: i for i in self.interfaces.values()}
+        found: Dict[str, LocalNetwork] = {}
+        for index, address, prefixlen in self.addresses:
+            interface = by_index.get(index)
+            if interface is None or not interface.arp or prefixlen >= 31:
+                continue
+            network = ipaddress.ip_network(f'{address}/{prefixlen}', strict=False)
+            if not network.overlaps(LINK_LOCAL):
+                found.setdefault(str(network), LocalNetwork(str(network), interface.name, address))
+        # On-link routes with no address of ours (or no netlink access)
+        for route in self.routes:
+            interface = self.interfaces.get(route.interface)
+            if (route.gateway is None and interface is not None and interface.arp
+                    and 0 < route.network.prefixlen < 31 and not route.network.overlaps(LINK_LOCAL)):
+                found.setdefault(str(route.network),
+                                 LocalNetwork(str(route.network), route.interface, None))
+        return list(found.values())
+    
+    def interface_for(self, network: str) -> Optional[str]:
+        """The interface an ARP sweep of network goes out on; None if no local link reaches it"""
+        net = ipaddress.ip_network(network, strict=False)
+        if net.version != 4:
+            return None
+        best = None
+        for local in self.networks():
+            link = ipaddress.ip_network(local.network)
+            if link.overlaps(net) and (best is None or link.prefixlen > best[0].prefixlen):
+                best = (link, local.interface)
+        return best[1] if best else None
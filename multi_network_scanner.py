@@ -4,27 +4,29 @@ Multi-Network Scanner - Scans multiple networks including hotspots
 """
 
 import asyncio
+import importlib.util
+import ipaddress
 import socket
 import subprocess
 import re
-from dataclasses import dataclass, field
-from typing import List, Optional
+import time
+from typing import Callable, Dict, List, Optional
 from datetime import datetime
 import json
 
-try:
-    from scapy.all import ARP, Ether, srp, conf
-    conf.verb = 0
-    SCAPY_AVAILABLE = True
-except ImportError:
-    SCAPY_AVAILABLE = False
+# Scapy is only imported when a sweep actually runs (see arp_sweep.py)
+SCAPY_AVAILABLE = importlib.util.find_spec('scapy') is not None
+if not SCAPY_AVAILABLE:
     print("Warning: Scapy not available.")
 
-try:
-    from mac_vendor_lookup import MacLookup
-    MAC_LOOKUP_AVAILABLE = True
-except ImportError:
-    MAC_LOOKUP_AVAILABLE = False
+from arp_sweep import ArpSweeper, DEFAULT_RATE as DEFAULT_ARP_RATE, coalesce_networks
+from hostname_resolver import HostnameResolver
+from local_networks import LocalLinks
+from result_store import HostRecord, ResultStore, parse_mac
+from result_writer import FORMATS as OUTPUT_FORMATS, ResultWriter
+from scan_metrics import ScanMetrics
+from scan_store import DEFAULT_DB_PATH, ScanStore
+from vendor_db import VendorDB
 
 import click
 from rich.console import Console
@@ -34,48 +36,73 @@ from rich import box
 
 console = Console()
 
+# Common hotspot ranges, swept too when a local interface can reach them
+HOTSPOT_NETWORKS = {
+    '192.168.137.0/24': 'Windows Mobile Hotspot',
+    '192.168.0.0/24': None,
+    '192.168.1.0/24': None,
+    '172.20.10.0/24': 'iPhone Hotspot',
+}
 
-@dataclass
-class Device:
-    """Represents a discovered network device"""
-    ip: str
-    mac: Optional[str] = None
-    hostname: Optional[str] = None
-    vendor: Optional[str] = None
-    network: Optional[str] = None  # Which network it was found on
-    ports: List[int] = field(default_factory=list)
-    
-    def to_dict(self):
-        return {
-            'ip': self.ip,
-            'mac': self.mac,
-            'hostname': self.hostname,
-            'vendor': self.vendor,
-            'network': self.network,
-            'open_ports': self.ports
-        }
+
+# Fields of each device record, in order (JSON export and NDJSON output)
+RECORD_FIELDS = ['ip', 'mac', 'hostname', 'vendor', 'network', 'open_ports']
+# Columns of the streaming CSV output, in order
+RESULT_FIELDS = ['network', 'ip', 'mac', 'hostname', 'vendor', 'open_ports']
 
 
 class MultiNetworkScanner:
     """Scan multiple networks including hotspots"""
     
-    def __init__(self):
-        self.all_devices: List[Device] = []
-        self.mac_lookup = None
-        
-        if MAC_LOOKUP_AVAILABLE:
+    def __init__(self, arp_timeout: float = 2.0, arp_rate: Optional[int] = DEFAULT_ARP_RATE,
+                 arp_retries: int = 1, db_path: Optional[str] = DEFAULT_DB_PATH):
+        self.arp_timeout = arp_timeout  # longest wait for replies after each round
+        self.arp_rate = arp_rate  # ARP requests per second across all networks
+        self.arp_retries = arp_retries
+        self.index = ResultStore(RECORD_FIELDS)  # repeat sightings are merged
+        self.vendors = VendorDB()
+        self.resolver = HostnameResolver()
+        self.store = ScanStore(db_path) if db_path else None  # scan history
+        self.metrics = ScanMetrics()
+        self.interfaces: Dict[str, str] = {}  # network -> interface it is swept on
+        self._links: Optional[LocalLinks] = None
+    
+    @property
+    def all_devices(self) -> List[HostRecord]:
+        return list(self.index)
+    
+    def local_links(self) -> Optional[LocalLinks]:
+        """This host's interfaces and routes, read once; None where the kernel can't be read"""
+        if self._links is None and LocalLinks.supported():
             try:
-                self.mac_lookup = MacLookup()
-                self.mac_lookup.update_vendors()
-            except:
-                self.mac_lookup = None
+                self._links = LocalLinks()
+            except OSError as e:
+                console.print(f"[yellow]Could not read interfaces: {e}[/yellow]")
+        return self._links
+    
+    def interface_for(self, network: str) -> Optional[str]:
+        """The interface that reaches network by ARP, or None (also when unknown)"""
+        links = self.local_links()
+        if network not in self.interfaces and links is not None:
+            try:
+                interface = links.interface_for(network)
+            except ValueError:
+                interface = None
+            if interface:
+                self.interfaces[network] = interface
+        return self.interfaces.get(network)
     
     def get_local_networks(self) -> List[str]:
         """Detect all local networks on this computer"""
         networks = []
         
         try:
-            if subprocess.os.name == 'nt':  # Windows
+            links = self.local_links()
+            if links is not None:  # Linux: read from the kernel, no subprocess
+                for local in links.networks():
+                    self.interfaces[local.network] = local.interface
+                    networks.append(local.network)
+            elif subprocess.os.name == 'nt':  # Windows
                 result = subprocess.run(['ipconfig'], capture_output=True, text=True)
                 output = result.stdout
                 
@@ -99,74 +126,101 @@ class MultiNetworkScanner:
                     network = f"{'.'.join(map(str, network_parts))}/{cidr}"
                     if network not in networks and not network.startswith('169.254'):
                         networks.append(network)
-            
+        
         except Exception as e:
             console.print(f"[yellow]Could not auto-detect networks: {e}[/yellow]")
         
         return networks
     
-    def scan_network_arp(self, network: str) -> List[Device]:
-        """Scan a single network using ARP"""
+    def sweep_networks(self, networks: List[str], resolve_hostnames: bool = True) -> List[HostRecord]:
+        """
+        ARP-sweep several networks concurrently
+
+        Requests are interleaved across all networks and interfaces and
+        replies are attributed to the network they belong to, so the sweep
+        takes about as long as a single network does. The devices found
+        are added to the index.
+        """
         if not SCAPY_AVAILABLE:
             console.print("[yellow]Scapy required for scanning[/yellow]")
             return []
         
-        try:
+        for network in networks:
             console.print(f"[cyan]Scanning {network}...[/cyan]")
-            
-            arp = ARP(pdst=network)
-            ether = Ether(dst="ff:ff:ff:ff:ff:ff")
-            packet = ether/arp
-            
-            result = srp(packet, timeout=3, verbose=0)[0]
-            
-            devices = []
-            for sent, received in result:
-                device = Device(ip=received.psrc, mac=received.hwsrc, network=network)
-                
-                # Get vendor
-                if self.mac_lookup:
-                    try:
-                        device.vendor = self.mac_lookup.lookup(device.mac)
-                    except:
-                        device.vendor = "Unknown"
-                
-                # Get hostname
-                try:
-                    device.hostname = socket.gethostbyaddr(device.ip)[0]
-                except:
-                    device.hostname = None
-                
-                devices.append(device)
-            
-            console.print(f"[green]✓ Found {len(devices)} devices on {network}[/green]")
-            return devices
-            
+        
+        try:
+            with self.metrics.stage('arp'):
+                replies = ArpSweeper(timeout=self.arp_timeout, rate=self.arp_rate,
+                                     retries=self.arp_retries).sweep(networks)
         except PermissionError:
-            console.print(f"[red]ERROR: Need administrator privileges for {network}[/red]")
+            console.print("[red]ERROR: Need administrator privileges for ARP scanning[/red]")
             return []
         except Exception as e:
-            console.print(f"[yellow]Could not scan {network}: {e}[/yellow]")
+            console.print(f"[yellow]Could not scan networks: {e}[/yellow]")
             return []
+        
+        # Report devices under the network string the user gave
+        names = {}
+        for network in networks:
+            try:
+                names.setdefault(str(ipaddress.ip_network(network, strict=False)), network)
+            except ValueError:
+                console.print(f"[yellow]Could not scan {network}: invalid network[/yellow]")
+        
+        devices = []
+        with self.metrics.stage('vendor'):
+            for reply in replies:
+                devices.append(self.index.add({
+                    'ip': reply.ip,
+                    'mac': reply.mac,
+                    'network': names.get(reply.network, reply.network),
+                    'vendor': self.vendors.lookup(reply.mac) or "Unknown",
+                }))
+        self.metrics.count('hosts_discovered', len(devices))
+        
+        for normalized, network in names.items():
+            found = sum(1 for d in devices if d.network == network)
+            console.print(f"[green]✓ Found {found} devices on {network}[/green]")
+        
+        if resolve_hostnames:
+            with self.metrics.stage('dns'):
+                asyncio.run(self.resolver.resolve_devices(devices))
+        return devices
     
-    def scan_all_networks(self, additional_networks: List[str] = None):
-        """Scan all detected networks plus any additional ones"""
+    def scan_network_arp(self, network: str, resolve_hostnames: bool = True) -> List[HostRecord]:
+        """Scan a single network using ARP"""
+        return self.sweep_networks([network], resolve_hostnames=resolve_hostnames)
+    
+    def scan_all_networks(self, additional_networks: List[str] = None,
+                          on_result: Optional[Callable[[HostRecord], None]] = None):
+        """
+        Scan all detected networks plus any additional ones
+
+        on_result is called with each device as soon as its hostname lookup
+        finishes, in completion order.
+        """
         # Get local networks
         local_networks = self.get_local_networks()
         
-        # Add common hotspot networks
-        common_hotspot_networks = [
-            '192.168.137.0/24',  # Windows Mobile Hotspot
-            '192.168.0.0/24',
-            '192.168.1.0/24',
-            '172.20.10.0/24',  # iPhone hotspot
-        ]
+        # Add the common hotspot networks, unless no local interface reaches
+        # them (an ARP sweep there would only wait out the timeout)
+        if self.local_links() is not None:
+            hotspot_networks = [n for n in HOTSPOT_NETWORKS if self.interface_for(n)]
+            skipped = len(HOTSPOT_NETWORKS) - len(hotspot_networks)
+        else:
+            hotspot_networks, skipped = list(HOTSPOT_NETWORKS), 0
         
-        # Combine all networks
-        all_networks = list(set(local_networks + common_hotspot_networks))
-        
-        if additional_networks:
-            all_networks.extend(additional_networks)
+        # Combine all networks, dropping repeats (also ones spelled differently)
+        all_networks = []
+        seen = set()
+        for network in local_networks + hotspot_networks + list(additional_networks or []):
+            try:
+                key = str(ipaddress.ip_network(network, strict=False))
+            except ValueError:
+                key = network
+            if key not in seen:
+                seen.add(key)
+                all_networks.append(network)
         
         console.print(Panel.fit(
             f"[bold cyan]Multi-Network Scanner[/bold cyan]\n"
@@ -176,34 +230,72 @@ class MultiNetworkScanner:
         
         console.print("\n[cyan]Networks to scan:[/cyan]")
         for net in all_networks:
-            console.print(f"  • {net}")
+            if self.local_links() is None:
+                console.print(f"  • {net}")
+            elif self.interface_for(net):
+                console.print(f"  • {net} [dim]({self.interface_for(net)})[/dim]")
+            else:
+                console.print(f"  • {net} [yellow](no local interface reaches it)[/yellow]")
+        if skipped:
+            console.print(f"[dim]  ({skipped} hotspot ranges skipped: no local interface reaches them)[/dim]")
+        ranges = coalesce_networks(all_networks)
+        if len(ranges) < len(all_networks):
+            console.print(f"[dim]  (overlapping networks merged into {len(ranges)} sweep ranges)[/dim]")
         console.print()
         
-        # Scan each network
-        for network in all_networks:
-            devices = self.scan_network_arp(network)
-            self.all_devices.extend(devices)
+        # Sweep every network at once
+        started_at = time.time()
+        self.sweep_networks(all_networks, resolve_hostnames=False)
         
+        # Resolve every hostname in one concurrent batch
+        asyncio.run(self.resolve_devices(self.all_devices, on_result))
+        
+        self.record_scan(all_networks, started_at)
         return self.all_devices
     
-    def display_results(self):
-        """Display all discovered devices grouped by network"""
-        if not self.all_devices:
+    async def resolve_devices(self, devices: List[HostRecord],
+                              on_result: Optional[Callable[[HostRecord], None]] = None):
+        """Resolve hostnames concurrently, handing over each device as it completes"""
+        async def resolve(device: HostRecord):
+            started = time.monotonic()
+            device.hostname = await self.resolver.resolve(device.ip)
+            ended = time.monotonic()
+            self.metrics.record_stage('dns', started, ended)
+            self.metrics.observe('dns', ended - started)
+            if on_result:
+                on_result(device)
+        
+        await asyncio.gather(*(resolve(device) for device in devices))
+        self.resolver.save()
+    
+    def record_scan(self, networks: List[str], started_at: float):
+        """Write the devices found to the scan history as a discovery run"""
+        if self.store is None:
+            return
+        with self.metrics.stage('history'):
+            scan_id = self.store.begin_scan(','.join(networks), None, 'discover', started_at)
+            for device in self.all_devices:
+                self.store.record_device(scan_id, device.mac, device.ip, device.hostname,
+                                         device.vendor, device.network)
+            self.store.finish_scan(scan_id)
+    
+    def display_results(self, hosts: Optional[List[HostRecord]] = None):
+        """Display discovered devices (by default all of them) grouped by network"""
+        if not self.index:
             console.print("[yellow]No devices found[/yellow]")
             return
         
-        # Group by network
-        networks = {}
-        for device in self.all_devices:
-            net = device.network or "Unknown"
-            if net not in networks:
-                networks[net] = []
-            networks[net].append(device)
-        
         # Display each network
-        for network, devices in networks.items():
+        networks = self.index.networks()
+        for network in networks:
+            if hosts is None:
+                devices = self.index.select(network=network)
+            else:
+                devices = [device for device in hosts if device.network == network]
+                if not devices:
+                    continue
             table = Table(
-                title=f"Network: {network} ({len(devices)} devices)",
+                title=f"Network: {network or 'Unknown'} ({len(devices)} devices)",
                 box=box.ROUNDED
             )
             table.add_column("IP Address", style="cyan", no_wrap=True)
@@ -222,18 +314,19 @@ class MultiNetworkScanner:
             console.print("\n")
             console.print(table)
         
-        console.print(f"\n[green]Total devices found: {len(self.all_devices)}[/green]")
+        shown = f", {len(hosts)} shown" if hosts is not None and len(hosts) != len(self.index) else ""
+        console.print(f"\n[green]Total devices found: {len(self.index)}{shown}[/green]")
         console.print(f"[green]Networks scanned: {len(networks)}[/green]")
     
-    def export_csv(self, filename: str):
-        """Export all results to CSV"""
+    def export_csv(self, filename: str, hosts: Optional[List[HostRecord]] = None):
+        """Export results (by default all of them) to CSV"""
         import csv
         
-        with open(filename, 'w', newline='') as f:
+        with self.metrics.stage('export'), open(filename, 'w', newline='') as f:
             writer = csv.writer(f)
             writer.writerow(['Network', 'IP', 'MAC', 'Hostname', 'Vendor'])
             
-            for device in self.all_devices:
+            for device in (self.index if hosts is None else hosts):
                 writer.writerow([
                     device.network or '',
                     device.ip,
@@ -244,15 +337,16 @@ class MultiNetworkScanner:
         
         console.print(f"[green]✓ Results exported to {filename}[/green]")
     
-    def export_json(self, filename: str):
-        """Export all results to JSON"""
+    def export_json(self, filename: str, hosts: Optional[List[HostRecord]] = None):
+        """Export results (by default all of them) to JSON"""
+        devices = list(self.index) if hosts is None else hosts
         data = {
             'scan_time': datetime.now().isoformat(),
-            'total_devices': len(self.all_devices),
-            'devices': [device.to_dict() for device in self.all_devices]
+            'total_devices': len(devices),
+            'devices': [device.to_dict() for device in devices]
         }
         
-        with open(filename, 'w') as f:
+        with self.metrics.stage('export'), open(filename, 'w') as f:
             json.dump(data, f, indent=2)
         
         console.print(f"[green]✓ Results exported to {filename}[/green]")
@@ -268,44 +362,86 @@ def cli():
 @click.option('--networks', '-n', multiple=True, help='Additional networks to scan (e.g., 192.168.1.0/24)')
 @click.option('--export-csv', help='Export to CSV file')
 @click.option('--export-json', help='Export to JSON file')
-def scan_all(networks, export_csv, export_json):
+@click.option('--vendor', 'vendor_filter', help='Only show and export devices whose vendor contains this text')
+@click.option('--mac', 'mac_filter', help='Only show and export the device with this MAC address')
+@click.option('--output', help='Stream one record per device to this file (.ndjson, .csv, optionally .gz)')
+@click.option('--output-format', type=click.Choice(OUTPUT_FORMATS), default=None,
+              help='Format for --output (default: from the file extension)')
+@click.option('--arp-timeout', default=2.0,
+              help='Longest wait for ARP replies after each round in seconds')
+@click.option('--arp-rate', type=int, default=DEFAULT_ARP_RATE,
+              help='ARP requests per second across all networks (0 = unpaced)')
+@click.option('--arp-retries', default=1, help='Extra ARP requests to hosts that did not answer')
+@click.option('--history/--no-history', default=True, help='Record the devices in the history database')
+@click.option('--db', 'db_path', default=DEFAULT_DB_PATH, show_default=True,
+              help='History database file')
+@click.option('--metrics-json', help='Write stage timings and lookup latencies to this JSON file')
+def scan_all(networks, export_csv, export_json, vendor_filter, mac_filter, output, output_format,
+             arp_timeout, arp_rate, arp_retries, history, db_path, metrics_json):
     """Scan all local networks and common hotspot ranges
     
     Example: multi_network_scanner.py scan-all
     Example: multi_network_scanner.py scan-all -n 192.168.50.0/24 -n 10.0.0.0/24
     """
-    scanner = MultiNetworkScanner()
+    if mac_filter is not None:
+        try:
+            mac_filter = parse_mac(mac_filter)
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint='--mac')
+    scanner = MultiNetworkScanner(arp_timeout=arp_timeout, arp_rate=arp_rate,
+                                  arp_retries=arp_retries, db_path=db_path if history else None)
     
-    # Scan all networks
+    # Scan all networks, streaming each device to --output as it completes
     additional = list(networks) if networks else None
-    scanner.scan_all_networks(additional_networks=additional)
+    writer = ResultWriter(output, RESULT_FIELDS, output_format) if output else None
+    try:
+        on_result = None
+        if writer:
+            def on_result(device):
+                with scanner.metrics.stage('export'):
+                    writer.write(device.to_dict())
+        scanner.scan_all_networks(additional_networks=additional, on_result=on_result)
+    finally:
+        if writer:
+            writer.close()
+            console.print(f"[green]✓ Streamed {writer.count} results to {output}[/green]")
     
-    # Display results
-    scanner.display_results()
+    # Display results, narrowed to the devices asked for
+    hosts = None
+    if vendor_filter is not None or mac_filter is not None:
+        hosts = scanner.index.select(vendor=vendor_filter, mac=mac_filter)
+    scanner.display_results(hosts)
     
     # Export if requested
     if export_csv:
-        scanner.export_csv(export_csv)
+        scanner.export_csv(export_csv, hosts)
     
     if export_json:
-        scanner.export_json(export_json)
+        scanner.export_json(export_json, hosts)
+    
+    if metrics_json:
+        scanner.metrics.write_json(metrics_json)
+        console.print(f"[green]✓ Scan metrics written to {metrics_json}[/green]")
 
 
 @cli.command()
 def detect_networks():
     """Detect all network interfaces on this computer"""
-    scanner = MultiNetworkScanner()
+    scanner = MultiNetworkScanner(db_path=None)
     networks = scanner.get_local_networks()
     
     console.print("\n[cyan]Detected Networks:[/cyan]")
     for net in networks:
-        console.print(f"  • {net}")
+        interface = scanner.interfaces.get(net)
+        console.print(f"  • {net}" + (f" [dim]({interface})[/dim]" if interface else ""))
     
     console.print("\n[cyan]Common Hotspot Networks:[/cyan]")
-    console.print("  • 192.168.137.0/24 (Windows Mobile Hotspot)")
-    console.print("  • 192.168.0.0/24")
-    console.print("  • 192.168.1.0/24")
-    console.print("  • 172.20.10.0/24 (iPhone Hotspot)")
+    for net, label in HOTSPOT_NETWORKS.items():
+        notes = [label] if label else []
+        if scanner.local_links() is not None:
+            notes.append(f"via {scanner.interface_for(net)}" if scanner.interface_for(net)
+                         else "skipped: no local interface reaches it")
+        console.print(f"  • {net}" + (f" ({', '.join(notes)})" if notes else ""))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+"""
+Passive Monitor - Passive host discovery and continuous inventory upkeep
+Used by scanner.py
+"""
+
+import asyncio
+import ipaddress
+import os
+import re
+import select
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set
+
+ETH_P_ALL = 0x0003
+ETH_P_IP = 0x0800
+ETH_P_ARP = 0x0806
+PACKET_OUTGOING = 4  # sll_pkttype of frames this host sent
+ATF_COM = 0x02  # /proc/net/arp flag of a resolved entry
+DHCP_PORTS = (67, 68)
+MDNS_PORT = 5353
+CAPTURE_FILTER = 'arp or (udp and (port 67 or port 68 or port 5353))'
+
+STALE_AFTER = 300.0  # seconds without traffic from a host before it is verified
+CHECK_INTERVAL = 30.0  # how often the neighbour table is read and stale hosts verified
+MAX_MISSED = 2  # unanswered verifications before a host is reported gone
+PROBE_TIMEOUT = 1.0  # wait for replies to verification probes in seconds
+
+
+@dataclass
+class Sighting:
+    """One piece of evidence that a host is up"""
+    ip: Optional[str]  # None for DHCP clients that have no address yet
+    mac: str
+    source: str  # 'arp', 'dhcp', 'mdns', 'neighbour' or 'probe'
+    hostname: Optional[str] = None
+
+
+@dataclass
+class HostState:
+    """What the monitor knows about one address"""
+    ip: str
+    mac: str
+    first_seen: float
+    last_seen: float
+    sources: Set[str] = field(default_factory=set)
+    hostname: Optional[str] = None
+    verified_at: float = 0.0  # when the last verification probe went out
+    missed: int = 0  # verifications in a row that went unanswered
+    gone: bool = False
+
+
+# ============================================================================
+# PACKET PARSING
+# ============================================================================
+
+def _mac(raw: bytes) -> str:
+    return ':'.join(f'{b:02x}' for b in raw[:6])
+
+
+def _text(value) -> Optional[str]:
+    if isinstance(value, bytes):
+        value = value.decode('utf-8', 'replace')
+    return (value or '').rstrip('.\x00') or None
+
+
+def _parse_dhcp(bootp, dhcp) -> List[Sighting]:
+    options = {option[0]: option[1] for option in dhcp.options
+               if isinstance(option, tuple) and len(option) > 1}
+    kind = options.get('message-type')
+    if kind not in (1, 3, 5, 8):  # DISCOVER, REQUEST, ACK, INFORM (an OFFER isn't taken yet)
+        return []
+    ip = bootp.yiaddr if kind == 5 else bootp.ciaddr  # the ACK confirms the lease
+    if ip == '0.0.0.0':
+        ip = bootp.ciaddr if bootp.ciaddr != '0.0.0.0' else None
+    return [Sighting(ip, _mac(bytes(bootp.chaddr)), 'dhcp', _text(options.get('hostname')))]
+
+
+def _parse_mdns(packet, ip: str, mac: str) -> List[Sighting]:
+    from scapy.layers.dns import DNS
+    
+    dns = packet[DNS]
+    hostname = None
+    for records in (dns.an, dns.ar):
+        for record in records or []:
+            if getattr(record, 'type', None) == 1 and record.rdata == ip:  # A record for itself
+                hostname = _text(record.rrname)
+    return [Sighting(ip, mac, 'mdns', hostname)]
+
+
+def load_layers():
+    """Import the Scapy layers frames are dissected with (importing binds them)"""
+    import scapy.layers.l2  # noqa: F401
+    import scapy.layers.inet  # noqa: F401
+    import scapy.layers.dhcp  # noqa: F401
+    import scapy.layers.dns  # noqa: F401
+
+
+def parse_packet(packet) -> List[Sighting]:
+    """Hosts a captured frame shows to be up; only ARP, DHCP and mDNS are looked at"""
+    from scapy.layers.l2 import ARP, Ether
+    from scapy.layers.inet import IP, UDP
+    from scapy.layers.dhcp import BOOTP, DHCP
+    from scapy.layers.dns import DNS
+    
+    if ARP in packet:
+        arp = packet[ARP]
+        if arp.psrc == '0.0.0.0':  # address probe (RFC 5227): the sender has no address yet
+            return []
+        return [Sighting(arp.psrc, arp.hwsrc.lower(), 'arp')]
+    if DHCP in packet:
+        return _parse_dhcp(packet[BOOTP], packet[DHCP])
+    if DNS in packet and UDP in packet and packet[UDP].sport == MDNS_PORT and IP in packet:
+        if packet[IP].src == '0.0.0.0':
+            return []
+        return _parse_mdns(packet, packet[IP].src, packet[Ether].src.lower())
+    return []
+
+
+def interesting_frame(frame: bytes) -> bool:
+    """Cheap check on raw Ethernet bytes for ARP, DHCP and mDNS, before dissecting"""
+    if len(frame) < 42:
+        return False
+    ethertype = struct.unpack_from('!H', frame, 12)[0]
+    if ethertype == ETH_P_ARP:
+        return True
+    if ethertype != ETH_P_IP or frame[23] != socket.IPPROTO_UDP:
+        return False
+    udp = 14 + (frame[14] & 0x0f) * 4
+    if len(frame) < udp + 4:
+        return False
+    sport, dport = struct.unpack_from('!HH', frame, udp)
+    return sport in DHCP_PORTS or dport in DHCP_PORTS or sport == MDNS_PORT
+
+
+def read_neighbours() -> List[Sighting]:
+    """Resolved entries of the kernel's ARP cache (/proc/net/arp, or `arp -a`)"""
+    sightings = []
+    if os.path.exists('/proc/net/arp'):
+        with open('/proc/net/arp') as f:
+            for line in f.read().splitlines()[1:]:
+                # IP address, HW type, Flags, HW address, Mask, Device
+                fields = line.split()
+                if len(fields) >= 6 and int(fields[2], 16) & ATF_COM:
+                    sightings.append(Sighting(fields[0], fields[3].lower(), 'neighbour'))
+    else:
+        try:
+            output = subprocess.run(['arp', '-a'], capture_output=True, text=True).stdout
+        except OSError:
+            return []
+        pattern = r'(\d+\.\d+\.\d+\.\d+)\D+?([0-9a-fA-F]{1,2}(?:[-:][0-9a-fA-F]{1,2}){5})'
+        for ip, mac in re.findall(pattern, output):
+            mac = ':'.join(part.zfill(2) for part in re.split('[-:]', mac.lower()))
+            sightings.append(Sighting(ip, mac, 'neighbour'))
+    return [s for s in sightings
+            if s.mac != '00:00:00:00:00:00' and s.mac != 'ff:ff:ff:ff:ff:ff'
+            and not s.mac.startswith('01:00:5e')]
+
+
+# ============================================================================
+# DEVICE TABLE
+# ============================================================================
+
+class DeviceTable:
+    """
+    Live table of the hosts seen on some networks, keyed by IP.
+
+    observe() returns the event a sighting causes: 'new' for an address
+    never seen, 'moved' when it answers from another MAC, 'returned' for a
+    host reported gone, None otherwise. Neighbour-table entries can add
+    hosts but don't refresh them, since the kernel keeps stale entries
+    long after a host has left. Hostnames from DHCP requests made before
+    the client has an address are kept until its address shows up.
+    """
+    
+    def __init__(self, networks: Iterable[str] = ()):
+        self.networks = [ipaddress.ip_network(n, strict=False) for n in networks]
+        self.hosts: Dict[str, HostState] = {}
+        self._hostnames: Dict[str, str] = {}  # mac -> hostname learned before its address
+    
+    def __len__(self):
+        return len(self.hosts)
+    
+    def __iter__(self) -> Iterator[HostState]:
+        return iter(self.hosts.values())
+    
+    def covers(self, ip: str) -> bool:
+        try:
+            addr = ipaddress.ip_address(ip)
+        except ValueError:
+            return False
+        if not self.networks:
+            return addr.version == 4 and not (addr.is_multicast or addr.is_unspecified)
+        return any(addr in network for network in self.networks)
+    
+    def observe(self, sighting: Sighting, now: float) -> Optional[str]:
+        if sighting.ip is None:
+            if sighting.hostname:
+                self._hostnames[sighting.mac] = sighting.hostname
+                for host in self.hosts.values():
+                    if host.mac == sighting.mac:
+                        host.hostname = sighting.hostname
+            return None
+        if not self.covers(sighting.ip):
+            return None
+        hostname = sighting.hostname or self._hostnames.pop(sighting.mac, None)
+        host = self.hosts.get(sighting.ip)
+        if host is None:
+            self.hosts[sighting.ip] = HostState(sighting.ip, sighting.mac, now, now,
+                                                {sighting.source}, hostname)
+            return 'new'
+        host.sources.add(sighting.source)
+        if hostname:
+            host.hostname = hostname
+        if sighting.source == 'neighbour' and host.mac == sighting.mac:
+            return None
+        event = None
+        if host.mac != sighting.mac:
+            host.mac, host.first_seen = sighting.mac, now
+            event = 'moved'
+        elif host.gone:
+            event = 'returned'
+        host.last_seen = max(host.last_seen, now)
+        host.missed, host.gone = 0, False
+        return event
+    
+    def due(self, now: float, stale_after: float) -> List[HostState]:
+        """Hosts quiet for stale_after seconds and not verified since then"""
+        return [host for host in self.hosts.values()
+                if not host.gone and now - host.last_seen >= stale_after
+                and now - host.verified_at >= stale_after]
+    
+    def missed(self, host: HostState, max_missed: int) -> bool:
+        """Count an unanswered verification; True once the host is given up as gone"""
+        host.missed += 1
+        if host.missed >= max_missed and not host.gone:
+            host.gone = True
+            return True
+        return False
+
+
+# ============================================================================
+# MONITOR
+# ============================================================================
+
+def verify_hosts(hosts: List[HostState], timeout: float = PROBE_TIMEOUT) -> Set[str]:
+    """
+    Unicast an ARP request to each host's known MAC; returns the IPs that
+    answered. Unlike a sweep this never broadcasts, so only the hosts
+    asked see it. Blocking; raises PermissionError without privileges.
+    """
+    from scapy.config import conf
+    from scapy.layers.l2 import ARP, Ether
+    from scapy.sendrecv import srp
+    import scapy.route  # noqa: F401  (populates conf.route)
+    
+    by_iface: Dict[str, List] = {}
+    for host in hosts:
+        iface = conf.route.route(host.ip)[0]
+        iface = getattr(iface, 'name', iface)
+        by_iface.setdefault(iface, []).append(Ether(dst=host.mac) / ARP(pdst=host.ip))
+    answered = set()
+    for iface, packets in by_iface.items():
+        replies, _ = srp(packets, iface=iface, timeout=timeout, verbose=False)
+        answered.update(reply[ARP].psrc for _, reply in replies)
+    return answered
+
+
+class PassiveMonitor:
+    """
+    Keep a DeviceTable of some networks current, mostly by listening.
+
+    Hosts are learned from the ARP, DHCP and mDNS traffic the interfaces
+    see and from the kernel's neighbour table, so a new device is reported
+    (through on_event) as soon as it talks instead of at the next sweep.
+    Every check_interval seconds the neighbour table is read again and
+    hosts silent for stale_after seconds are verified with a unicast ARP
+    request to their known MAC; after max_missed unanswered verifications
+    a host is reported gone. Nothing is ever broadcast.
+
+    On Linux one AF_PACKET socket per interface captures frames and only
+    ARP, DHCP and mDNS ones are dissected; elsewhere a Scapy AsyncSniffer
+    with a BPF filter does. replay() feeds a pcap file through the same
+    logic on the capture's own clock, with verifications going unanswered.
+    """
+    
+    def __init__(self, networks: List[str], on_event: Callable[[str, HostState], None],
+                 stale_after: float = STALE_AFTER, check_interval: float = CHECK_INTERVAL,
+                 max_missed: int = MAX_MISSED, probe_timeout: float = PROBE_TIMEOUT,
+                 neighbours: bool = True):
+        self.networks = networks
+        self.table = DeviceTable(networks)
+        self.on_event = on_event
+        self.stale_after = stale_after
+        self.check_interval = check_interval
+        self.max_missed = max(1, max_missed)
+        self.probe_timeout = probe_timeout
+        self.neighbours = neighbours
+        self.packets = 0  # frames dissected
+    
+    # -- sightings ------------------------------------------------------------
+    
+    def handle(self, sightings: List[Sighting], now: Optional[float] = None):
+        now = time.time() if now is None else now
+        for sighting in sightings:
+            event = self.table.observe(sighting, now)
+            if event:
+                self.on_event(event, self.table.hosts[sighting.ip])
+    
+    def handle_packet(self, packet, now: Optional[float] = None):
+        self.packets += 1
+        try:
+            sightings = parse_packet(packet)
+        except Exception:  # malformed frame
+            return
+        self.handle(sightings, now)
+    
+    # -- checks ---------------------------------------------------------------
+    
+    def stale(self, now: float) -> List[HostState]:
+        """Read the neighbour table, then pick the hosts to verify"""
+        if self.neighbours:
+            self.handle(read_neighbours(), now)
+        due = self.table.due(now, self.stale_after)
+        for host in due:
+            host.verified_at = now
+        return due
+    
+    def verified(self, hosts: List[HostState], answered: Set[str], now: float):
+        """Apply the outcome of verifying hosts; answered holds the IPs that replied"""
+        for host in hosts:
+            if host.ip in answered:
+                self.handle([Sighting(host.ip, host.mac, 'probe')], now)
+            elif host.last_seen < host.verified_at and self.table.missed(host, self.max_missed):
+                self.on_event('gone', host)
+    
+    # -- live capture ---------------------------------------------------------
+    
+    def _ifaces(self) -> List[str]:
+        from arp_sweep import ArpSweeper
+        
+        plans = (ArpSweeper.plan(network) for network in self.networks)
+        return sorted({plan.iface for plan in plans if plan})
+    
+    def _capture_raw(self, ifaces: List[str], deliver: Callable, stop: threading.Event):
+        from scapy.layers.l2 import Ether
+        
+        sockets = []
+        try:
+            for iface in ifaces:
+                sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ALL))
+                sock.bind((iface, ETH_P_ALL))
+                sockets.append(sock)
+            by_fd = {sock.fileno(): sock for sock in sockets}
+            while not stop.is_set():
+                readable, _, _ = select.select(list(by_fd), [], [], 0.2)
+                for fd in readable:
+                    try:
+                        frame, address = by_fd[fd].recvfrom(65535)
+                    except OSError:
+                        continue
+                    if address[2] != PACKET_OUTGOING and interesting_frame(frame):
+                        deliver(Ether(frame))
+        finally:
+            for sock in sockets:
+                sock.close()
+    
+    def _capture_scapy(self, ifaces: List[str], deliver: Callable, stop: threading.Event):
+        from scapy.sendrecv import AsyncSniffer
+        
+        sniffer = AsyncSniffer(iface=ifaces or None, filter=CAPTURE_FILTER, prn=deliver,
+                               store=False)
+        sniffer.start()
+        try:
+            stop.wait()
+        finally:
+            sniffer.stop()
+    
+    async def run(self, stop: Optional[asyncio.Event] = None):
+        """
+        Capture and check until stop is set (or forever). Raises
+        PermissionError without raw-socket privileges.
+        """
+        load_layers()
+        loop = asyncio.get_running_loop()
+        ifaces = self._ifaces()
+        halt = threading.Event()
+        
+        def deliver(packet):
+            loop.call_soon_threadsafe(self.handle_packet, packet)
+        
+        capture = self._capture_raw if sys.platform.startswith('linux') else self._capture_scapy
+        capturing = loop.run_in_executor(None, capture, ifaces, deliver, halt)
+        stop = stop or asyncio.Event()
+        
+        try:
+            while not stop.is_set() and not capturing.done():
+                due = self.stale(time.time())
+                if due:
+                    answered = await loop.run_in_executor(None, verify_hosts, due,
+                                                          self.probe_timeout)
+                    self.verified(due, answered, time.time())
+                try:
+                    await asyncio.wait_for(stop.wait(), self.check_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            halt.set()
+            await capturing  # re-raise capture errors
+    
+    # -- replay ---------------------------------------------------------------
+    
+    def replay(self, path: str):
+        """Feed a pcap file through the monitor on its own timestamps; blocking"""
+        from scapy.utils import PcapReader
+        
+        load_layers()
+        
+        next_check = None
+        now = None
+        with PcapReader(path) as reader:
+            for packet in reader:
+                now = float(packet.time)
+                if next_check is None:
+                    next_check = now + self.check_interval
+                while now >= next_check:
+                    self.verified(self.stale(next_check), set(), next_check)
+                    next_check += self.check_interval
+                self.handle_packet(packet, now)
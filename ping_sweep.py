@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Ping Sweep - Unprivileged host discovery with TCP and ICMP pings
+Used by scanner.py
+"""
+
+import asyncio
+import errno
+import ipaddress
+import itertools
+import socket
+import struct
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from passive_monitor import read_neighbours
+
+PING_PORTS = (80, 443, 22, 445)  # TCP "ping" ports; a refused connect counts as alive
+TIMEOUT = 1.0  # longest wait for any answer from a host
+MAX_HOSTS = 256  # hosts probed at once
+NEIGHBOUR_REFRESH = 0.1  # shortest gap between reads of the neighbour table
+
+ICMP_ECHO_REQUEST, ICMP_ECHO_REPLY = 8, 0
+ICMP_PAYLOAD = b'network-scanner-ping'
+LINGER_RESET = struct.pack('ii', 1, 0)
+# The host itself is known not to be there (failed ARP, no route): stop probing it
+UNREACHABLE_ERRNOS = {errno.EHOSTUNREACH, errno.ENETUNREACH,
+                      getattr(errno, 'EHOSTDOWN', errno.EHOSTUNREACH)}
+
+
+@dataclass
+class PingReply:
+    """One host that answered a ping"""
+    ip: str
+    mac: Optional[str]  # from the neighbour table; None for hosts behind a router
+    method: str  # 'icmp' or 'tcp/<port>'
+    rtt: float
+
+
+class HostUnreachable(Exception):
+    """A probe showed the host is not there"""
+
+
+def _checksum(data: bytes) -> int:
+    if len(data) % 2:
+        data += b'\x00'
+    total = sum(struct.unpack(f'!{len(data) // 2}H', data))
+    total = (total >> 16) + (total & 0xffff)
+    total += total >> 16
+    return ~total & 0xffff
+
+
+class IcmpPinger:
+    """
+    Echo requests over one unprivileged ICMP datagram socket.
+
+    Linux allows these to the groups in net.ipv4.ping_group_range and
+    macOS to everyone; the kernel picks the echo identifier and only
+    delivers replies to it. Replies are matched to waiting pings by source
+    address and sequence number.
+    """
+    
+    def __init__(self):
+        self._sock: Optional[socket.socket] = None
+        self._loop = None
+        self._waiters: Dict[Tuple[str, int], asyncio.Future] = {}
+        self._sequence = itertools.count(1)
+    
+    @staticmethod
+    def available() -> bool:
+        try:
+            socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP).close()
+        except OSError:
+            return False
+        return True
+    
+    def _open(self):
+        loop = asyncio.get_running_loop()
+        if self._sock is not None and self._loop is loop:
+            return
+        self.close()
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+        sock.setblocking(False)
+        loop.add_reader(sock.fileno(), self._on_readable)
+        self._sock, self._loop = sock, loop
+    
+    def close(self):
+        if self._sock is None:
+            return
+        try:
+            self._loop.remove_reader(self._sock.fileno())
+        except (RuntimeError, ValueError):
+            pass  # loop already closed
+        self._sock.close()
+        self._sock = self._loop = None
+        self._waiters.clear()
+    
+    def _on_readable(self):
+        while True:
+            try:
+                data, (ip, _) = self._sock.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                continue  # a queued error (unreachable) for an earlier echo
+            if data and data[0] >> 4 == 4:  # macOS includes the IP header
+                data = data[(data[0] & 0x0f) * 4:]
+            if len(data) < 8 or data[0] != ICMP_ECHO_REPLY:
+                continue
+            sequence = struct.unpack_from('!H', data, 6)[0]
+            waiter = self._waiters.pop((ip, sequence), None)
+            if waiter is not None and not waiter.done():
+                waiter.set_result(True)
+    
+    async def ping(self, ip: str) -> bool:
+        """Send one echo request and wait for its reply (cancel to give up)"""
+        self._open()
+        sequence = next(self._sequence) & 0xffff
+        header = struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, 0, 0, sequence)
+        packet = header[:2] + struct.pack('!H', _checksum(header + ICMP_PAYLOAD)) + header[4:]
+        waiter = self._loop.create_future()
+        self._waiters[ip, sequence] = waiter
+        try:
+            try:
+                self._sock.sendto(packet + ICMP_PAYLOAD, (ip, 0))
+            except OSError as e:
+                if e.errno in UNREACHABLE_ERRNOS:
+                    raise HostUnreachable(ip)
+                return False
+            return await waiter
+        finally:
+            self._waiters.pop((ip, sequence), None)
+
+
+class PingSweeper:
+    """
+    Find live hosts without raw sockets.
+
+    Every host gets a TCP connect to each of `ports` - an accepted or a
+    refused connection both prove it is up - and, where the kernel allows
+    unprivileged ICMP datagram sockets, an echo request, all at once. The
+    first answer settles the host and cancels its other probes, and so
+    does an error showing it is unreachable (on a local network, a failed
+    ARP resolution); silent hosts are given up after `timeout`. At most
+    `max_hosts` hosts are probed at a time, drawn lazily from the networks,
+    so a /16 costs no more memory than a /24. This host's own addresses
+    are left out, as an ARP sweep would. The connects leave the
+    kernel's neighbour table holding each local host's MAC, which is
+    where replies get theirs from.
+    """
+    
+    def __init__(self, ports: Sequence[int] = PING_PORTS, timeout: float = TIMEOUT,
+                 max_hosts: int = MAX_HOSTS, icmp: Optional[bool] = None):
+        self.ports = list(ports)
+        self.timeout = timeout
+        self.max_hosts = max(1, max_hosts)
+        self.icmp = IcmpPinger() if (IcmpPinger.available() if icmp is None else icmp) else None
+        self._neighbours: Dict[str, str] = {}
+        self._neighbours_read = 0.0
+    
+    @staticmethod
+    def is_local(ip: str) -> bool:
+        """Whether ip is one of this host's own addresses (routing picks it as its own source)"""
+        sock = socket.socket(socket.AF_INET6 if ':' in ip else socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            sock.connect((ip, 9))  # no packet is sent
+            return sock.getsockname()[0] == ip
+        except OSError:
+            return False
+        finally:
+            sock.close()
+    
+    @staticmethod
+    def hosts(network: str) -> Iterator[str]:
+        net = ipaddress.ip_network(network, strict=False)
+        if net.num_addresses == 1:
+            return iter([str(net.network_address)])
+        return (str(ip) for ip in net.hosts())
+    
+    async def _tcp(self, ip: str, port: int) -> Optional[str]:
+        loop = asyncio.get_running_loop()
+        sock = socket.socket(socket.AF_INET6 if ':' in ip else socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            sock.setblocking(False)
+            await loop.sock_connect(sock, (ip, port))
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, LINGER_RESET)
+        except ConnectionRefusedError:
+            pass
+        except OSError as e:
+            if e.errno in UNREACHABLE_ERRNOS:
+                raise HostUnreachable(ip)
+            return None
+        finally:
+            sock.close()
+        return f'tcp/{port}'
+    
+    async def _icmp(self, ip: str) -> Optional[str]:
+        return 'icmp' if await self.icmp.ping(ip) else None
+    
+    async def probe(self, ip: str) -> Optional[PingReply]:
+        """Ping one host every way at once; None if it stays silent or is unreachable"""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        probes = [asyncio.ensure_future(self._tcp(ip, port)) for port in self.ports]
+        if self.icmp is not None:
+            probes.append(asyncio.ensure_future(self._icmp(ip)))
+        try:
+            for answer in asyncio.as_completed(probes, timeout=self.timeout):
+                try:
+                    method = await answer
+                except (asyncio.TimeoutError, HostUnreachable):
+                    return None
+                if method:
+                    return PingReply(ip, self.mac(ip), method, loop.time() - started)
+            return None
+        finally:
+            for probe in probes:
+                probe.cancel()
+            await asyncio.gather(*probes, return_exceptions=True)
+    
+    def mac(self, ip: str) -> Optional[str]:
+        """The host's MAC from the neighbour table, re-read when it lacks the host"""
+        if ip not in self._neighbours and time.monotonic() - self._neighbours_read >= NEIGHBOUR_REFRESH:
+            self._neighbours = {s.ip: s.mac for s in read_neighbours()}
+            self._neighbours_read = time.monotonic()
+        return self._neighbours.get(ip)
+    
+    async def sweep(self, networks: List[str],
+                    on_reply: Optional[Callable[[PingReply], None]] = None) -> List[PingReply]:
+        """Ping every host of the networks; on_reply gets each live host as it answers"""
+        hosts = (ip for ip in itertools.chain.from_iterable(self.hosts(n) for n in dict.fromkeys(networks))
+                 if not self.is_local(ip))  # never probe ourselves
+        replies: List[PingReply] = []
+        
+        async def worker():
+            for ip in hosts:  # shared iterator: each host is drawn by one worker
+                reply = await self.probe(ip)
+                if reply is not None:
+                    replies.append(reply)
+                    if on_reply:
+                        on_reply(reply)
+        
+        try:
+            await asyncio.gather(*(worker() for _ in range(self.max_hosts)))
+        finally:
+            if self.icmp is not None:
+                self.icmp.close()
+        return replies
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+Result Store - Compact columnar storage and queries for scan results
+Shared by scanner.py and multi_network_scanner.py
+"""
+
+import ipaddress
+import string
+import time
+from array import array
+from datetime import datetime
+from itertools import compress
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+PROTOCOLS = ('tcp', 'udp')  # index << 16 | port is a port's key
+IPV6 = 1 << 63  # marks an IP column entry as an index into the IPv6 side table
+
+# Record fields of a port scan, in order (NetworkScanner, Device.to_dict())
+SCAN_FIELDS = ['ip', 'mac', 'hostname', 'vendor', 'device_type', 'open_ports', 'udp_ports',
+               'services', 'scan_time']
+
+
+def _port_key(port: int, protocol: str = 'tcp') -> int:
+    return PROTOCOLS.index(protocol) << 16 | port
+
+
+def _pack_mac(mac: Optional[str]) -> int:
+    return int(mac.replace(':', '').replace('-', '').replace('.', ''), 16) if mac else 0
+
+
+def _unpack_mac(value: int) -> Optional[str]:
+    if not value:
+        return None
+    return ':'.join(f'{b:02x}' for b in value.to_bytes(6, 'big'))
+
+
+def parse_mac(mac: str) -> str:
+    """Normalize a MAC address (aa:bb:.., AA-BB-.. or aabb.ccdd.eeff) to lower-case colon form"""
+    digits = mac.replace(':', '').replace('-', '').replace('.', '')
+    if len(digits) != 12 or not all(c in string.hexdigits for c in digits):
+        raise ValueError(f"{mac!r} is not a MAC address")
+    return ':'.join(digits[i:i + 2] for i in range(0, 12, 2)).lower()
+
+
+def _prefixlen(network: Optional[str]) -> int:
+    try:
+        return ipaddress.ip_network(network, strict=False).prefixlen
+    except (TypeError, ValueError):
+        return -1
+
+
+class HostRecord:
+    """One host of a ResultStore, read from (and written through to) its columns"""
+    
+    __slots__ = ('_store', 'row')
+    
+    def __init__(self, store: 'ResultStore', row: int):
+        self._store = store
+        self.row = row
+    
+    def __repr__(self):
+        return f'HostRecord({self.ip!r}, mac={self.mac!r})'
+    
+    @property
+    def ip(self) -> str:
+        return self._store._unpack_ip(self._store._ips[self.row])
+    
+    @property
+    def mac(self) -> Optional[str]:
+        return _unpack_mac(self._store._macs[self.row])
+    
+    @property
+    def hostname(self) -> Optional[str]:
+        return self._store._strings[self._store._hostnames[self.row]]
+    
+    @hostname.setter
+    def hostname(self, value: Optional[str]):
+        self._store._hostnames[self.row] = self._store._intern(value)
+    
+    @property
+    def vendor(self) -> Optional[str]:
+        return self._store._strings[self._store._vendors[self.row]]
+    
+    @vendor.setter
+    def vendor(self, value: Optional[str]):
+        self._store._vendors[self.row] = self._store._intern(value)
+    
+    @property
+    def device_type(self) -> Optional[str]:
+        return self._store._strings[self._store._device_types[self.row]]
+    
+    @property
+    def network(self) -> Optional[str]:
+        return self._store._strings[self._store._networks[self.row]]
+    
+    @property
+    def scan_time(self) -> datetime:
+        return datetime.fromtimestamp(self._store._scan_times[self.row])
+    
+    def open_ports(self, protocol: str = 'tcp') -> List[int]:
+        """Open port numbers for a protocol, ascending"""
+        keys = self._store._ports[self.row]
+        if keys is None:
+            return []
+        index = PROTOCOLS.index(protocol)
+        return [key & 0xffff for key in keys if key >> 16 == index]
+    
+    def services(self, protocol: Optional[str] = None) -> List[Tuple[str, int, Optional[str], Optional[str]]]:
+        """(protocol, port, service, version) of every open port, TCP first"""
+        store = self._store
+        keys, names = store._ports[self.row], store._services[self.row]
+        if keys is None:
+            return []
+        services = []
+        for i, key in enumerate(keys):
+            proto = PROTOCOLS[key >> 16]
+            if protocol is not None and proto != protocol:
+                continue
+            service = version = None
+            if names is not None:
+                service, version = store._strings[names[2 * i]], store._strings[names[2 * i + 1]]
+            services.append((proto, key & 0xffff, service, version))
+        return services
+    
+    def to_dict(self) -> Dict:
+        """The store's record fields for this host (the shape add() takes)"""
+        record = {}
+        for name in self._store.fields:
+            if name == 'open_ports':
+                record[name] = self.open_ports()
+            elif name == 'udp_ports':
+                record[name] = self.open_ports('udp')
+            elif name == 'services':
+                record[name] = [{'port': port, 'protocol': protocol, 'service': service,
+                                 'version': version}
+                                for protocol, port, service, version in self.services()]
+            elif name == 'scan_time':
+                record[name] = self.scan_time.isoformat()
+            else:
+                record[name] = getattr(self, name)
+        return record
+
+
+class ResultStore:
+    """
+    Scan results held column by column.
+
+    Each host is one row: its IP and MAC packed into integer arrays, its
+    hostname, vendor, device type and network as ids into one pool of
+    interned strings, and its open ports as a typed array of
+    protocol/port keys (with a parallel array of service and version ids
+    when any were identified). No object is kept per host or per port;
+    HostRecord views are made on access. A posting list per port (the rows
+    it is open on) answers "hosts with port 3389 open" and a row list per
+    MAC answers "hosts with this MAC" without touching other hosts; string
+    queries compare small integers down a column.
+
+    add() takes records in to_dict() shape and merges repeat sightings of
+    a MAC at an IP (a mac-less sighting merges into the first host at its
+    IP): blank fields are filled in, an 'Unknown' vendor is replaced, the
+    most specific network is kept and ports are unioned.
+    """
+    
+    def __init__(self, fields: Sequence[str] = SCAN_FIELDS, records: Iterable[Dict] = ()):
+        self.fields = list(fields)
+        self.clear()
+        self.extend(records)
+    
+    def clear(self):
+        self._ips = array('Q')
+        self._ipv6: List[int] = []
+        self._ipv6_ids: Dict[int, int] = {}
+        self._macs = array('Q')
+        self._hostnames = array('I')
+        self._vendors = array('I')
+        self._device_types = array('I')
+        self._networks = array('I')
+        self._scan_times = array('d')
+        self._ports: List[Optional[array]] = []  # per row: sorted port keys
+        self._services: List[Optional[array]] = []  # per row: service, version id per port
+        self._postings: Dict[int, array] = {}  # port key -> rows it is open on
+        self._strings: List[Optional[str]] = [None]  # id 0 is "not set"
+        self._string_ids: Dict[str, int] = {}
+        self._first_row: Dict[int, int] = {}  # packed IP -> first row at that IP
+        self._other_rows: Dict[Tuple[int, int], int] = {}  # (packed IP, MAC) -> row, further MACs
+        self._mac_rows: Dict[int, List[int]] = {}  # packed MAC -> rows with that MAC
+    
+    def __len__(self):
+        return len(self._ips)
+    
+    def __iter__(self) -> Iterator[HostRecord]:
+        return (HostRecord(self, row) for row in range(len(self._ips)))
+    
+    # -- packing --------------------------------------------------------------
+    
+    def _intern(self, value: Optional[str]) -> int:
+        if value is None:
+            return 0
+        string_id = self._string_ids.get(value)
+        if string_id is None:
+            string_id = self._string_ids[value] = len(self._strings)
+            self._strings.append(value)
+        return string_id
+    
+    def _pack_ip(self, ip: str, create: bool = True) -> Optional[int]:
+        addr = ipaddress.ip_address(ip)
+        if addr.version == 4:
+            return int(addr)
+        index = self._ipv6_ids.get(int(addr))
+        if index is None:
+            if not create:
+                return None
+            index = self._ipv6_ids[int(addr)] = len(self._ipv6)
+            self._ipv6.append(int(addr))
+        return IPV6 | index
+    
+    def _unpack_ip(self, packed: int) -> str:
+        if packed & IPV6:
+            return str(ipaddress.IPv6Address(self._ipv6[packed & ~IPV6]))
+        return str(ipaddress.IPv4Address(packed))
+    
+    def _sort_key(self, row: int) -> Tuple[int, int]:
+        packed = self._ips[row]
+        return (1, self._ipv6[packed & ~IPV6]) if packed & IPV6 else (0, packed)
+    
+    def _records(self, rows: Iterable[int]) -> List[HostRecord]:
+        """Views of rows, in IP order"""
+        key = self._sort_key if self._ipv6 else self._ips.__getitem__
+        return [HostRecord(self, row) for row in sorted(rows, key=key)]
+    
+    # -- writing --------------------------------------------------------------
+    
+    def _find(self, ip: int, mac: int) -> Optional[int]:
+        row = self._first_row.get(ip)
+        if row is None or not mac or self._macs[row] == mac:
+            return row
+        return self._other_rows.get((ip, mac))
+    
+    def _merge_ports(self, row: int, ports: Dict[int, Tuple[int, int]]):
+        keys, names = self._ports[row], self._services[row]
+        current = {key: (names[2 * i], names[2 * i + 1]) if names is not None else (0, 0)
+                   for i, key in enumerate(keys or ())}
+        for key, (service, version) in ports.items():
+            if key not in current:
+                self._postings.setdefault(key, array('I')).append(row)
+                current[key] = (service, version)
+            elif not current[key][0]:
+                current[key] = (service, version)
+        if not current:
+            return
+        ordered = sorted(current)
+        self._ports[row] = array('I', ordered)
+        ids = [i for key in ordered for i in current[key]]
+        self._services[row] = array('I', ids) if any(ids) else None
+    
+    def add(self, record: Dict) -> HostRecord:
+        """Insert a host record (to_dict() shape), merging repeat sightings; returns its row"""
+        ip = self._pack_ip(record['ip'])
+        mac = _pack_mac(record.get('mac'))
+        services = {(s.get('protocol', 'tcp'), s['port']): s for s in record.get('services') or []}
+        ports = {}
+        for protocol, field in (('tcp', 'open_ports'), ('udp', 'udp_ports')):
+            for port in record.get(field) or ():
+                service = services.get((protocol, port), {})
+                ports[_port_key(port, protocol)] = (self._intern(service.get('service')),
+                                                    self._intern(service.get('version')))
+        
+        row = self._find(ip, mac)
+        if row is None:
+            row = len(self._ips)
+            if ip in self._first_row:
+                self._other_rows[ip, mac] = row
+            else:
+                self._first_row[ip] = row
+            scan_time = record.get('scan_time')
+            if isinstance(scan_time, str):
+                scan_time = datetime.fromisoformat(scan_time)
+            self._ips.append(ip)
+            self._macs.append(mac)
+            if mac:
+                self._mac_rows.setdefault(mac, []).append(row)
+            self._hostnames.append(self._intern(record.get('hostname')))
+            self._vendors.append(self._intern(record.get('vendor')))
+            self._device_types.append(self._intern(record.get('device_type')))
+            self._networks.append(self._intern(record.get('network')))
+            self._scan_times.append(scan_time.timestamp() if scan_time else time.time())
+            self._ports.append(None)
+            self._services.append(None)
+        else:
+            for column, key in ((self._hostnames, 'hostname'), (self._device_types, 'device_type')):
+                if not column[row]:
+                    column[row] = self._intern(record.get(key))
+            if self._strings[self._vendors[row]] in (None, 'Unknown') and record.get('vendor'):
+                self._vendors[row] = self._intern(record['vendor'])
+            if _prefixlen(record.get('network')) > _prefixlen(self._strings[self._networks[row]]):
+                self._networks[row] = self._intern(record['network'])
+        self._merge_ports(row, ports)
+        return HostRecord(self, row)
+    
+    def extend(self, records: Iterable[Dict]) -> List[HostRecord]:
+        return [self.add(record) for record in records]
+    
+    # -- queries --------------------------------------------------------------
+    
+    def _column_rows(self, column: array, value: Optional[str]) -> List[int]:
+        string_id = self._string_ids.get(value) if value is not None else 0
+        if string_id is None:
+            return []
+        return list(compress(range(len(column)), map(string_id.__eq__, column)))
+    
+    def _vendor_rows(self, vendor: str) -> List[int]:
+        needle = vendor.lower()
+        ids = {i for i, value in enumerate(self._strings) if value is not None and needle in value.lower()}
+        return list(compress(range(len(self._vendors)), map(ids.__contains__, self._vendors)))
+    
+    def select(self, port: Optional[int] = None, protocol: str = 'tcp',
+               vendor: Optional[str] = None, network: Optional[str] = None,
+               mac: Optional[str] = None) -> List[HostRecord]:
+        """
+        Hosts matching every criterion given, in IP order.
+
+        port is an open port of `protocol`, vendor a case-insensitive part
+        of the vendor name, network and mac exact values.
+        """
+        found = []
+        if port is not None:
+            found.append(self._postings.get(_port_key(port, protocol), ()))
+        if mac is not None:
+            found.append(self._mac_rows.get(_pack_mac(mac), ()))
+        if vendor is not None:
+            found.append(self._vendor_rows(vendor))
+        if network is not None:
+            found.append(self._column_rows(self._networks, network))
+        if not found:
+            return self._records(range(len(self._ips)))
+        rows = set(found[0]).intersection(*found[1:])
+        return self._records(rows)
+    
+    def networks(self) -> List[Optional[str]]:
+        """The distinct networks of the hosts, in first-seen order"""
+        return [self._strings[i] for i in dict.fromkeys(self._networks)]
+    
+    def sorted(self) -> List[HostRecord]:
+        """Every host, in IP order"""
+        return self._records(range(len(self._ips)))
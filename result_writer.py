@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Result Writer - Streaming NDJSON/CSV output, one record per finished host
+Shared by scanner.py and multi_network_scanner.py
+"""
+
+import csv
+import gzip
+import json
+import time
+from typing import Dict, List, Optional
+
+FORMATS = ['ndjson', 'csv']
+
+
+def detect_format(path: str) -> str:
+    """Output format from the file name (.csv or .csv.gz is CSV, anything else NDJSON)"""
+    name = path[:-3] if path.endswith('.gz') else path
+    return 'csv' if name.lower().endswith('.csv') else 'ndjson'
+
+
+class ResultWriter:
+    """
+    Append-only result stream.
+
+    Each record is written as soon as its host is finished, as one NDJSON
+    line or one CSV row, so memory use doesn't grow with the inventory and
+    a crash mid-scan keeps everything written so far. Output is flushed
+    when a write comes at least flush_interval seconds after the previous
+    flush, and on close. A path ending in .gz is gzip-compressed; each
+    flush is a sync flush, so the file stays readable up to that point.
+    """
+    
+    def __init__(self, path: str, fields: List[str], format: Optional[str] = None,
+                 flush_interval: float = 1.0):
+        self.path = path
+        self.format = format or detect_format(path)
+        if self.format not in FORMATS:
+            raise ValueError(f"Unknown output format: {self.format}")
+        self.flush_interval = flush_interval
+        self.count = 0
+        if path.endswith('.gz'):
+            self._file = gzip.open(path, 'wt', encoding='utf-8', newline='')
+        else:
+            self._file = open(path, 'w', encoding='utf-8', newline='')
+        self._csv = None
+        if self.format == 'csv':
+            self._csv = csv.DictWriter(self._file, fieldnames=fields, extrasaction='ignore')
+            self._csv.writeheader()
+        self._last_flush = time.monotonic()
+    
+    def write(self, record: Dict):
+        if self._csv is not None:
+            self._csv.writerow({key: ','.join(map(str, value)) if isinstance(value, (list, tuple))
+                                else value for key, value in record.items()})
+        else:
+            self._file.write(json.dumps(record, default=str) + '\n')
+        self.count += 1
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+    
+    def flush(self):
+        self._file.flush()
+        self._last_flush = time.monotonic()
+    
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Scan Journal - Append-only checkpoint journal for resumable scans
+Used by scanner.py
+"""
+
+import asyncio
+import json
+import os
+import random
+import time
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+BLOCK_SIZE = 256  # consecutive probes of one host checkpointed as one unit
+FLUSH_INTERVAL = 1.0  # longest time a finished unit stays unjournaled
+
+
+class CheckpointMismatch(ValueError):
+    """The checkpoint to resume belongs to a different scan"""
+
+
+class ScanJournal:
+    """
+    Append-only checkpoint of a running scan, one JSON entry per line:
+
+        {"type": "scan", "params": {...}, "seed": N}   first line
+        {"type": "device", "ip", "mac", "first"}       host queued for scanning
+        {"type": "block", "ip", "block", "open"}       a block of its probes done
+        {"type": "host", "device": {...}}              host finished (to_dict())
+        {"type": "discovered"}                         discovery finished
+        {"type": "done"}                               scan finished
+
+    Blocks are positions in the host's probe order (block k covers probes
+    k*BLOCK_SIZE onwards), which the seed makes reproducible. Entries are
+    flushed and fsynced at most flush_interval seconds after they are
+    written - on the next write or by a timer on the running event loop,
+    so a quiet stretch of the scan can't hold them back - and on close; a
+    torn last line left by a crash is dropped when the journal is resumed.
+    """
+    
+    def __init__(self, path: str, params: Dict, seed: Optional[int] = None,
+                 resume: bool = False, flush_interval: float = FLUSH_INTERVAL):
+        self.path = path
+        self.params = params
+        self.flush_interval = flush_interval
+        self.devices: Dict[str, Dict] = {}  # ip -> device entry
+        self.blocks: Dict[str, Dict[int, List[int]]] = {}  # ip -> block -> open ports
+        self.hosts: Dict[str, Dict] = {}  # ip -> finished device record
+        self.discovered = False
+        self.done = False
+        self.resumed = resume and os.path.exists(path)
+        self._last_flush = time.monotonic()
+        self._timer: Optional[asyncio.TimerHandle] = None  # pending flush of buffered entries
+        if self.resumed:
+            self._load()
+            self._file = open(path, 'a', encoding='utf-8')
+        else:
+            self.seed = seed if seed is not None else random.randrange(2 ** 32)
+            self._file = open(path, 'w', encoding='utf-8')
+            self._write({'type': 'scan', 'params': params, 'seed': self.seed})
+            self.flush()
+    
+    def _load(self):
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        complete = data.rfind(b'\n') + 1
+        if complete < len(data):  # torn write from a crash
+            with open(self.path, 'r+b') as f:
+                f.truncate(complete)
+        lines = data[:complete].decode('utf-8').splitlines()
+        try:
+            header = json.loads(lines[0])
+        except (IndexError, ValueError):
+            header = {}
+        if not isinstance(header, dict) or header.get('type') != 'scan':
+            raise CheckpointMismatch(f"{self.path} is not a scan checkpoint")
+        if header['params'] != self.params:
+            changed = sorted(k for k in set(header['params']) | set(self.params)
+                             if header['params'].get(k) != self.params.get(k))
+            raise CheckpointMismatch(f"{self.path} was written by a different scan "
+                             f"({', '.join(changed)} changed)")
+        self.seed = header['seed']
+        for line in lines[1:]:
+            entry = json.loads(line)
+            kind = entry['type']
+            if kind == 'device':
+                self.devices[entry['ip']] = entry
+            elif kind == 'block':
+                self.blocks.setdefault(entry['ip'], {})[entry['block']] = entry['open']
+            elif kind == 'host':
+                self.hosts[entry['device']['ip']] = entry['device']
+            elif kind == 'discovered':
+                self.discovered = True
+            elif kind == 'done':
+                self.done = True
+    
+    def _write(self, entry: Dict):
+        if self._file.closed:  # probes still settling after an interrupt
+            return
+        self._file.write(json.dumps(entry, separators=(',', ':')) + '\n')
+        due = self._last_flush + self.flush_interval - time.monotonic()
+        if due <= 0:
+            self.flush()
+        elif self._timer is None:
+            try:
+                self._timer = asyncio.get_running_loop().call_later(due, self.flush)
+            except RuntimeError:  # no event loop to wake us: don't leave it buffered
+                self.flush()
+    
+    def add_device(self, ip: str, mac: Optional[str], first: Sequence[int]):
+        entry = {'type': 'device', 'ip': ip, 'mac': mac, 'first': list(first)}
+        self.devices[ip] = entry
+        self._write(entry)
+    
+    def finish_block(self, ip: str, block: int, open_ports: List[int]):
+        self._write({'type': 'block', 'ip': ip, 'block': block, 'open': sorted(open_ports)})
+    
+    def finish_host(self, record: Dict):
+        self._write({'type': 'host', 'device': record})
+    
+    def finish_discovery(self):
+        self._write({'type': 'discovered'})
+    
+    def flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._file.closed:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._last_flush = time.monotonic()
+    
+    def close(self, done: bool = False):
+        if self._file.closed:
+            return
+        if done:
+            self._write({'type': 'done'})
+        self.flush()
+        self._file.close()
+
+
+class BlockTracker:
+    """
+    Checkpoint a HostStream in blocks of each host's probe order.
+
+    Wraps the stream handed to the connection scheduler: it numbers every
+    host's probes as they are drawn, drops those in blocks the journal
+    already has, and journals a block with its open ports once all of its
+    probes are done. Only in-flight probes and unfinished blocks are kept.
+    """
+    
+    def __init__(self, stream, journal: ScanJournal, block_size: int = BLOCK_SIZE):
+        self.stream = stream
+        self.journal = journal
+        self.block_size = block_size
+        self._hosts: Dict[str, Tuple[int, Set[int]]] = {}  # ip -> (probe count, blocks to skip)
+        self._drawn: Dict[str, int] = {}  # ip -> probes drawn so far
+        self._in_flight: Dict[Tuple[str, int], int] = {}  # (ip, port) -> block
+        self._left: Dict[Tuple[str, int], int] = {}  # (ip, block) -> probes not yet done
+        self._open: Dict[Tuple[str, int], List[int]] = {}  # (ip, block) -> open ports found
+    
+    def add(self, ip: str, count: int, skip: Sequence[int] = ()) -> int:
+        """Register a host with count probes; returns how many are left after skip"""
+        skip = {block for block in skip if block * self.block_size < count}
+        self._hosts[ip] = (count, skip)
+        self._drawn[ip] = 0
+        return count - sum(self._block_len(count, block) for block in skip)
+    
+    def _block_len(self, count: int, block: int) -> int:
+        return min(self.block_size, count - block * self.block_size)
+    
+    def __aiter__(self):
+        return self
+    
+    async def __anext__(self):
+        while True:
+            host, port = await self.stream.__anext__()
+            count, skip = self._hosts[host.ip]
+            position = self._drawn[host.ip]
+            self._drawn[host.ip] = position + 1
+            block = position // self.block_size
+            if block in skip:
+                continue
+            self._in_flight[host.ip, port] = block
+            self._left.setdefault((host.ip, block), self._block_len(count, block))
+            return host, port
+    
+    def opened(self, ip: str, port: int):
+        block = self._in_flight[ip, port]
+        self._open.setdefault((ip, block), []).append(port)
+    
+    def done(self, ip: str, port: int):
+        block = self._in_flight.pop((ip, port))
+        key = (ip, block)
+        self._left[key] -= 1
+        if self._left[key] == 0:
+            del self._left[key]
+            self.journal.finish_block(ip, block, self._open.pop(key, []))
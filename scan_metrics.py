@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+"""
+Scan Metrics - Stage timings, latency histograms and probe outcome counters
+Shared by scanner.py and multi_network_scanner.py
+"""
+
+import asyncio
+import bisect
+import contextlib
+import copy
+import json
+import os
+import threading
+import time
+from typing import Dict, Iterator, Optional, Sequence
+
+# Final outcome of one port probe
+OUTCOMES = ('open', 'refused', 'timeout', 'emfile', 'error')
+
+# Upper bounds in seconds, from loopback round trips up to retried timeouts
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRIC_PREFIX = 'netscan'
+
+
+def open_fd_count() -> Optional[int]:
+    """File descriptors open in this process, where /proc or /dev/fd can tell"""
+    for path in ('/proc/self/fd', '/dev/fd'):
+        try:
+            return len(os.listdir(path))
+        except OSError:
+            continue
+    return None
+
+
+class Histogram:
+    """Fixed-bucket latency histogram (Prometheus semantics, non-cumulative storage)"""
+    
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+    
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+    
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate a quantile by interpolating inside its bucket"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lower = self.buckets[i - 1] if i else 0.0
+                if i == len(self.buckets):
+                    return lower  # beyond the last bound: report the bound
+                return lower + (self.buckets[i] - lower) * (rank - seen) / n
+            seen += n
+        return self.buckets[-1]
+    
+    def to_dict(self) -> Dict:
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'p50': self.quantile(0.50),
+            'p90': self.quantile(0.90),
+            'p99': self.quantile(0.99),
+        }
+
+
+class ScanMetrics:
+    """
+    Telemetry for one scan run.
+
+    Stages (ARP sweep, vendor and DNS lookups, port scan, fingerprinting,
+    exports) are timed with the stage() context manager; because pipeline
+    stages overlap, each keeps both its wall-clock span (first start to
+    last end) and its busy time summed over every entry. Every port probe
+    ends in one of OUTCOMES and its duration, retries included, goes into
+    the 'probe' histogram. Updates come from the event loop (and the odd
+    worker thread) while the live view and the metrics endpoint read
+    snapshots, so all access goes through one lock.
+    """
+    
+    def __init__(self):
+        self.started = time.monotonic()
+        self.outcomes: Dict[str, int] = dict.fromkeys(OUTCOMES, 0)
+        self.counters: Dict[str, int] = {}
+        self.histograms: Dict[str, Histogram] = {}
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.peak_fds = open_fd_count() or 0
+        self._stages: Dict[str, list] = {}  # name -> [first start, last end, busy, entries]
+        self._lock = threading.Lock()
+    
+    # -- recording ------------------------------------------------------------
+    
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Time one pass through a stage; nested and concurrent entries are fine"""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record_stage(name, started, time.monotonic())
+    
+    def record_stage(self, name: str, started: float, ended: float):
+        with self._lock:
+            entry = self._stages.get(name)
+            if entry is None:
+                self._stages[name] = [started, ended, ended - started, 1]
+            else:
+                entry[0] = min(entry[0], started)
+                entry[1] = max(entry[1], ended)
+                entry[2] += ended - started
+                entry[3] += 1
+    
+    def count(self, name: str, n: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+    
+    def observe(self, name: str, seconds: float):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+    
+    def probe_started(self):
+        with self._lock:
+            self.in_flight += 1
+            if self.in_flight > self.peak_in_flight:
+                self.peak_in_flight = self.in_flight
+    
+    def probe_finished(self, outcome: str, seconds: float):
+        with self._lock:
+            self.in_flight -= 1
+            self.outcomes[outcome] += 1
+            if outcome != 'emfile':  # those are retried, not finished
+                histogram = self.histograms.get('probe')
+                if histogram is None:
+                    histogram = self.histograms['probe'] = Histogram()
+                histogram.observe(seconds)
+    
+    def merge(self, other: 'ScanMetrics', previous: Optional['ScanMetrics'] = None):
+        """
+        Add another process's metrics into these ones.
+
+        Workers send their whole metrics object repeatedly; passing the copy
+        merged last time as previous adds only what changed since. Peaks
+        from separate processes are summed, giving an upper bound.
+        """
+        if previous is None:
+            previous = ScanMetrics()
+            previous.peak_fds = 0
+        with self._lock:
+            for outcome, n in other.outcomes.items():
+                self.outcomes[outcome] = (self.outcomes.get(outcome, 0) + n
+                                          - previous.outcomes.get(outcome, 0))
+            for name, n in other.counters.items():
+                self.counters[name] = self.counters.get(name, 0) + n - previous.counters.get(name, 0)
+            for name, histogram in other.histograms.items():
+                mine = self.histograms.get(name)
+                if mine is None:
+                    mine = self.histograms[name] = Histogram(histogram.buckets)
+                old = previous.histograms.get(name) or Histogram(histogram.buckets)
+                mine.counts = [m + n - o for m, n, o in zip(mine.counts, histogram.counts, old.counts)]
+                mine.count += histogram.count - old.count
+                mine.sum += histogram.sum - old.sum
+            for name, (start, end, busy, entries) in other._stages.items():
+                _, _, old_busy, old_entries = previous._stages.get(name, (0.0, 0.0, 0.0, 0))
+                entry = self._stages.get(name)
+                if entry is None:
+                    self._stages[name] = [start, end, busy - old_busy, entries - old_entries]
+                else:
+                    entry[0] = min(entry[0], start)
+                    entry[1] = max(entry[1], end)
+                    entry[2] += busy - old_busy
+                    entry[3] += entries - old_entries
+            self.in_flight += other.in_flight - previous.in_flight
+            self.peak_in_flight += other.peak_in_flight - previous.peak_in_flight
+            self.peak_fds += other.peak_fds - previous.peak_fds
+    
+    def __getstate__(self):
+        # Pickled from a queue feeder thread while the scan keeps updating
+        with self._lock:
+            state = {key: value for key, value in self.__dict__.items() if key != '_lock'}
+            return copy.deepcopy(state)
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+    
+    def sample_fds(self) -> Optional[int]:
+        fds = open_fd_count()
+        if fds is not None:
+            with self._lock:
+                self.peak_fds = max(self.peak_fds, fds)
+        return fds
+    
+    # -- reporting ------------------------------------------------------------
+    
+    @property
+    def probes_done(self) -> int:
+        """Probes that reached a final outcome (EMFILE failures are retried)"""
+        return sum(n for outcome, n in self.outcomes.items() if outcome != 'emfile')
+    
+    def summary(self) -> Dict:
+        """JSON-serializable snapshot of everything recorded so far"""
+        fds = self.sample_fds()
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self.started
+            return {
+                'elapsed': elapsed,
+                'stages': {name: {'wall': end - start, 'busy': busy, 'count': n}
+                           for name, (start, end, busy, n) in self._stages.items()},
+                'probes': dict(self.outcomes),
+                'probes_per_sec': self.probes_done / elapsed if elapsed else 0.0,
+                'counters': dict(self.counters),
+                'latency': {name: h.to_dict() for name, h in self.histograms.items()},
+                'in_flight': self.in_flight,
+                'peak_in_flight': self.peak_in_flight,
+                'open_fds': fds,
+                'peak_fds': self.peak_fds,
+            }
+    
+    def write_json(self, path: str):
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+    
+    def to_prometheus(self) -> str:
+        """Current values in the Prometheus text exposition format"""
+        fds = self.sample_fds()
+        p = METRIC_PREFIX
+        lines = []
+        
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {p}_{name} {help_text}")
+            lines.append(f"# TYPE {p}_{name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{p}_{name}{labels} {value}")
+        
+        with self._lock:
+            metric('elapsed_seconds', 'gauge', 'Seconds since the scan started',
+                   [('', time.monotonic() - self.started)])
+            metric('probes_total', 'counter', 'Port probes by outcome',
+                   [(f'{{outcome="{o}"}}', n) for o, n in self.outcomes.items()])
+            metric('probes_in_flight', 'gauge', 'Connects currently in flight',
+                   [('', self.in_flight)])
+            for name, value in sorted(self.counters.items()):
+                metric(f'{name}_total', 'counter', name.replace('_', ' ').capitalize(),
+                       [('', value)])
+            stages = sorted(self._stages.items())
+            metric('stage_wall_seconds', 'gauge', 'Wall-clock span of each scan stage',
+                   [(f'{{stage="{s}"}}', end - start) for s, (start, end, _, _) in stages])
+            metric('stage_busy_seconds', 'counter', 'Time spent inside each stage, summed over entries',
+                   [(f'{{stage="{s}"}}', busy) for s, (_, _, busy, _) in stages])
+            for name, h in sorted(self.histograms.items()):
+                samples, cumulative = [], 0
+                for bound, n in zip(h.buckets, h.counts):
+                    cumulative += n
+                    samples.append((f'_bucket{{le="{bound}"}}', cumulative))
+                samples.append(('_bucket{le="+Inf"}', h.count))
+                samples.append(('_sum', h.sum))
+                samples.append(('_count', h.count))
+                metric(f'{name}_seconds', 'histogram', f'{name.capitalize()} latency', samples)
+        if fds is not None:
+            metric('open_fds', 'gauge', 'Open file descriptors', [('', fds)])
+        return '\n'.join(lines) + '\n'
+
+
+# ============================================================================
+# METRICS ENDPOINT
+# ============================================================================
+
+class MetricsServer:
+    """
+    Serve /metrics (Prometheus text) and /metrics.json from a daemon thread
+    for as long as the scan runs, so long scans can be scraped.
+    """
+    
+    def __init__(self, metrics: ScanMetrics, port: int, host: str = '127.0.0.1'):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        
+        self.metrics = metrics
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/metrics':
+                    body = metrics.to_prometheus().encode()
+                    content_type = 'text/plain; version=0.0.4'
+                elif self.path == '/metrics.json':
+                    body = json.dumps(metrics.summary()).encode()
+                    content_type = 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, *args):
+                pass
+        
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+    
+    @property
+    def address(self):
+        return self._server.server_address
+    
+    def start(self) -> 'MetricsServer':
+        self._thread.start()
+        return self
+    
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+# ============================================================================
+# LIVE PROGRESS
+# ============================================================================
+
+@contextlib.asynccontextmanager
+async def live_progress(metrics: ScanMetrics, console, refresh: float = 0.25):
+    """
+    Show a live progress bar fed from metrics while the body runs.
+
+    The total grows as hosts are discovered (the 'probes_planned'
+    counter), so the bar is indeterminate until the first host is queued.
+    """
+    from rich.progress import BarColumn, MofNCompleteColumn, Progress, TextColumn, TimeElapsedColumn
+    
+    progress = Progress(
+        TextColumn("[cyan]{task.description}"),
+        BarColumn(),
+        MofNCompleteColumn(),
+        TextColumn("hosts {task.fields[hosts]}  open [green]{task.fields[open]}[/green]  "
+                   "timeout [yellow]{task.fields[timeout]}[/yellow]  "
+                   "emfile [red]{task.fields[emfile]}[/red]  in flight {task.fields[in_flight]}"),
+        TimeElapsedColumn(),
+        console=console,
+    )
+    task = progress.add_task("Probes", total=None, hosts='0/0', open=0, timeout=0,
+                             emfile=0, in_flight=0)
+    
+    def update():
+        metrics.sample_fds()
+        counters = metrics.counters
+        planned = counters.get('probes_planned', 0)
+        progress.update(task, completed=metrics.probes_done, total=planned or None,
+                        hosts=f"{counters.get('hosts_finished', 0)}/{counters.get('hosts_discovered', 0)}",
+                        open=metrics.outcomes['open'], timeout=metrics.outcomes['timeout'],
+                        emfile=metrics.outcomes['emfile'], in_flight=metrics.in_flight)
+    
+    async def refresher():
+        while True:
+            update()
+            await asyncio.sleep(refresh)
+    
+    with progress:
+        task_refresh = asyncio.ensure_future(refresher())
+        try:
+            yield progress
+        finally:
+            task_refresh.cancel()
+            update()
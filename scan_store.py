@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Scan Store - Persistent SQLite history of devices, ports and scan runs
+Shared by scanner.py and multi_network_scanner.py
+"""
+
+import os
+import sqlite3
+import time
+from typing import Container, Dict, Iterable, List, Optional, Tuple
+
+from hostname_resolver import CACHE_DIR
+
+DEFAULT_DB_PATH = os.path.join(CACHE_DIR, 'scans.db')
+
+FULL_RESCAN_AGE = 7 * 24 * 3600  # unchanged hosts still get a full scan this often
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scans (
+    id INTEGER PRIMARY KEY,
+    started_at REAL NOT NULL,
+    finished_at REAL,
+    network TEXT,
+    ports TEXT,
+    mode TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS scans_started ON scans (started_at);
+
+CREATE TABLE IF NOT EXISTS devices (
+    id INTEGER PRIMARY KEY,
+    mac TEXT NOT NULL,
+    ip TEXT NOT NULL,
+    hostname TEXT,
+    vendor TEXT,
+    network TEXT,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    full_scan_at REAL,
+    full_scan_ports TEXT,
+    UNIQUE (mac, ip)
+);
+CREATE INDEX IF NOT EXISTS devices_ip ON devices (ip);
+CREATE INDEX IF NOT EXISTS devices_last_seen ON devices (last_seen);
+
+CREATE TABLE IF NOT EXISTS sightings (
+    scan_id INTEGER NOT NULL REFERENCES scans (id),
+    device_id INTEGER NOT NULL REFERENCES devices (id),
+    PRIMARY KEY (scan_id, device_id)
+);
+CREATE INDEX IF NOT EXISTS sightings_device ON sightings (device_id);
+
+CREATE TABLE IF NOT EXISTS ports (
+    device_id INTEGER NOT NULL REFERENCES devices (id),
+    number INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    service TEXT,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    changed_at REAL NOT NULL,
+    PRIMARY KEY (device_id, number)
+);
+CREATE INDEX IF NOT EXISTS ports_changed ON ports (changed_at);
+"""
+
+
+class ScanStore:
+    """
+    Embedded scan history.
+
+    Every run is recorded with the devices it saw and the ports found open,
+    so later runs can tell which hosts are new or changed. A device is one
+    (MAC, IP) pair: a new MAC, a MAC answering from a different IP, or an IP
+    answering with a different MAC all show up as a device the store has
+    never seen. Port rows keep their current state and when it last changed,
+    which answers "what changed since last night" with one indexed query.
+    """
+    
+    def __init__(self, path: str = DEFAULT_DB_PATH):
+        self.path = path
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.executescript(SCHEMA)
+    
+    def close(self):
+        self.db.close()
+    
+    # -- scan runs ------------------------------------------------------------
+    
+    def begin_scan(self, network: str, ports: Optional[str], mode: str,
+                   started_at: Optional[float] = None) -> int:
+        """Start recording a run; mode is 'full', 'incremental' or 'discover'"""
+        with self.db:
+            cursor = self.db.execute(
+                'INSERT INTO scans (started_at, network, ports, mode) VALUES (?, ?, ?, ?)',
+                (started_at or time.time(), network, ports, mode))
+        return cursor.lastrowid
+    
+    def finish_scan(self, scan_id: int):
+        with self.db:
+            self.db.execute('UPDATE scans SET finished_at = ? WHERE id = ?', (time.time(), scan_id))
+    
+    # -- incremental planning -------------------------------------------------
+    
+    def device(self, mac: str, ip: str) -> Optional[sqlite3.Row]:
+        return self.db.execute('SELECT * FROM devices WHERE mac = ? AND ip = ?',
+                               (mac.lower(), ip)).fetchone()
+    
+    def open_ports(self, device_id: int) -> List[int]:
+        rows = self.db.execute(
+            "SELECT number FROM ports WHERE device_id = ? AND state = 'open' ORDER BY number",
+            (device_id,))
+        return [row['number'] for row in rows]
+    
+    def plan(self, mac: str, ip: str, port_spec: str,
+             max_age: float = FULL_RESCAN_AGE) -> Tuple[bool, List[int]]:
+        """
+        Decide how much of a host to rescan: returns (full, known_open).
+
+        A full rescan is needed for hosts never seen at this MAC and IP and
+        for hosts whose last full scan used other ports or is older than
+        max_age. Otherwise only the ports known to be open are re-verified.
+        known_open is returned in both cases so it can be probed first.
+        """
+        row = self.device(mac, ip)
+        if row is None:
+            # Ports last seen open at this IP (under another MAC) are still worth trying first
+            rows = self.db.execute(
+                "SELECT DISTINCT p.number FROM ports p JOIN devices d ON d.id = p.device_id "
+                "WHERE d.ip = ? AND p.state = 'open' ORDER BY p.number", (ip,))
+            return True, [r['number'] for r in rows]
+        known_open = self.open_ports(row['id'])
+        full = (row['full_scan_ports'] != port_spec or row['full_scan_at'] is None
+                or time.time() - row['full_scan_at'] > max_age)
+        return full, known_open
+    
+    # -- recording ------------------------------------------------------------
+    
+    def record_device(self, scan_id: int, mac: str, ip: str, hostname: Optional[str] = None,
+                      vendor: Optional[str] = None, network: Optional[str] = None) -> int:
+        """Record that a device answered during a run; returns its id"""
+        now = time.time()
+        mac = (mac or '').lower()
+        with self.db:
+            self.db.execute(
+                'INSERT INTO devices (mac, ip, hostname, vendor, network, first_seen, last_seen) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (mac, ip) DO UPDATE SET last_seen = excluded.last_seen, '
+                'hostname = COALESCE(excluded.hostname, hostname), '
+                'vendor = COALESCE(excluded.vendor, vendor), '
+                'network = COALESCE(excluded.network, network)',
+                (mac, ip, hostname, vendor, network, now, now))
+            device_id = self.db.execute('SELECT id FROM devices WHERE mac = ? AND ip = ?',
+                                        (mac, ip)).fetchone()['id']
+            self.db.execute('INSERT OR IGNORE INTO sightings (scan_id, device_id) VALUES (?, ?)',
+                            (scan_id, device_id))
+        return device_id
+    
+    def record_ports(self, device_id: int, scanned: Container[int],
+                     open_ports: Iterable[Tuple[int, Optional[str]]],
+                     full_scan_ports: Optional[str] = None):
+        """
+        Record the outcome of a port scan of one device.
+
+        open_ports are (number, service) pairs. Ports previously open that
+        were part of `scanned` but not found open again are marked closed.
+        Pass full_scan_ports (the port spec) when every port in it was
+        scanned, so later incremental runs may skip this host.
+        """
+        now = time.time()
+        found = dict(open_ports)
+        with self.db:
+            for number, service in found.items():
+                self.db.execute(
+                    "INSERT INTO ports (device_id, number, state, service, first_seen, last_seen, changed_at) "
+                    "VALUES (?, ?, 'open', ?, ?, ?, ?) "
+                    "ON CONFLICT (device_id, number) DO UPDATE SET last_seen = excluded.last_seen, "
+                    "service = COALESCE(excluded.service, service), "
+                    "changed_at = CASE WHEN state = 'open' THEN changed_at ELSE excluded.changed_at END, "
+                    "state = 'open'",
+                    (device_id, number, service, now, now, now))
+            for number in self.open_ports(device_id):
+                if number in scanned and number not in found:
+                    self.db.execute(
+                        "UPDATE ports SET state = 'closed', changed_at = ? "
+                        "WHERE device_id = ? AND number = ?", (now, device_id, number))
+            if full_scan_ports is not None:
+                self.db.execute('UPDATE devices SET full_scan_at = ?, full_scan_ports = ? WHERE id = ?',
+                                (now, full_scan_ports, device_id))
+    
+    # -- history --------------------------------------------------------------
+    
+    def changes_since(self, since: float) -> Dict[str, List[sqlite3.Row]]:
+        """
+        What changed after `since` (epoch seconds).
+
+        new_devices: first seen after since. missing_devices: seen by the
+        last run that started before since but by no run after it.
+        opened_ports / closed_ports: ports whose state changed after since.
+        """
+        previous = self.db.execute(
+            'SELECT id FROM scans WHERE started_at < ? ORDER BY started_at DESC LIMIT 1',
+            (since,)).fetchone()
+        missing = []
+        if previous is not None:
+            missing = self.db.execute(
+                'SELECT d.* FROM devices d JOIN sightings s ON s.device_id = d.id '
+                'WHERE s.scan_id = ? AND d.last_seen < ? ORDER BY d.ip',
+                (previous['id'], since)).fetchall()
+        ports_query = ('SELECT d.ip, d.mac, d.hostname, p.number, p.service, p.changed_at '
+                       'FROM ports p JOIN devices d ON d.id = p.device_id '
+                       'WHERE p.state = ? AND p.changed_at >= ? ORDER BY d.ip, p.number')
+        return {
+            'new_devices': self.db.execute(
+                'SELECT * FROM devices WHERE first_seen >= ? ORDER BY ip', (since,)).fetchall(),
+            'missing_devices': missing,
+            'opened_ports': self.db.execute(ports_query, ('open', since)).fetchall(),
+            'closed_ports': self.db.execute(ports_query, ('closed', since)).fetchall(),
+        }
@@ -5,48 +5,78 @@ Discovers devices, scans ports, identifies services
 """
 
 import asyncio
+import bisect
+import errno
+import importlib.util
+import itertools
+import math
+import multiprocessing
+import os
+import random
 import socket
+import struct
+import sys
+import threading
+import time
+import zlib
 import ipaddress
-from dataclasses import dataclass, field
-from typing import List, Optional
+from collections import deque
+from dataclasses import dataclass, field, replace
+from typing import (AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional, Sequence,
+                    Tuple, Union)
 from datetime import datetime
 import json
+import queue
 
 # Third-party imports
-try:
-    from scapy.all import ARP, Ether, srp, conf
-    conf.verb = 0  # Disable Scapy verbosity
-    SCAPY_AVAILABLE = True
-except ImportError:
-    SCAPY_AVAILABLE = False
+# Scapy and python-nmap are heavy (scapy.all alone loads every protocol layer
+# in about a second), so only their presence is checked here; load_scapy()
+# imports the few pieces we use on first need.
+SCAPY_AVAILABLE = importlib.util.find_spec('scapy') is not None
+if not SCAPY_AVAILABLE:
     print("Warning: Scapy not available. ARP scanning disabled.")
 
-try:
-    import nmap
-    NMAP_AVAILABLE = True
-except ImportError:
-    NMAP_AVAILABLE = False
+NMAP_AVAILABLE = importlib.util.find_spec('nmap') is not None
+if not NMAP_AVAILABLE:
     print("Warning: python-nmap not available. Advanced scanning disabled.")
 
-try:
-    from netaddr import EUI
-    NETADDR_AVAILABLE = True
-except ImportError:
-    NETADDR_AVAILABLE = False
-
-try:
-    from mac_vendor_lookup import MacLookup
-    MAC_LOOKUP_AVAILABLE = True
-except ImportError:
-    MAC_LOOKUP_AVAILABLE = False
+from arp_sweep import ArpReply, ArpSweeper, DEFAULT_RATE as DEFAULT_ARP_RATE
+from distributed import DEFAULT_PORT as DEFAULT_COORDINATOR_PORT, LEASE_SECONDS, MAX_ATTEMPTS, UNIT_PREFIX
+from hostname_resolver import HostnameResolver
+from ping_sweep import PING_PORTS, PingSweeper
+from passive_monitor import CHECK_INTERVAL, MAX_MISSED, STALE_AFTER, HostState, PassiveMonitor
+from result_store import HostRecord, ResultStore, parse_mac
+from result_writer import FORMATS as OUTPUT_FORMATS, ResultWriter
+from scan_journal import BlockTracker, CheckpointMismatch, ScanJournal
+from scan_metrics import MetricsServer, ScanMetrics, live_progress
+from scan_store import DEFAULT_DB_PATH, ScanStore
+from service_probe import ServiceProber, service_for_port
+from udp_scan import (DEFAULT_PORTS as UDP_DEFAULT_PORTS, DEFAULT_RATE as DEFAULT_UDP_RATE,
+                      UdpScanner, identify as identify_udp)
+from vendor_db import VendorDB
 
 import click
 from rich.console import Console
 from rich.table import Table
-from rich.progress import Progress, SpinnerColumn, BarColumn, TextColumn
 from rich.panel import Panel
 from rich import box
 
+IP = TCP = AsyncSniffer = conf = None
+_scapy_loaded = False
+
+
+def load_scapy():
+    """Import the Scapy layers and functions the SYN scanner uses (IP, TCP, AsyncSniffer)"""
+    global IP, TCP, AsyncSniffer, conf, _scapy_loaded
+    if _scapy_loaded:
+        return
+    from scapy.config import conf
+    conf.verb = 0  # Disable Scapy verbosity
+    from scapy.layers.inet import IP, TCP
+    from scapy.sendrecv import AsyncSniffer
+    _scapy_loaded = True
+
+
 console = Console()
 
 
@@ -61,11 +91,12 @@ class Port:
     state: str  # 'open', 'closed', 'filtered'
     service: Optional[str] = None
     version: Optional[str] = None
+    protocol: str = 'tcp'  # 'tcp' or 'udp'
 
 
 @dataclass
 class Device:
-    """Represents a discovered network device"""
+    """A host while it is being scanned (finished hosts go to a ResultStore)"""
     ip: str
     mac: Optional[str] = None
     hostname: Optional[str] = None
@@ -74,9 +105,9 @@ class Device:
     ports: List[Port] = field(default_factory=list)
     scan_time: datetime = field(default_factory=datetime.now)
     
-    def get_open_ports(self) -> List[int]:
-        """Return list of open port numbers"""
-        return [p.number for p in self.ports if p.state == 'open']
+    def get_open_ports(self, protocol: str = 'tcp') -> List[int]:
+        """Return list of open port numbers for a protocol"""
+        return [p.number for p in self.ports if p.state == 'open' and p.protocol == protocol]
     
     def to_dict(self):
         """Convert to dictionary for serialization"""
@@ -87,19 +118,829 @@ class Device:
             'vendor': self.vendor,
             'device_type': self.device_type,
             'open_ports': self.get_open_ports(),
+            'udp_ports': self.get_open_ports('udp'),
+            'services': [{'port': p.number, 'protocol': p.protocol, 'service': p.service,
+                          'version': p.version}
+                         for p in self.ports if p.state == 'open'],
             'scan_time': self.scan_time.isoformat()
         }
 
 
+
+# Columns of Device.to_dict(), in order (streaming CSV output)
+RESULT_FIELDS = ['ip', 'mac', 'hostname', 'vendor', 'device_type', 'open_ports', 'udp_ports',
+                 'scan_time']
+
+# Host discovery: ARP sweep, unprivileged ping sweep, or ARP when raw sockets are usable
+DISCOVERY_METHODS = ['auto', 'arp', 'ping']
+
+
 @dataclass
 class ScanConfig:
     """Scan configuration"""
     network: str
-    ports: str = "1-1000"
-    timeout: float = 2.0
-    max_concurrent: int = 100
-    service_detection: bool = True
-    scan_type: str = "fast"  # fast, full
+    ports: str = "1-1000"  # e.g. "1-1000", "22,80,8000-8100", "top100"
+    exclude_ports: str = ""
+    randomize: bool = True  # probe (host, port) pairs in pseudo-random order
+    seed: Optional[int] = None
+    timeout: Optional[float] = None  # fixed connect timeout (None = adaptive)
+    timing: str = "normal"  # see TIMING_PROFILES
+    max_retries: Optional[int] = None  # None = use the timing profile's value
+    max_concurrent: Optional[int] = None  # scan-wide in-flight connects (None = size from fd limit)
+    max_per_host: int = 100  # in-flight connects against any single device
+    workers: int = 1  # processes the connect scan is sharded across
+    probe: str = "socket"  # connect probe: socket (lean, RST on open ports) or stream
+    event_loop: str = "auto"  # asyncio, uvloop, or auto (uvloop when installed)
+    service_detection: bool = True  # banner-grab open ports for service/version
+    udp: bool = False  # also UDP-scan udp_ports
+    udp_ports: str = UDP_DEFAULT_PORTS  # same syntax as ports
+    udp_rate: Optional[int] = DEFAULT_UDP_RATE  # UDP probes per second (None = unpaced)
+    service_concurrency: int = 64  # open ports fingerprinted at once
+    arp_rate: Optional[int] = DEFAULT_ARP_RATE  # ARP requests per second (None = unpaced)
+    arp_retries: int = 1  # extra ARP requests to hosts that stay silent
+    arp_timeout: float = 2.0  # longest wait for ARP replies after each round
+    discovery: str = "auto"  # one of DISCOVERY_METHODS
+    ping_ports: str = ','.join(map(str, PING_PORTS))  # TCP ports the ping sweep connects to
+    scan_type: str = "fast"  # fast, full, syn
+    syn_batch_size: int = 256  # SYN packets per send batch
+    syn_rate: Optional[int] = None  # SYN packets per second (None = unpaced)
+    resolve_hostnames: bool = True
+    dns_concurrency: int = 32  # reverse-DNS lookups in flight
+    dns_timeout: float = 2.0  # deadline per reverse-DNS lookup
+    db_path: Optional[str] = DEFAULT_DB_PATH  # scan history (None = don't record)
+    incremental: bool = False  # fully rescan only new/changed hosts, re-verify the rest
+    checkpoint: Optional[str] = None  # journal progress here (streaming connect scans)
+    resume: bool = False  # continue the scan recorded in checkpoint
+
+
+# ============================================================================
+# TARGET SPACE
+# ============================================================================
+
+# Most frequently open TCP ports, most common first (nmap-services ranking)
+TOP_PORTS = [
+    80, 23, 443, 21, 22, 25, 3389, 110, 445, 139, 143, 53, 135, 3306, 8080,
+    1723, 111, 995, 993, 5900, 1025, 587, 8888, 199, 1720, 465, 548, 113, 81,
+    6001, 10000, 514, 5060, 179, 1026, 2000, 8443, 8000, 32768, 554, 26, 1433,
+    49152, 2001, 515, 8008, 49154, 1027, 5666, 646, 5000, 5631, 631, 49153,
+    8081, 2049, 88, 79, 5800, 106, 2121, 1110, 49155, 6000, 513, 990, 5357,
+    427, 49156, 543, 544, 5101, 144, 7, 389, 8009, 3128, 444, 9999, 5009,
+    7070, 5190, 3000, 5432, 1900, 3986, 13, 1029, 9, 5051, 6646, 49157, 1028,
+    873, 1755, 2717, 4899, 9100, 119, 37,
+]
+
+MAX_PORT = 65535
+
+
+def top_ports(count: int) -> List[int]:
+    """
+    Return the `count` most common ports.
+
+    Past the end of the ranked list the remaining ports follow in
+    ascending order, so any count up to 65535 is honoured.
+    """
+    ranked = TOP_PORTS[:count]
+    if count > len(TOP_PORTS):
+        seen = set(ranked)
+        for port in range(1, MAX_PORT + 1):
+            if len(ranked) >= count:
+                break
+            if port not in seen:
+                ranked.append(port)
+    return ranked
+
+
+class PortList(Sequence):
+    """
+    Sorted set of ports stored as disjoint (start, end) ranges.
+
+    Indexing is O(log ranges), so a full 1-65535 scan costs a single tuple
+    instead of a 65535-element list.
+    """
+    
+    def __init__(self, ranges: Iterable[Tuple[int, int]] = ()):
+        self.ranges = self._merge(ranges)
+        self._offsets = []
+        total = 0
+        for start, end in self.ranges:
+            self._offsets.append(total)
+            total += end - start + 1
+        self._len = total
+    
+    @staticmethod
+    def _merge(ranges):
+        merged = []
+        for start, end in sorted(ranges):
+            if merged and start <= merged[-1][1] + 1:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+            else:
+                merged.append((start, end))
+        return merged
+    
+    def __len__(self):
+        return self._len
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._len))]
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError("port index out of range")
+        i = bisect.bisect_right(self._offsets, index) - 1
+        return self.ranges[i][0] + index - self._offsets[i]
+    
+    def __iter__(self):
+        for start, end in self.ranges:
+            yield from range(start, end + 1)
+    
+    def __contains__(self, port):
+        i = bisect.bisect_right(self.ranges, (port, MAX_PORT + 1)) - 1
+        return i >= 0 and self.ranges[i][0] <= port <= self.ranges[i][1]
+    
+    def __repr__(self):
+        return f"PortList({self.ranges!r})"
+    
+    def __str__(self):
+        """Canonical port spec, e.g. '22,80,8000-8100'"""
+        return ','.join(str(start) if start == end else f"{start}-{end}"
+                        for start, end in self.ranges)
+    
+    def exclude(self, other: 'PortList') -> 'PortList':
+        """Return a new PortList without the ports in `other`"""
+        remaining = []
+        for start, end in self.ranges:
+            for ex_start, ex_end in other.ranges:
+                if ex_end < start or ex_start > end:
+                    continue
+                if ex_start > start:
+                    remaining.append((start, ex_start - 1))
+                start = ex_end + 1
+                if start > end:
+                    break
+            if start <= end:
+                remaining.append((start, end))
+        return PortList(remaining)
+
+
+def parse_port_spec(spec: str, exclude: str = "") -> PortList:
+    """
+    Parse a port specification into a PortList.
+
+    Accepts comma-separated ports and ranges ("22,80,8000-8100"), open-ended
+    ranges ("-1024", "60000-") and "topN" for the N most common ports.
+    Ports listed in `exclude` (same syntax) are removed.
+    """
+    ranges = []
+    for token in (spec or "").replace(' ', '').split(','):
+        if not token:
+            continue
+        if token.lower().startswith('top'):
+            count = int(token[3:].lstrip(':-='))
+            ranges.extend((p, p) for p in top_ports(count))
+            continue
+        if '-' in token:
+            start, end = token.split('-', 1)
+            start = int(start) if start else 1
+            end = int(end) if end else MAX_PORT
+        else:
+            start = end = int(token)
+        if not 1 <= start <= end <= MAX_PORT:
+            raise ValueError(f"invalid port range: {token}")
+        ranges.append((start, end))
+    
+    ports = PortList(ranges)
+    if exclude:
+        ports = ports.exclude(parse_port_spec(exclude))
+    return ports
+
+
+def _is_prime(n: int) -> bool:
+    """Deterministic Miller-Rabin for n < 3.3e24"""
+    if n < 2:
+        return False
+    small = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37)
+    for p in small:
+        if n % p == 0:
+            return n == p
+    d, r = n - 1, 0
+    while d % 2 == 0:
+        d //= 2
+        r += 1
+    for a in small:
+        x = pow(a, d, n)
+        if x in (1, n - 1):
+            continue
+        for _ in range(r - 1):
+            x = x * x % n
+            if x == n - 1:
+                break
+        else:
+            return False
+    return True
+
+
+def _prime_factors(n: int) -> List[int]:
+    factors = []
+    p = 2
+    while p * p <= n:
+        if n % p == 0:
+            factors.append(p)
+            while n % p == 0:
+                n //= p
+        p += 1
+    if n > 1:
+        factors.append(n)
+    return factors
+
+
+class CyclicPermutation:
+    """
+    Full-cycle pseudo-random permutation of range(n).
+
+    Walks the multiplicative group of integers modulo a prime p > n from a
+    random primitive root, as zmap does: every index is visited exactly once
+    and only three integers of state are kept, whatever the size of n.
+    """
+    
+    def __init__(self, n: int, seed: Optional[int] = None):
+        self.n = n
+        rng = random.Random(seed)
+        if n < 3:
+            self.order = rng.sample(range(n), n)
+            return
+        self.order = None
+        self.prime = n + 1
+        while not _is_prime(self.prime):
+            self.prime += 1
+        factors = _prime_factors(self.prime - 1)
+        while True:
+            g = rng.randrange(2, self.prime)
+            if all(pow(g, (self.prime - 1) // q, self.prime) != 1 for q in factors):
+                break
+        self.generator = g
+        self.start = rng.randrange(1, self.prime)
+    
+    def __len__(self):
+        return self.n
+    
+    def __iter__(self) -> Iterator[int]:
+        if self.order is not None:
+            yield from self.order
+            return
+        p, g, n = self.prime, self.generator, self.n
+        x = self.start
+        for _ in range(p - 1):
+            if x <= n:
+                yield x - 1
+            x = x * g % p
+
+
+class TargetSpace:
+    """
+    Lazy (host, port) target space.
+
+    Pair i maps to hosts[i % len(hosts)] and ports[i // len(hosts)], so the
+    sequential order already interleaves hosts; with randomize the indices
+    are drawn from a CyclicPermutation. Nothing is materialised, so memory
+    stays flat for any scan size. With shards > 1 only the pairs whose index
+    is congruent to shard modulo shards are produced, so that many workers
+    can split one space between them without coordinating.
+    """
+    
+    def __init__(self, hosts: Sequence, ports: Sequence[int],
+                 randomize: bool = True, seed: Optional[int] = None,
+                 shard: int = 0, shards: int = 1):
+        self.hosts = hosts
+        self.ports = ports
+        self.randomize = randomize
+        self.seed = seed
+        self.shard = shard
+        self.shards = max(1, shards)
+    
+    def __len__(self):
+        total = len(self.hosts) * len(self.ports)
+        return max(0, (total - self.shard + self.shards - 1) // self.shards)
+    
+    def __iter__(self) -> Iterator[Tuple[object, int]]:
+        hosts, ports = self.hosts, self.ports
+        host_count = len(hosts)
+        shard, shards = self.shard, self.shards
+        if self.randomize:
+            indices = iter(CyclicPermutation(len(self), self.seed))
+        else:
+            indices = iter(range(len(self)))
+        for j in indices:
+            i = shard + j * shards
+            yield hosts[i % host_count], ports[i // host_count]
+    
+    def shard_load(self) -> int:
+        """Number of shards that probe any one host, for splitting per-host caps"""
+        return self.shards // math.gcd(len(self.hosts), self.shards) if self.hosts else 0
+
+
+class HostStream:
+    """
+    Async (host, port) target stream for hosts that arrive during the scan.
+
+    Each added host gets its own walk over the ports (a CyclicPermutation
+    when randomizing) and pairs are drawn round-robin across active hosts,
+    so a newly discovered host is probed right away and load stays spread
+    as with TargetSpace. A host can be given its own port list, and ports
+    listed in `first` are probed before the rest. A host's order is seeded
+    from its address, not from when it arrived, so it is the same in every
+    run with the same seed. Iteration waits for more hosts until close().
+    """
+    
+    def __init__(self, ports: Sequence[int], randomize: bool = True,
+                 seed: Optional[int] = None):
+        self.ports = ports
+        self.randomize = randomize
+        self.seed = seed
+        self._active: deque = deque()  # (host, iterator over port numbers)
+        self._closed = False
+        self._changed = asyncio.Event()
+    
+    def add(self, host, ports: Optional[Sequence[int]] = None,
+            first: Sequence[int] = ()) -> int:
+        """Queue a host for scanning; returns how many probes it will get"""
+        ports = self.ports if ports is None else ports
+        if self.randomize:
+            seed = None
+            if self.seed is not None:
+                seed = self.seed + zlib.crc32(str(getattr(host, 'ip', host)).encode())
+            order = iter(CyclicPermutation(len(ports), seed))
+        else:
+            order = iter(range(len(ports)))
+        
+        first = list(dict.fromkeys(first))
+        if first:
+            skip = set(first)
+            numbers = itertools.chain(first, (ports[i] for i in order if ports[i] not in skip))
+            count = len(first) + len(ports) - sum(1 for port in first if port in ports)
+        else:
+            numbers = (ports[i] for i in order)
+            count = len(ports)
+        if count:
+            self._active.append((host, numbers))
+            self._changed.set()
+        return count
+    
+    def close(self):
+        """No more hosts will be added; iteration ends once all are drained"""
+        self._closed = True
+        self._changed.set()
+    
+    def __aiter__(self):
+        return self
+    
+    async def __anext__(self) -> Tuple[object, int]:
+        while True:
+            while self._active:
+                host, numbers = self._active[0]
+                port = next(numbers, None)
+                if port is None:
+                    self._active.popleft()
+                    continue
+                self._active.rotate(-1)
+                return host, port
+            if self._closed:
+                raise StopAsyncIteration
+            self._changed.clear()
+            await self._changed.wait()
+
+
+# ============================================================================
+# ADAPTIVE TIMING
+# ============================================================================
+
+@dataclass
+class TimingProfile:
+    """Probe timeout bounds and retransmission budget for a timing template"""
+    initial_rtt_timeout: float  # used until a round trip has been measured
+    min_rtt_timeout: float
+    max_rtt_timeout: float
+    max_retries: int  # extra attempts for probes that time out
+
+
+# Named profiles, loosely following nmap's -T templates
+TIMING_PROFILES = {
+    'polite': TimingProfile(2.0, 0.25, 10.0, 4),
+    'normal': TimingProfile(1.0, 0.1, 5.0, 2),
+    'aggressive': TimingProfile(0.5, 0.1, 1.25, 1),
+    'insane': TimingProfile(0.25, 0.05, 0.3, 0),
+}
+
+
+class RttEstimator:
+    """Smoothed round-trip time and variance (RFC 6298)"""
+    
+    ALPHA = 1 / 8
+    BETA = 1 / 4
+    
+    def __init__(self):
+        self.srtt: Optional[float] = None
+        self.rttvar: Optional[float] = None
+    
+    def update(self, rtt: float):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - self.BETA) * self.rttvar + self.BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - self.ALPHA) * self.srtt + self.ALPHA * rtt
+    
+    def timeout(self) -> Optional[float]:
+        """Retransmission timeout, or None before the first sample"""
+        if self.srtt is None:
+            return None
+        return self.srtt + 4 * self.rttvar
+
+
+class AdaptiveTiming:
+    """
+    Per-host probe timeouts learned from completed connects.
+
+    Every accepted or refused connect is an RTT sample for its host. Hosts
+    that have not answered yet fall back to the scan-wide estimate, then to
+    the profile's initial timeout. A fixed timeout disables adaptation.
+    """
+    
+    def __init__(self, profile: TimingProfile, fixed_timeout: Optional[float] = None,
+                 max_retries: Optional[int] = None):
+        self.profile = profile
+        self.fixed_timeout = fixed_timeout
+        self.max_retries = profile.max_retries if max_retries is None else max_retries
+        self.hosts: Dict[str, RttEstimator] = {}
+        self.scan_wide = RttEstimator()
+    
+    def timeout(self, ip: str) -> float:
+        if self.fixed_timeout is not None:
+            return self.fixed_timeout
+        host = self.hosts.get(ip)
+        estimate = host.timeout() if host else None
+        if estimate is None:
+            estimate = self.scan_wide.timeout()
+        if estimate is None:
+            return self.profile.initial_rtt_timeout
+        return min(max(estimate, self.profile.min_rtt_timeout), self.profile.max_rtt_timeout)
+    
+    def record(self, ip: str, rtt: float):
+        host = self.hosts.get(ip)
+        if host is None:
+            host = self.hosts[ip] = RttEstimator()
+        host.update(rtt)
+        self.scan_wide.update(rtt)
+
+
+# ============================================================================
+# CONNECTION SCHEDULER
+# ============================================================================
+
+# errno values that mean "we ran out of sockets", not "the port is closed"
+RESOURCE_ERRNOS = {errno.EMFILE, errno.ENFILE, errno.ENOBUFS}
+
+PROBES = ['socket', 'stream']
+EVENT_LOOPS = ['auto', 'asyncio', 'uvloop']
+
+# SO_LINGER on, timeout 0: close() sends RST and skips TIME_WAIT
+LINGER_RESET = struct.pack('ii', 1, 0)
+
+
+def install_event_loop(name: str = 'auto') -> str:
+    """
+    Make asyncio.run() use the requested event loop; returns the one in use.
+
+    'auto' picks uvloop when it is installed. uvloop is an optional
+    dependency and is only imported here.
+    """
+    if name not in EVENT_LOOPS:
+        raise ValueError(f"Unknown event loop: {name}")
+    if name == 'asyncio':
+        asyncio.set_event_loop_policy(None)
+        return 'asyncio'
+    try:
+        import uvloop
+    except ImportError:
+        if name == 'uvloop':
+            raise
+        asyncio.set_event_loop_policy(None)
+        return 'asyncio'
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return 'uvloop'
+
+
+FD_RESERVE = 64          # descriptors kept back for stdio, DNS, exports, ...
+DEFAULT_FD_BUDGET = 1024  # used where RLIMIT_NOFILE does not exist (Windows)
+MAX_AUTO_BUDGET = 4096    # auto-sizing never goes beyond this
+
+
+def connection_budget(requested: Optional[int] = None, reserved: int = 0) -> int:
+    """
+    Return how many connects may be in flight at once across the whole scan.
+
+    The ceiling is derived from the process open-file limit so a scan can
+    never exhaust RLIMIT_NOFILE; `reserved` descriptors held by other
+    stages (the service prober) come off it too. An explicit request is
+    clamped to it.
+    """
+    try:
+        import resource
+        soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft == resource.RLIM_INFINITY:
+            ceiling = MAX_AUTO_BUDGET
+        else:
+            ceiling = soft - FD_RESERVE - reserved
+    except (ImportError, ValueError, OSError):
+        ceiling = DEFAULT_FD_BUDGET - reserved
+    ceiling = max(1, ceiling)
+    
+    if requested:
+        return max(1, min(requested, ceiling))
+    return min(ceiling, MAX_AUTO_BUDGET)
+
+
+class _AsyncWork:
+    """Share one plain iterator between the scheduler's workers"""
+    
+    def __init__(self, items: Iterable):
+        self._items = iter(items)
+    
+    def __aiter__(self):
+        return self
+    
+    async def __anext__(self):
+        try:
+            return next(self._items)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class ConnectionScheduler:
+    """
+    Scan-wide connection scheduler.
+
+    A fixed pool of workers pulls (device, port) items from one work stream,
+    so the number of sockets in flight never exceeds the global budget no
+    matter how many hosts are scanned. A per-host semaphore separately caps
+    how hard any single device is hit.
+    """
+    
+    def __init__(self, probe: Callable, max_in_flight: int, max_per_host: int):
+        self.probe = probe
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_per_host = max(1, max_per_host)
+        self._host_slots: Dict[str, asyncio.Semaphore] = {}
+    
+    def _host_slot(self, ip: str) -> asyncio.Semaphore:
+        slot = self._host_slots.get(ip)
+        if slot is None:
+            slot = self._host_slots[ip] = asyncio.Semaphore(self.max_per_host)
+        return slot
+    
+    async def _probe(self, ip: str, port: int) -> Optional[Port]:
+        """Run one probe, backing off instead of dropping it on fd exhaustion"""
+        delay = 0.05
+        while True:
+            try:
+                return await self.probe(ip, port)
+            except OSError as e:
+                if e.errno not in RESOURCE_ERRNOS:
+                    return None
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 1.0)
+    
+    async def run(self, work: Union[Iterable[Tuple[Device, int]], AsyncIterator[Tuple[Device, int]]],
+                  on_done: Optional[Callable[[Device, int], None]] = None,
+                  size_hint: Optional[int] = None,
+                  on_open: Optional[Callable[[Device, Port], None]] = None):
+        """
+        Drain the work stream through the worker pool.
+
+        work is either a plain iterable or an async iterator such as a
+        HostStream that keeps producing while the scan runs. Open ports are
+        appended to their device as they are found (and passed to on_open);
+        on_done is called with the device and port of every finished probe
+        so callers can track host completion.
+        """
+        items = work if hasattr(work, '__anext__') else _AsyncWork(work)
+        
+        async def worker():
+            async for device, port in items:
+                async with self._host_slot(device.ip):
+                    result = await self._probe(device.ip, port)
+                if result is not None:
+                    device.ports.append(result)
+                    if on_open:
+                        on_open(device, result)
+                if on_done:
+                    on_done(device, port)
+        
+        pool_size = self.max_in_flight
+        if size_hint is not None:
+            pool_size = max(1, min(pool_size, size_hint))
+        
+        workers = [asyncio.create_task(worker()) for _ in range(pool_size)]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+
+
+# ============================================================================
+# SYN SCAN ENGINE
+# ============================================================================
+
+TCP_SYN, TCP_RST, TCP_ACK = 0x02, 0x04, 0x10
+
+
+def _checksum(data: bytes) -> int:
+    """RFC 1071 internet checksum"""
+    if len(data) % 2:
+        data += b'\0'
+    total = sum(struct.unpack(f'!{len(data) // 2}H', data))
+    while total >> 16:
+        total = (total & 0xFFFF) + (total >> 16)
+    return ~total & 0xFFFF
+
+
+class SynScanEngine:
+    """
+    Half-open (SYN) port scan engine.
+
+    Crafted SYNs go out in batches while a single receiver matches SYN/ACK
+    (open) and RST (closed) replies back to their target. Each SYN carries a
+    keyed sequence-number cookie, so stray traffic can't be mistaken for an
+    answer and no per-probe state is kept. No connection is ever completed:
+    open ports cost neither a file descriptor nor a TIME_WAIT entry.
+
+    On Linux one raw IPPROTO_TCP socket both sends hand-built segments and
+    receives the replies, which keeps up with line rate far better than
+    dissecting every frame in Scapy. Elsewhere Scapy sends the SYNs and an
+    AsyncSniffer collects the replies. Requires raw-socket privileges.
+    """
+    
+    def __init__(self, batch_size: int = 256, rate: Optional[int] = None,
+                 retries: int = 1, wait: float = 1.0):
+        self.batch_size = max(1, batch_size)
+        self.rate = rate
+        self.retries = retries
+        self.wait = wait
+        self.sport = random.randint(40000, 60000)
+        self._secret = random.getrandbits(32)
+        self._answers: Dict[Tuple[str, int], str] = {}
+        self._lock = threading.Lock()
+        self._source_ips: Dict[str, bytes] = {}
+    
+    def _cookie(self, ip: str, port: int) -> int:
+        return zlib.crc32(f"{ip}:{port}".encode(), self._secret) & 0xFFFFFFFF
+    
+    def _record(self, ip: str, sport: int, dport: int, ack: int, flags: int):
+        """Match one received TCP segment against the probes in flight"""
+        if dport != self.sport:
+            return
+        if ack != (self._cookie(ip, sport) + 1) & 0xFFFFFFFF:
+            return
+        if flags & (TCP_SYN | TCP_ACK) == TCP_SYN | TCP_ACK:
+            state = 'open'
+        elif flags & TCP_RST:
+            state = 'closed'
+        else:
+            return
+        with self._lock:
+            self._answers.setdefault((ip, sport), state)
+    
+    # -- Linux raw-socket path ------------------------------------------------
+    
+    def _source_ip(self, ip: str) -> bytes:
+        """Local address the kernel will use towards ip (for the checksum)"""
+        src = self._source_ips.get(ip)
+        if src is None:
+            probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            try:
+                probe.connect((ip, 9))  # no packet is sent for UDP connect
+                src = socket.inet_aton(probe.getsockname()[0])
+            finally:
+                probe.close()
+            self._source_ips[ip] = src
+        return src
+    
+    def _build_syn(self, ip: str, port: int) -> bytes:
+        header = struct.pack('!HHIIBBHHH', self.sport, port, self._cookie(ip, port), 0,
+                             5 << 4, TCP_SYN, 65535, 0, 0)
+        pseudo = self._source_ip(ip) + socket.inet_aton(ip) + struct.pack('!BBH', 0, 6, len(header))
+        checksum = _checksum(pseudo + header)
+        return header[:16] + struct.pack('!H', checksum) + header[18:]
+    
+    def _receive_raw(self, sock, stop: threading.Event):
+        while not stop.is_set():
+            try:
+                data = sock.recv(65535)
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            ihl = (data[0] & 0x0F) * 4
+            if len(data) < ihl + 14:
+                continue
+            sport, dport, _, ack = struct.unpack_from('!HHII', data, ihl)
+            self._record(socket.inet_ntoa(data[12:16]), sport, dport, ack, data[ihl + 13])
+    
+    # -- Portable Scapy path --------------------------------------------------
+    
+    def _on_packet(self, packet):
+        if IP in packet and TCP in packet:
+            tcp = packet[TCP]
+            self._record(packet[IP].src, tcp.sport, tcp.dport, tcp.ack, int(tcp.flags))
+    
+    # -------------------------------------------------------------------------
+    
+    def _send_round(self, send: Callable[[str, int], None],
+                    targets: Iterable[Tuple[object, int]]) -> int:
+        """Send one SYN to every target that has not answered yet"""
+        interval = self.batch_size / self.rate if self.rate else 0
+        sent = 0
+        started = time.monotonic()
+        for device, port in targets:
+            if (device.ip, port) in self._answers:
+                continue
+            send(device.ip, port)
+            sent += 1
+            if sent % self.batch_size == 0:
+                if interval:
+                    remaining = interval - (time.monotonic() - started)
+                    if remaining > 0:
+                        time.sleep(remaining)
+                else:
+                    time.sleep(0)  # let the receiver thread drain the socket
+                started = time.monotonic()
+        return sent
+    
+    def _run_rounds(self, send: Callable[[str, int], None],
+                    targets: Iterable[Tuple[object, int]]):
+        for _ in range(self.retries + 1):
+            if not self._send_round(send, targets):
+                break  # everything has answered
+            time.sleep(self.wait)
+    
+    def run(self, targets: Iterable[Tuple[object, int]],
+            ifaces: Optional[List[str]] = None) -> Dict[Tuple[str, int], str]:
+        """
+        Probe every (device, port) target; blocking.
+
+        Targets are iterated once per round, unanswered ones being resent up
+        to `retries` times. `ifaces` are the interfaces to sniff on for the
+        Scapy path. Returns {(ip, port): 'open' | 'closed'} for every target
+        that answered; silent targets are filtered.
+        """
+        if sys.platform.startswith('linux'):
+            self._run_raw(targets)
+        else:
+            self._run_scapy(targets, ifaces)
+        return dict(self._answers)
+    
+    def _run_raw(self, targets):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_TCP)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 << 20)
+        sock.settimeout(0.1)
+        stop = threading.Event()
+        receiver = threading.Thread(target=self._receive_raw, args=(sock, stop), daemon=True)
+        receiver.start()
+        
+        def send(ip, port):
+            try:
+                sock.sendto(self._build_syn(ip, port), (ip, 0))
+            except OSError as e:
+                if e.errno not in (errno.ENOBUFS, errno.EAGAIN, errno.EHOSTUNREACH,
+                                   errno.ENETUNREACH, errno.EPERM):
+                    raise
+        
+        try:
+            self._run_rounds(send, targets)
+        finally:
+            stop.set()
+            receiver.join()
+            sock.close()
+    
+    def _run_scapy(self, targets, ifaces):
+        ready = threading.Event()
+        sniffer = AsyncSniffer(prn=self._on_packet, store=False, iface=ifaces or None,
+                               lfilter=lambda p: TCP in p and p[TCP].dport == self.sport,
+                               started_callback=ready.set)
+        sniffer.start()
+        ready.wait(timeout=2.0)
+        sock = conf.L3socket()
+        
+        def send(ip, port):
+            sock.send(IP(dst=ip) / TCP(sport=self.sport, dport=port, flags='S',
+                                       seq=self._cookie(ip, port)))
+        
+        try:
+            self._run_rounds(send, targets)
+        finally:
+            sock.close()
+            sniffer.stop()
 
 
 # ============================================================================
@@ -109,23 +950,92 @@ class ScanConfig:
 class NetworkScanner:
     """Core network scanning engine"""
     
+    PIPELINE_QUEUE_SIZE = 256  # devices buffered between pipeline stages
+    
     def __init__(self, config: ScanConfig):
         self.config = config
-        self.devices: List[Device] = []
-        self.mac_lookup = None
-        
-        if MAC_LOOKUP_AVAILABLE:
+        self.devices: List[Device] = []  # hosts being worked on
+        self.results = ResultStore()  # finished hosts
+        self.vendors = VendorDB()
+        self.timing = AdaptiveTiming(TIMING_PROFILES[config.timing],
+                                     fixed_timeout=config.timeout,
+                                     max_retries=config.max_retries)
+        self.resolver = HostnameResolver(max_concurrent=config.dns_concurrency,
+                                         timeout=config.dns_timeout)
+        self.store = ScanStore(config.db_path) if config.db_path else None
+        self.metrics = ScanMetrics()
+        self.prober = None
+        if config.service_detection:
+            # Fingerprinting connections come out of the same fd budget as
+            # the scan's: at most half of it, the rest is left to the scan
+            self.prober = ServiceProber(max_concurrent=min(config.service_concurrency,
+                                                           max(1, connection_budget() // 2)))
+        self.udp = None
+        if config.udp:
+            self.udp = UdpScanner(rate=config.udp_rate, retries=self.timing.max_retries,
+                                  wait=config.timeout or self.timing.profile.initial_rtt_timeout)
+    
+    def use_arp(self) -> bool:
+        """Whether discovery ARP-sweeps; 'auto' needs Scapy and, on Linux, raw-socket access"""
+        if self.config.discovery != 'auto':
+            return self.config.discovery == 'arp'
+        if not SCAPY_AVAILABLE:
+            return False
+        if sys.platform.startswith('linux'):
             try:
-                self.mac_lookup = MacLookup()
-                # Update vendor database
-                self.mac_lookup.update_vendors()
-            except:
-                self.mac_lookup = None
+                socket.socket(socket.AF_PACKET, socket.SOCK_RAW).close()
+            except PermissionError:
+                return False
+        return True
+    
+    def discover_hosts(self, resolve_hostnames: bool = True) -> List[Device]:
+        """Discover hosts by ARP sweep, or by ping sweep without raw-socket access"""
+        if self.use_arp():
+            return self.discover_hosts_arp(resolve_hostnames)
+        return asyncio.run(self.discover_hosts_ping(resolve_hostnames))
+    
+    def scan_budget(self, requested: Optional[int] = None) -> int:
+        """Connects the scan may have in flight, after the service prober's share of the fd limit"""
+        return connection_budget(requested or self.config.max_concurrent,
+                                 reserved=self.prober.max_concurrent if self.prober else 0)
+    
+    def ping_sweeper(self) -> PingSweeper:
+        ports = parse_port_spec(self.config.ping_ports)
+        budget = self.scan_budget()
+        return PingSweeper(ports, timeout=self.config.timeout or self.timing.profile.initial_rtt_timeout,
+                           max_hosts=max(1, budget // (len(ports) + 1)))
+    
+    async def discover_hosts_ping(self, resolve_hostnames: bool = True) -> List[Device]:
+        """
+        Discover hosts without raw sockets: TCP connects and unprivileged ICMP
+        echoes to every address (see PingSweeper), MACs from the neighbour
+        table. Hosts behind a router are found too, without a MAC.
+        """
+        console.print(f"[cyan]Starting ping sweep on {self.config.network}...[/cyan]")
+        with self.metrics.stage('ping'):
+            replies = await self.ping_sweeper().sweep([self.config.network])
+        
+        devices = []
+        with self.metrics.stage('vendor'):
+            for reply in sorted(replies, key=lambda r: ipaddress.ip_address(r.ip)):
+                devices.append(Device(ip=reply.ip, mac=reply.mac,
+                                      vendor=self.vendors.lookup(reply.mac) or "Unknown"))
+        
+        self.devices = devices
+        self.metrics.count('hosts_discovered', len(devices))
+        console.print(f"[green]✓ Discovered {len(devices)} devices[/green]")
+        
+        if resolve_hostnames:
+            await self.resolve_hostnames()
+        return devices
     
-    def discover_hosts_arp(self) -> List[Device]:
+    def discover_hosts_arp(self, resolve_hostnames: bool = True) -> List[Device]:
         """
         Discover hosts using ARP scanning (most reliable for local networks)
         Requires: Scapy library and appropriate permissions
+
+        Pass resolve_hostnames=False to leave reverse DNS to a later,
+        concurrent stage (see scan_all_devices).
         """
         if not SCAPY_AVAILABLE:
             console.print("[yellow]ARP scanning requires Scapy library[/yellow]")
@@ -134,43 +1044,30 @@ class NetworkScanner:
         try:
             console.print(f"[cyan]Starting ARP scan on {self.config.network}...[/cyan]")
             
-            # Create ARP request packet
-            arp = ARP(pdst=self.config.network)
-            ether = Ether(dst="ff:ff:ff:ff:ff:ff")
-            packet = ether/arp
-            
-            # Send packet and receive responses
-            result = srp(packet, timeout=3, verbose=0)[0]
+            # Paced, chunked sweep that ends once replies stop coming in
+            sweeper = ArpSweeper(timeout=self.config.arp_timeout, rate=self.config.arp_rate,
+                                 retries=self.config.arp_retries)
+            with self.metrics.stage('arp'):
+                replies = sweeper.sweep([self.config.network])
             
             devices = []
-            for sent, received in result:
-                device = Device(ip=received.psrc, mac=received.hwsrc)
-                
-                # Get MAC vendor
-                if self.mac_lookup:
-                    try:
-                        device.vendor = self.mac_lookup.lookup(device.mac)
-                    except:
-                        device.vendor = "Unknown"
-                elif NETADDR_AVAILABLE:
-                    try:
-                        mac = EUI(device.mac)
-                        device.vendor = mac.oui.registration().org
-                    except:
-                        device.vendor = "Unknown"
-                
-                # Get hostname
-                try:
-                    device.hostname = socket.gethostbyaddr(device.ip)[0]
-                except:
-                    device.hostname = None
-                
-                devices.append(device)
+            with self.metrics.stage('vendor'):
+                for reply in sorted(replies, key=lambda r: ipaddress.ip_address(r.ip)):
+                    device = Device(ip=reply.ip, mac=reply.mac)
+                    
+                    # Get MAC vendor (offline index, no network access)
+                    device.vendor = self.vendors.lookup(device.mac) or "Unknown"
+                    
+                    devices.append(device)
             
             self.devices = devices
+            self.metrics.count('hosts_discovered', len(devices))
             console.print(f"[green]✓ Discovered {len(devices)} devices[/green]")
-            return devices
             
+            if resolve_hostnames:
+                asyncio.run(self.resolve_hostnames())
+            return devices
+        
         except PermissionError:
             console.print("[red]ERROR: ARP scanning requires administrator privileges[/red]")
             console.print("[yellow]Run Command Prompt as Administrator[/yellow]")
@@ -179,71 +1076,648 @@ class NetworkScanner:
             console.print(f"[red]ARP scan failed: {e}[/red]")
             return []
     
-    async def scan_port(self, ip: str, port: int) -> Port:
-        """Async port scanner"""
+    def collect(self, devices: Iterable[Device]) -> List[HostRecord]:
+        """Add finished devices to the results"""
+        return self.results.extend(device.to_dict() for device in devices)
+    
+    async def resolve_hostnames(self, devices: Optional[List[Device]] = None):
+        """Reverse-resolve device hostnames concurrently (cached across runs)"""
+        if not self.config.resolve_hostnames:
+            return
+        with self.metrics.stage('dns'):
+            await self.resolver.resolve_devices(self.devices if devices is None else devices)
+    
+    async def scan_port(self, ip: str, port: int) -> Optional[Port]:
+        """
+        Async port scanner
+
+        The connect timeout comes from the host's measured RTT and probes
+        that time out are retried up to the profile's retry budget. Returns
+        None for closed/filtered ports. Running out of file descriptors is
+        re-raised so the scheduler can retry the probe. Every probe's
+        outcome and duration are recorded in self.metrics. config.probe
+        picks the connect path (see connect_socket and connect_stream).
+        """
+        loop = asyncio.get_running_loop()
+        metrics = self.metrics
+        connect = self.connect_stream if self.config.probe == 'stream' else self.connect_socket
+        probe_started = loop.time()
+        outcome = 'timeout'
+        metrics.probe_started()
+        
         try:
-            reader, writer = await asyncio.wait_for(
-                asyncio.open_connection(ip, port),
-                timeout=self.config.timeout
-            )
-            writer.close()
-            await writer.wait_closed()
-            
-            # Try to get service name
-            try:
-                service = socket.getservbyport(port)
-            except:
-                service = "unknown"
+            for attempt in range(self.timing.max_retries + 1):
+                started = loop.time()
+                try:
+                    await asyncio.wait_for(connect(loop, ip, port), timeout=self.timing.timeout(ip))
+                except asyncio.TimeoutError:
+                    continue  # no answer: retransmit
+                except ConnectionRefusedError:
+                    # An RST is as good an RTT sample as a SYN/ACK
+                    self.timing.record(ip, loop.time() - started)
+                    outcome = 'refused'
+                    return None
+                except OSError as e:
+                    if e.errno in RESOURCE_ERRNOS:
+                        outcome = 'emfile'
+                        raise
+                    outcome = 'error'
+                    return None
+                
+                self.timing.record(ip, loop.time() - started)
+                outcome = 'open'
+                return Port(number=port, state='open', service=self.service_name(port))
             
-            return Port(number=port, state='open', service=service)
-        except (asyncio.TimeoutError, ConnectionRefusedError, OSError):
             return None
+        finally:
+            metrics.probe_finished(outcome, loop.time() - probe_started)
     
-    async def scan_device_ports(self, device: Device):
-        """Scan all ports for a device"""
-        # Parse port range
-        if '-' in self.config.ports:
-            start, end = map(int, self.config.ports.split('-'))
-            ports = range(start, end + 1)
+    @staticmethod
+    async def connect_socket(loop: asyncio.AbstractEventLoop, ip: str, port: int):
+        """
+        Lean connect probe: a bare non-blocking socket and loop.sock_connect.
+
+        Nothing but the socket and the loop's own future is allocated, and
+        an established connection is reset (SO_LINGER 0) instead of closed
+        gracefully, so open ports leave no TIME_WAIT entry behind.
+        """
+        sock = socket.socket(socket.AF_INET6 if ':' in ip else socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            sock.setblocking(False)
+            await loop.sock_connect(sock, (ip, port))
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, LINGER_RESET)
+        finally:
+            sock.close()
+    
+    @staticmethod
+    async def connect_stream(loop: asyncio.AbstractEventLoop, ip: str, port: int):
+        """Connect probe through asyncio streams, closing the connection gracefully"""
+        reader, writer = await asyncio.open_connection(ip, port)
+        writer.close()
+        await writer.wait_closed()
+    
+    @staticmethod
+    def service_name(port: int) -> str:
+        """Best-effort service name for a port number (precomputed table)"""
+        return service_for_port(port)
+    
+    async def identify_service(self, ip: str, port: Port):
+        """Banner-grab an open port and fill in its service and version"""
+        if self.prober is None:
+            return
+        with self.metrics.stage('fingerprint'):
+            port.service, port.version = await self.prober.identify(ip, port.number)
+    
+    async def identify_services(self, devices: List[Device]):
+        """Fingerprint every open port on the given devices concurrently"""
+        if self.prober is None:
+            return
+        await asyncio.gather(*(self.identify_service(device.ip, port)
+                               for device in devices for port in device.ports
+                               if port.state == 'open' and port.protocol == 'tcp'))
+    
+    def parse_udp_ports(self) -> PortList:
+        """Parse the configured UDP port specification"""
+        return parse_port_spec(self.config.udp_ports)
+    
+    async def udp_scan_device(self, device: Device):
+        """UDP-scan one device, adding the ports that answered as open udp Ports"""
+        ports = self.parse_udp_ports()
+        self.metrics.count('udp_probes', len(ports))
+        with self.metrics.stage('udp_scan'):
+            answers = await self.udp.scan(device.ip, ports)
+        for number, (state, reply) in sorted(answers.items()):
+            if state == 'open':
+                service, version = identify_udp(number, reply)
+                device.ports.append(Port(number=number, state='open', service=service,
+                                         version=version, protocol='udp'))
+        found = len(device.get_open_ports('udp'))
+        self.metrics.count('udp_open', found)
+        if found:
+            console.print(f"[green]✓ {device.ip}: Found {found} open UDP ports[/green]")
+    
+    async def udp_scan_devices(self, devices: List[Device]):
+        """UDP-scan several devices concurrently over the shared socket"""
+        try:
+            await asyncio.gather(*(self.udp_scan_device(device) for device in devices))
+        finally:
+            self.udp.close()
+    
+    async def syn_scan_devices(self, devices: List[Device], targets: 'TargetSpace') -> bool:
+        """
+        Run the SYN engine over the target space.
+
+        Returns False (after printing why) when raw sockets are unavailable,
+        so the caller can fall back to connect scanning.
+        """
+        if not SCAPY_AVAILABLE:
+            console.print("[yellow]SYN scanning requires Scapy library, using connect scan[/yellow]")
+            return False
+        
+        load_scapy()
+        profile = self.timing.profile
+        engine = SynScanEngine(
+            batch_size=self.config.syn_batch_size,
+            rate=self.config.syn_rate,
+            retries=self.timing.max_retries,
+            wait=self.config.timeout or profile.initial_rtt_timeout,
+        )
+        ifaces = sorted({conf.route.route(device.ip)[0] for device in devices})
+        loop = asyncio.get_running_loop()
+        try:
+            answers = await loop.run_in_executor(None, engine.run, targets, ifaces)
+        except PermissionError:
+            console.print("[red]ERROR: SYN scanning requires administrator privileges[/red]")
+            console.print("[yellow]Falling back to connect scan[/yellow]")
+            return False
+        
+        open_ports: Dict[str, List[Port]] = {}
+        for (ip, port), state in answers.items():
+            if state == 'open':
+                open_ports.setdefault(ip, []).append(
+                    Port(number=port, state='open', service=self.service_name(port)))
+        for device in devices:
+            device.ports.extend(open_ports.get(device.ip, []))
+        return True
+    
+    def parse_ports(self) -> PortList:
+        """Parse the configured port specification"""
+        return parse_port_spec(self.config.ports, self.config.exclude_ports)
+    
+    def _report_device(self, device: Device):
+        self.metrics.count('hosts_finished')
+        device.ports.sort(key=lambda p: (p.protocol, p.number))
+        found = len(device.get_open_ports())
+        if found:
+            console.print(f"[green]✓ {device.ip}: Found {found} open ports[/green]")
         else:
-            ports = [int(p) for p in self.config.ports.split(',')]
+            console.print(f"[yellow]○ {device.ip}: No open ports found[/yellow]")
+    
+    async def scan_devices_ports(self, devices: List[Device]):
+        """
+        Scan the configured ports on several devices through one scheduler.
+
+        (host, port) pairs are drawn lazily from a TargetSpace, spread across
+        hosts so the per-host cap never stalls the worker pool behind a
+        single device.
+        """
+        ports = self.parse_ports()
+        remaining: Dict[int, int] = {}
         
-        console.print(f"[cyan]Scanning {device.ip}...[/cyan]")
+        for device in devices:
+            console.print(f"[cyan]Scanning {device.ip}...[/cyan]")
+            device.ports = []
+            remaining[id(device)] = len(ports)
+            if not ports:
+                self._report_device(device)
         
-        # Create tasks with concurrency limit
-        semaphore = asyncio.Semaphore(self.config.max_concurrent)
+        targets = TargetSpace(devices, ports,
+                              randomize=self.config.randomize,
+                              seed=self.config.seed)
+        self.metrics.count('probes_planned', len(targets))
         
-        async def scan_with_semaphore(port):
-            async with semaphore:
-                return await self.scan_port(device.ip, port)
+        def on_done(device: Device, port: int):
+            remaining[id(device)] -= 1
+            if remaining[id(device)] == 0:
+                self._report_device(device)
         
-        tasks = [scan_with_semaphore(port) for port in ports]
-        results = await asyncio.gather(*tasks)
+        if self.config.scan_type == 'syn':
+            if await self.syn_scan_devices(devices, targets):
+                for device in devices:
+                    self._report_device(device)
+                await self.identify_services(devices)
+                return
         
-        # Filter out None results (closed ports)
-        device.ports = [r for r in results if r is not None]
+        if self.config.workers > 1 and len(targets) > 1:
+            await self.scan_devices_sharded(devices, ports)
+            for device in devices:
+                self._report_device(device)
+            return
         
-        if device.ports:
-            console.print(f"[green]✓ {device.ip}: Found {len(device.ports)} open ports[/green]")
-        else:
-            console.print(f"[yellow]○ {device.ip}: No open ports found[/yellow]")
+        await self.probe_targets(targets, on_done=on_done)
+    
+    async def probe_targets(self, targets: TargetSpace,
+                            on_done: Optional[Callable[[Device, int], None]] = None,
+                            max_in_flight: Optional[int] = None, max_per_host: Optional[int] = None):
+        """Connect-scan a target space, fingerprinting open ports while the scan continues"""
+        scheduler = ConnectionScheduler(
+            self.scan_port,
+            max_in_flight=self.scan_budget(max_in_flight),
+            max_per_host=max_per_host or self.config.max_per_host,
+        )
+        fingerprints: List[asyncio.Future] = []
+        
+        def on_open(device: Device, port: Port):
+            if self.prober is not None:
+                fingerprints.append(asyncio.ensure_future(self.identify_service(device.ip, port)))
+        
+        with self.metrics.stage('port_scan'):
+            await scheduler.run(targets, on_done=on_done, size_hint=len(targets), on_open=on_open)
+        await asyncio.gather(*fingerprints)
     
-    async def scan_all_devices(self):
-        """Scan all discovered devices"""
+    async def scan_devices_sharded(self, devices: List[Device], ports: PortList):
+        """
+        Split the connect scan of several devices across worker processes.
+
+        Each of config.workers processes runs its own event loop over one
+        shard of the (host, port) target space, with its own fd budget, and
+        streams its metrics back every WORKER_REPORT_INTERVAL seconds, so the
+        live view keeps moving. Open ports found by the workers (already
+        fingerprinted there) are merged back into the given devices. The
+        per-host cap is divided among the shards probing each host, and an
+        explicit max_concurrent is divided among all of them.
+        """
+        shards = min(self.config.workers, len(devices) * len(ports))
+        space = TargetSpace(devices, ports, shards=shards)
+        max_per_host = -(-self.config.max_per_host // space.shard_load())
+        max_in_flight = None
+        if self.config.max_concurrent:
+            max_in_flight = -(-self.config.max_concurrent // shards)
+        hosts = [device.ip for device in devices]
+        
+        context = multiprocessing.get_context('spawn')
+        results = context.Queue()
+        workers = [context.Process(target=_scan_shard_worker, daemon=True,
+                                   args=(self.config, hosts, shard, shards, max_in_flight,
+                                         max_per_host, results))
+                   for shard in range(shards)]
+        for worker in workers:
+            worker.start()
+        
+        loop = asyncio.get_running_loop()
+        merged: Dict[int, ScanMetrics] = {}  # shard -> metrics merged so far
+        pending = set(range(shards))
+        try:
+            while pending:
+                try:
+                    kind, shard, payload, metrics = await loop.run_in_executor(
+                        None, results.get, True, WORKER_REPORT_INTERVAL)
+                except queue.Empty:
+                    for shard in pending:
+                        if workers[shard].exitcode:  # died without reporting
+                            raise RuntimeError(f"Scan worker {shard} exited with code "
+                                               f"{workers[shard].exitcode}")
+                    continue
+                self.metrics.merge(metrics, merged.get(shard))
+                merged[shard] = metrics
+                if kind == 'error':
+                    raise RuntimeError(f"Scan worker {shard} failed: {payload}")
+                if kind == 'done':
+                    for device, found in zip(devices, payload):
+                        device.ports.extend(Port(number=number, state='open', service=service,
+                                                 version=version)
+                                            for number, service, version in found)
+                    pending.discard(shard)
+        finally:
+            for worker in workers:
+                if worker.is_alive() and pending:
+                    worker.terminate()
+                worker.join()
+    
+    async def scan_device_ports(self, device: Device):
+        """Scan all ports for a device"""
+        await self.scan_devices_ports([device])
+    
+    async def scan_all_devices(self, resolve_hostnames: bool = False):
+        """
+        Scan all discovered devices
+
+        With resolve_hostnames, reverse DNS runs alongside the port scan
+        instead of before it.
+        """
         if not self.devices:
             console.print("[yellow]No devices to scan[/yellow]")
             return
         
         console.print(f"\n[cyan]Starting port scan on {len(self.devices)} devices...[/cyan]\n")
         
-        tasks = [self.scan_device_ports(device) for device in self.devices]
-        await asyncio.gather(*tasks)
+        stages = [self.scan_devices_ports(self.devices)]
+        if self.udp is not None:
+            stages.append(self.udp_scan_devices(self.devices))
+        if resolve_hostnames:
+            stages.append(self.resolve_hostnames())
+        await asyncio.gather(*stages)
     
-    def display_results(self):
-        """Display scan results in a nice table"""
-        if not self.devices:
+    async def scan_pipeline(self, on_result: Optional[Callable[[HostRecord], None]] = None) -> ResultStore:
+        """
+        Discover, enrich and port-scan hosts as one streaming pipeline.
+
+        The ARP sweep runs on a worker thread and hands over each reply as it
+        arrives (without raw-socket access a ping sweep on the loop does, see
+        use_arp). Enrichment looks up the vendor, starts reverse DNS in the
+        background and queues the device; the scan stage feeds it into a
+        HostStream drained by the connection scheduler, so a host's first
+        probes go out while the sweep is still running. on_result is called
+        with each device once its ports are scanned and its hostname is
+        resolved, and it is then moved into self.results. SYN scans and
+        scans sharded across worker processes need the full target list up
+        front and run after discovery instead.
+
+        With config.checkpoint, queued hosts, finished blocks of each host's
+        probes and finished hosts are journaled (see ScanJournal); with
+        config.resume, finished hosts are restored from the journal, partly
+        scanned ones only get their missing blocks probed, and the sweep is
+        skipped if it had completed.
+        """
+        started_at = time.time()
+        use_arp = self.use_arp()
+        if self.config.scan_type == 'syn' or self.config.workers > 1:
+            if use_arp:
+                found = self.discover_hosts_arp(resolve_hostnames=False)
+            else:
+                found = await self.discover_hosts_ping(resolve_hostnames=False)
+            if found:
+                await self.scan_all_devices(resolve_hostnames=True)
+                hosts = self.collect(self.devices)
+                self.devices = []
+                self.record_scan('full', started_at)
+                if on_result:
+                    for host in hosts:
+                        on_result(host)
+            return self.results
+        
+        loop = asyncio.get_running_loop()
+        # Fed from the sweep thread, which must never block on a full queue
+        # (the socket would drop replies); it holds at most one entry per host.
+        replies: asyncio.Queue = asyncio.Queue()
+        devices: asyncio.Queue = asyncio.Queue(maxsize=self.PIPELINE_QUEUE_SIZE)
+        ports = self.parse_ports()
+        journal = None
+        if self.config.checkpoint:
+            params = {'network': self.config.network, 'ports': str(ports),
+                      'randomize': self.config.randomize, 'seed': self.config.seed}
+            if self.udp is not None:
+                params['udp_ports'] = str(self.parse_udp_ports())
+            journal = ScanJournal(self.config.checkpoint, params, seed=self.config.seed,
+                                  resume=self.config.resume)
+        stream = HostStream(ports, randomize=self.config.randomize,
+                            seed=journal.seed if journal else self.config.seed)
+        tracker = BlockTracker(stream, journal) if journal else None
+        remaining: Dict[int, int] = {}
+        scanned: Dict[str, Tuple[Sequence[int], bool]] = {}  # ip -> (ports, full)
+        lookups: Dict[int, asyncio.Future] = {}  # id(device) -> reverse-DNS lookup
+        fingerprints: Dict[int, List[asyncio.Future]] = {}  # id(device) -> banner grabs
+        udp_scans: Dict[int, asyncio.Future] = {}  # id(device) -> UDP scan
+        emitting: List[asyncio.Future] = []
+        seen = set()  # IPs already queued or restored
+        swept = False
+        incremental = self.config.incremental and self.store is not None
+        
+        if journal is not None and journal.resumed:
+            for record in journal.hosts.values():
+                host = self.results.add(record)
+                seen.add(host.ip)
+                scanned[host.ip] = (ports, True)
+                self.metrics.count('hosts_discovered')
+                self.metrics.count('hosts_finished')
+                if on_result:
+                    on_result(host)
+            partial = [entry for ip, entry in journal.devices.items() if ip not in journal.hosts]
+            for entry in partial:
+                replies.put_nowait(ArpReply(ip=entry['ip'], mac=entry['mac'],
+                                            network=self.config.network))
+            console.print(f"[cyan]Resuming {self.config.checkpoint}: {len(journal.hosts)} hosts "
+                          f"finished, {len(partial)} partly scanned[/cyan]")
+        
+        async def discover():
+            nonlocal swept
+            if journal is not None and journal.discovered:
+                swept = True
+                replies.put_nowait(None)
+                return
+            if not use_arp:
+                await ping_sweep()
+                return
+            console.print(f"[cyan]Starting ARP scan on {self.config.network}...[/cyan]")
+            sweeper = ArpSweeper(timeout=self.config.arp_timeout, rate=self.config.arp_rate,
+                                 retries=self.config.arp_retries)
+            
+            def on_reply(reply):
+                loop.call_soon_threadsafe(replies.put_nowait, reply)
+            
+            try:
+                with self.metrics.stage('arp'):
+                    await loop.run_in_executor(None, sweeper.sweep, [self.config.network], on_reply)
+                swept = True
+            except PermissionError:
+                console.print("[red]ERROR: ARP scanning requires administrator privileges[/red]")
+                console.print("[yellow]Run Command Prompt as Administrator[/yellow]")
+            except Exception as e:
+                console.print(f"[red]ARP scan failed: {e}[/red]")
+            finally:
+                replies.put_nowait(None)
+        
+        async def ping_sweep():
+            nonlocal swept
+            console.print(f"[cyan]Starting ping sweep on {self.config.network}...[/cyan]")
+            
+            def on_reply(reply):
+                replies.put_nowait(ArpReply(ip=reply.ip, mac=reply.mac, network=self.config.network))
+            
+            try:
+                with self.metrics.stage('ping'):
+                    await self.ping_sweeper().sweep([self.config.network], on_reply)
+                swept = True
+            except Exception as e:
+                console.print(f"[red]Ping sweep failed: {e}[/red]")
+            finally:
+                replies.put_nowait(None)
+        
+        async def resolve(device: Device):
+            started = time.monotonic()
+            device.hostname = await self.resolver.resolve(device.ip)
+            ended = time.monotonic()
+            self.metrics.record_stage('dns', started, ended)
+            self.metrics.observe('dns', ended - started)
+        
+        async def enrich():
+            while True:
+                reply = await replies.get()
+                if reply is None:
+                    break
+                if reply.ip in seen:
+                    continue
+                seen.add(reply.ip)
+                device = Device(ip=reply.ip, mac=reply.mac)
+                with self.metrics.stage('vendor'):
+                    device.vendor = self.vendors.lookup(device.mac) or "Unknown"
+                self.metrics.count('hosts_discovered')
+                if self.config.resolve_hostnames:
+                    lookups[id(device)] = asyncio.ensure_future(resolve(device))
+                await devices.put(device)
+            await devices.put(None)
+            console.print(f"[green]✓ Discovered {len(seen)} devices[/green]")
+        
+        async def feed():
+            while True:
+                device = await devices.get()
+                if device is None:
+                    break
+                device.ports = []
+                if self.udp is not None:
+                    udp_scans[id(device)] = asyncio.ensure_future(self.udp_scan_device(device))
+                full, known_open = True, []
+                entry = journal.devices.get(device.ip) if journal else None
+                if entry is not None:
+                    known_open = entry['first']  # same probe order as before the interruption
+                elif self.store is not None:
+                    full, known_open = self.store.plan(device.mac or '', device.ip, str(ports))
+                    # History may know ports outside this run's --ports/--exclude-ports
+                    known_open = [port for port in known_open if port in ports]
+                    full = full or not incremental
+                if full:
+                    console.print(f"[cyan]Scanning {device.ip}...[/cyan]")
+                    scanned[device.ip] = (ports, True)
+                    count = stream.add(device, first=known_open)
+                else:
+                    console.print(f"[cyan]Re-verifying {len(known_open)} known open ports "
+                                  f"on {device.ip}...[/cyan]")
+                    scanned[device.ip] = (known_open, False)
+                    count = stream.add(device, known_open)
+                if journal is not None:
+                    if entry is None:
+                        journal.add_device(device.ip, device.mac, known_open)
+                    done_blocks = journal.blocks.get(device.ip, {})
+                    count = tracker.add(device.ip, count, done_blocks)
+                    for number in sorted(set(itertools.chain.from_iterable(done_blocks.values()))):
+                        port = Port(number=number, state='open', service=self.service_name(number))
+                        device.ports.append(port)
+                        fingerprint(device, port)
+                remaining[id(device)] = count
+                self.metrics.count('probes_planned', count)
+                if not count:
+                    finished(device)
+            stream.close()
+            if journal is not None and swept:
+                journal.finish_discovery()
+        
+        def deliver(device: Device):
+            record = device.to_dict()
+            if journal is not None:
+                journal.finish_host(record)
+            host = self.results.add(record)
+            for state in (remaining, lookups, fingerprints, udp_scans):
+                state.pop(id(device), None)
+            if on_result:
+                on_result(host)
+        
+        async def emit_when_complete(device: Device, pending: List[asyncio.Future]):
+            await asyncio.gather(*pending)
+            deliver(device)
+        
+        def finished(device: Device):
+            self._report_device(device)
+            pending = [f for f in fingerprints.get(id(device), []) if not f.done()]
+            for other in (lookups.get(id(device)), udp_scans.get(id(device))):
+                if other is not None and not other.done():
+                    pending.append(other)
+            if pending:
+                emitting.append(asyncio.ensure_future(emit_when_complete(device, pending)))
+            else:
+                deliver(device)
+        
+        def fingerprint(device: Device, port: Port):
+            if self.prober is not None:
+                fingerprints.setdefault(id(device), []).append(
+                    asyncio.ensure_future(self.identify_service(device.ip, port)))
+        
+        def on_open(device: Device, port: Port):
+            if tracker is not None:
+                tracker.opened(device.ip, port.number)
+            fingerprint(device, port)
+        
+        def on_done(device: Device, port: int):
+            if tracker is not None:
+                tracker.done(device.ip, port)
+            remaining[id(device)] -= 1
+            if remaining[id(device)] == 0:
+                finished(device)
+        
+        scheduler = ConnectionScheduler(
+            self.scan_port,
+            max_in_flight=self.scan_budget(),
+            max_per_host=self.config.max_per_host,
+        )
+        
+        async def scan():
+            with self.metrics.stage('port_scan'):
+                await scheduler.run(tracker or stream, on_done=on_done, on_open=on_open)
+        
+        try:
+            await asyncio.gather(discover(), enrich(), feed(), scan())
+            await asyncio.gather(*(f for pending in fingerprints.values() for f in pending),
+                                 *udp_scans.values())
+            await asyncio.gather(*lookups.values())
+            if self.config.resolve_hostnames:
+                self.resolver.save()
+            await asyncio.gather(*emitting)
+            self.record_scan('incremental' if incremental else 'full', started_at, scanned)
+            if journal is not None:
+                journal.close(done=True)
+        finally:
+            if journal is not None:
+                journal.close()
+            if self.udp is not None:
+                self.udp.close()
+        return self.results
+    
+    async def iter_results(self) -> AsyncIterator[HostRecord]:
+        """
+        Run the scan pipeline and yield each host as soon as it is finished.
+
+        Results arrive while discovery and scanning are still running, in
+        completion order; the generator ends when the scan does.
+        """
+        results: asyncio.Queue = asyncio.Queue()
+        scan = asyncio.ensure_future(self.scan_pipeline(on_result=results.put_nowait))
+        scan.add_done_callback(lambda _: results.put_nowait(None))
+        try:
+            while True:
+                device = await results.get()
+                if device is None:
+                    break
+                yield device
+            await scan  # re-raise anything the pipeline raised
+        finally:
+            if not scan.done():
+                scan.cancel()
+    
+    def record_scan(self, mode: str, started_at: float,
+                    scanned: Optional[Dict[str, Tuple[Sequence[int], bool]]] = None):
+        """
+        Write the results, and their ports unless mode is 'discover', to the
+        scan history. scanned maps an IP to the ports probed and whether
+        that was the full port list; by default every host is taken as
+        fully scanned.
+        """
+        if self.store is None:
+            return
+        with self.metrics.stage('history'):
+            self._record_scan(mode, started_at, scanned)
+    
+    def _record_scan(self, mode: str, started_at: float,
+                     scanned: Optional[Dict[str, Tuple[Sequence[int], bool]]]):
+        ports = self.parse_ports()
+        port_spec = None if mode == 'discover' else str(ports)
+        scan_id = self.store.begin_scan(self.config.network, port_spec, mode, started_at)
+        for host in self.results.sorted():
+            device_id = self.store.record_device(scan_id, host.mac, host.ip,
+                                                 host.hostname, host.vendor)
+            if mode == 'discover':
+                continue
+            probed, full = (scanned or {}).get(host.ip, (ports, True))
+            self.store.record_ports(device_id, set(probed) if not full else probed,
+                                    [(port, service) for _, port, service, _ in host.services('tcp')],
+                                    full_scan_ports=port_spec if full else None)
+        self.store.finish_scan(scan_id)
+    
+    def display_results(self, hosts: Optional[List[HostRecord]] = None):
+        """Display scan results (by default all of them) in a nice table"""
+        if not self.results:
             console.print("[yellow]No devices found[/yellow]")
             return
+        if hosts is None:
+            hosts = self.results.sorted()
         
         table = Table(title="Network Scan Results", box=box.ROUNDED)
         table.add_column("IP Address", style="cyan", no_wrap=True)
@@ -252,54 +1726,246 @@ class NetworkScanner:
         table.add_column("Vendor", style="yellow")
         table.add_column("Open Ports", style="red")
         
-        for device in self.devices:
-            open_ports = ', '.join(map(str, device.get_open_ports())) if device.get_open_ports() else "None"
+        for host in hosts:
+            open_ports = ', '.join((f"{port}/{service}" if service and service != 'unknown'
+                                    else str(port)) + (" (udp)" if protocol == 'udp' else "")
+                                   for protocol, port, service, _ in host.services()) or "None"
             table.add_row(
-                device.ip,
-                device.mac or "N/A",
-                device.hostname or "Unknown",
-                device.vendor or "Unknown",
+                host.ip,
+                host.mac or "N/A",
+                host.hostname or "Unknown",
+                host.vendor or "Unknown",
                 open_ports
             )
         
         console.print("\n")
         console.print(table)
-        console.print(f"\n[green]Total devices found: {len(self.devices)}[/green]")
+        shown = f", {len(hosts)} shown" if len(hosts) != len(self.results) else ""
+        console.print(f"\n[green]Total devices found: {len(self.results)}{shown}[/green]")
+    
+    def display_metrics(self):
+        """Display where the scan spent its time and how probes ended"""
+        summary = self.metrics.summary()
+        
+        table = Table(title="Scan Timings", box=box.ROUNDED)
+        table.add_column("Stage", style="cyan")
+        table.add_column("Wall (s)", justify="right")
+        table.add_column("Busy (s)", justify="right")
+        table.add_column("Count", justify="right")
+        for name, stage in summary['stages'].items():
+            table.add_row(name, f"{stage['wall']:.2f}", f"{stage['busy']:.2f}", str(stage['count']))
+        console.print(table)
+        
+        probes = ', '.join(f"{n} {outcome}" for outcome, n in summary['probes'].items() if n)
+        latency = summary['latency'].get('probe')
+        line = f"Probes: {probes or 'none'} ({summary['probes_per_sec']:.0f}/s)"
+        if latency and latency['count']:
+            line += f", p50 {latency['p50'] * 1000:.1f} ms, p99 {latency['p99'] * 1000:.1f} ms"
+        line += f", peak {summary['peak_in_flight']} in flight, peak {summary['peak_fds']} fds"
+        console.print(f"[dim]{line}[/dim]")
     
-    def export_json(self, filename: str):
-        """Export results to JSON"""
+    def export_json(self, filename: str, hosts: Optional[List[HostRecord]] = None):
+        """Export results (by default all of them) to JSON"""
         data = {
             'scan_time': datetime.now().isoformat(),
             'network': self.config.network,
-            'devices': [device.to_dict() for device in self.devices]
+            'devices': [host.to_dict() for host in (self.results.sorted() if hosts is None else hosts)]
         }
         
-        with open(filename, 'w') as f:
+        with self.metrics.stage('export'), open(filename, 'w') as f:
             json.dump(data, f, indent=2)
         
         console.print(f"[green]✓ Results exported to {filename}[/green]")
     
-    def export_csv(self, filename: str):
-        """Export results to CSV"""
+    def export_csv(self, filename: str, hosts: Optional[List[HostRecord]] = None):
+        """Export results (by default all of them) to CSV"""
         import csv
         
-        with open(filename, 'w', newline='') as f:
+        with self.metrics.stage('export'), open(filename, 'w', newline='') as f:
             writer = csv.writer(f)
-            writer.writerow(['IP', 'MAC', 'Hostname', 'Vendor', 'Open Ports'])
+            writer.writerow(['IP', 'MAC', 'Hostname', 'Vendor', 'Open Ports', 'Open UDP Ports'])
             
-            for device in self.devices:
-                open_ports = ','.join(map(str, device.get_open_ports()))
+            for host in (self.results.sorted() if hosts is None else hosts):
                 writer.writerow([
-                    device.ip,
-                    device.mac or '',
-                    device.hostname or '',
-                    device.vendor or '',
-                    open_ports
+                    host.ip,
+                    host.mac or '',
+                    host.hostname or '',
+                    host.vendor or '',
+                    ','.join(map(str, host.open_ports())),
+                    ','.join(map(str, host.open_ports('udp')))
                 ])
         
         console.print(f"[green]✓ Results exported to {filename}[/green]")
 
 
+# ============================================================================
+# MULTI-PROCESS SHARDING
+# ============================================================================
+
+WORKER_REPORT_INTERVAL = 0.5  # seconds between metrics updates from scan workers
+
+
+def _scan_shard_worker(config: ScanConfig, hosts: List[str], shard: int, shards: int,
+                       max_in_flight: Optional[int], max_per_host: int,
+                       results: 'multiprocessing.Queue'):
+    """
+    Worker process entry point: connect-scan one shard of the target space.
+
+    Posts ('progress', shard, None, metrics) periodically and finally
+    ('done', shard, open ports per host, metrics), where each host's open
+    ports are (number, service, version) tuples, or ('error', ...) on failure.
+    """
+    console.quiet = True
+    install_event_loop(config.event_loop)
+    scanner = NetworkScanner(replace(config, db_path=None, resolve_hostnames=False, workers=1))
+    devices = [Device(ip=ip) for ip in hosts]
+    targets = TargetSpace(devices, scanner.parse_ports(), randomize=config.randomize,
+                          seed=config.seed, shard=shard, shards=shards)
+    
+    async def run():
+        async def report():
+            while True:
+                await asyncio.sleep(WORKER_REPORT_INTERVAL)
+                scanner.metrics.sample_fds()
+                results.put(('progress', shard, None, scanner.metrics))
+        
+        reporter = asyncio.ensure_future(report())
+        try:
+            await scanner.probe_targets(targets, max_in_flight=max_in_flight,
+                                        max_per_host=max_per_host)
+        finally:
+            reporter.cancel()
+    
+    try:
+        asyncio.run(run())
+    except BaseException as e:
+        results.put(('error', shard, repr(e), scanner.metrics))
+        raise
+    results.put(('done', shard, [[(p.number, p.service, p.version) for p in device.ports]
+                                 for device in devices], scanner.metrics))
+
+
+# ============================================================================
+# DISTRIBUTED SCANNING
+# ============================================================================
+
+# ScanConfig fields a coordinator forwards to its agents with every work unit
+AGENT_OPTIONS = ('exclude_ports', 'randomize', 'timeout', 'timing', 'max_retries',
+                 'max_concurrent', 'max_per_host', 'probe', 'service_detection', 'udp', 'udp_ports',
+                 'arp_rate', 'arp_retries', 'arp_timeout', 'resolve_hostnames')
+
+
+def agent_scanner(base: ScanConfig) -> Callable[[Dict], AsyncIterator[Dict]]:
+    """
+    scan(unit) for a ScanAgent: run the scan pipeline over a leased unit.
+
+    The agent's own settings (workers, event loop) come from base; the
+    coordinator's options override the AGENT_OPTIONS fields.
+    """
+    async def scan(unit: Dict) -> AsyncIterator[Dict]:
+        options = {k: v for k, v in (unit.get('options') or {}).items() if k in AGENT_OPTIONS}
+        config = replace(base, network=unit['network'], ports=unit['ports'], **options)
+        async for device in NetworkScanner(config).iter_results():
+            yield device.to_dict()
+    
+    return scan
+
+
+# ============================================================================
+# PASSIVE MONITORING
+# ============================================================================
+
+MONITOR_FIELDS = ['event'] + RESULT_FIELDS  # streaming output of `monitor`
+MONITOR_BATCH_DELAY = 1.0  # hosts appearing this close together are scanned as one batch
+
+
+class InventoryMonitor:
+    """
+    Keep the inventory current from what a PassiveMonitor observes.
+
+    Hosts it reports new, moved or returned are queued and, after a short
+    pause that lets a burst of arrivals batch up, reverse-resolved (unless
+    DHCP or mDNS named them) and port-scanned, skipping hosts the history
+    already has a fresh full scan of. Every event, and every finished
+    scan as 'scanned', is passed to on_record with its Device.
+    """
+    
+    def __init__(self, scanner: NetworkScanner, networks: List[str],
+                 on_record: Optional[Callable[[str, Device], None]] = None, **options):
+        self.scanner = scanner
+        self.monitor = PassiveMonitor(networks, self.on_event, **options)
+        self.on_record = on_record
+        self.devices: Dict[str, Device] = {}  # ip -> device, as last seen
+        self._queue: Optional[asyncio.Queue] = None
+    
+    def on_event(self, event: str, host: HostState):
+        device = self.devices.get(host.ip)
+        if device is None or device.mac != host.mac:
+            device = self.devices[host.ip] = Device(
+                ip=host.ip, mac=host.mac, vendor=self.scanner.vendors.lookup(host.mac) or "Unknown")
+        device.hostname = host.hostname or device.hostname
+        style = {'gone': 'yellow', 'moved': 'magenta'}.get(event, 'green')
+        console.print(f"[{style}]{event:>8}  {device.ip:<15} {device.mac}  {device.vendor}  "
+                      f"({', '.join(sorted(host.sources))})[/{style}]")
+        if self.on_record:
+            self.on_record(event, device)
+        if event != 'gone' and self._queue is not None:
+            self._queue.put_nowait(device)
+    
+    async def scan(self, devices: List[Device]):
+        """Resolve and port-scan newly seen devices, then record them in the history"""
+        started_at = time.time()
+        scanner = self.scanner
+        ports = scanner.parse_ports()
+        scanned: Dict[str, Tuple[Sequence[int], bool]] = {}
+        stale = []
+        for device in devices:
+            full = True
+            if scanner.store is not None:
+                full, _ = scanner.store.plan(device.mac, device.ip, str(ports))
+            scanned[device.ip] = (ports, True) if full else ((), False)
+            if full:
+                stale.append(device)
+        stages = [scanner.resolve_hostnames([d for d in devices if not d.hostname])]
+        if ports and stale:
+            stages.append(scanner.scan_devices_ports(stale))
+        await asyncio.gather(*stages)
+        scanner.results.clear()
+        scanner.collect(devices)
+        scanner.record_scan('full' if ports else 'discover', started_at, scanned)
+        if self.on_record and ports:
+            for device in stale:
+                self.on_record('scanned', device)
+    
+    async def _scan_queued(self):
+        while True:
+            batch = [await self._queue.get()]
+            await asyncio.sleep(MONITOR_BATCH_DELAY)
+            while not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            await self.scan(list({id(device): device for device in batch}.values()))
+    
+    async def run(self):
+        """Listen and scan until cancelled"""
+        self._queue = asyncio.Queue()
+        scanning = asyncio.ensure_future(self._scan_queued())
+        try:
+            await self.monitor.run()
+        finally:
+            scanning.cancel()
+    
+    def replay(self, path: str):
+        """Replay a capture: events are reported, nothing is probed or scanned"""
+        self.monitor.replay(path)
+    
+    def record(self, started_at: float):
+        """Record the hosts currently present as one discovery run"""
+        self.scanner.results.clear()
+        self.scanner.collect(self.devices[host.ip] for host in self.monitor.table
+                             if not host.gone and host.ip in self.devices)
+        self.scanner.record_scan('discover', started_at)
+
+
 # ============================================================================
 # CLI INTERFACE
 # ============================================================================
@@ -310,19 +1976,125 @@ def cli():
     pass
 
 
+def validate_ports(ctx, param, value):
+    """Click callback rejecting malformed port specifications early"""
+    try:
+        parse_port_spec(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    return value
+
+
+async def run_pipeline(scanner: NetworkScanner, on_result: Optional[Callable[[HostRecord], None]],
+                       progress: bool) -> ResultStore:
+    """Run the scan pipeline, under a live progress view if requested"""
+    if not progress:
+        return await scanner.scan_pipeline(on_result=on_result)
+    async with live_progress(scanner.metrics, console):
+        return await scanner.scan_pipeline(on_result=on_result)
+
+
 @cli.command()
 @click.argument('network')
-@click.option('--ports', default='1-1000', help='Port range to scan (e.g., 1-1000 or 22,80,443)')
-@click.option('--timeout', default=2.0, help='Connection timeout in seconds')
-@click.option('--max-concurrent', default=100, help='Maximum concurrent connections')
+@click.option('--ports', default='1-1000', callback=validate_ports,
+              help='Ports to scan (e.g., 1-1000, 22,80,8000-8100 or top100)')
+@click.option('--exclude-ports', default='', callback=validate_ports,
+              help='Ports to skip, same syntax as --ports')
+@click.option('--randomize/--sequential', default=True,
+              help='Probe hosts and ports in pseudo-random order (default) or sequentially')
+@click.option('--timeout', type=float, default=None,
+              help='Fixed connection timeout in seconds (default: adaptive, from measured RTT)')
+@click.option('--timing', type=click.Choice(list(TIMING_PROFILES)), default='normal',
+              help='Timing profile for adaptive timeouts and retries')
+@click.option('--max-retries', type=int, default=None,
+              help='Retries for probes that time out (default: from timing profile)')
+@click.option('--max-concurrent', type=int, default=None,
+              help='Maximum concurrent connections across all hosts (default: sized from the open-file limit)')
+@click.option('--max-per-host', default=100, help='Maximum concurrent connections per host')
+@click.option('--workers', default=1,
+              help='Processes to shard the connect scan across (0 = one per CPU core)')
+@click.option('--probe', type=click.Choice(PROBES), default='socket',
+              help='Connect probe: bare sockets that reset open ports (default) or asyncio streams')
+@click.option('--loop', 'event_loop', type=click.Choice(EVENT_LOOPS), default='auto',
+              help='Event loop (auto = uvloop when installed)')
 @click.option('--export-json', help='Export results to JSON file')
 @click.option('--export-csv', help='Export results to CSV file')
-@click.option('--scan-type', type=click.Choice(['fast', 'full']), default='fast', help='Scan type')
-def scan(network, ports, timeout, max_concurrent, export_json, export_csv, scan_type):
+@click.option('--with-port', type=click.IntRange(1, MAX_PORT), default=None,
+              help='Only show and export hosts with this TCP port open')
+@click.option('--vendor', 'vendor_filter', help='Only show and export hosts whose vendor contains this text')
+@click.option('--mac', 'mac_filter', help='Only show and export the host with this MAC address')
+@click.option('--output', help='Stream one record per finished host to this file (.ndjson, .csv, optionally .gz)')
+@click.option('--output-format', type=click.Choice(OUTPUT_FORMATS), default=None,
+              help='Format for --output (default: from the file extension)')
+@click.option('--scan-type', type=click.Choice(['fast', 'full', 'syn']), default='fast',
+              help='Scan type (syn = half-open raw-socket scan, needs administrator privileges)')
+@click.option('--syn-rate', type=int, default=None, help='SYN packets per second for --scan-type syn')
+@click.option('--arp-rate', type=int, default=DEFAULT_ARP_RATE,
+              help='ARP requests per second during discovery (0 = unpaced)')
+@click.option('--arp-retries', default=1, help='Extra ARP requests to hosts that did not answer')
+@click.option('--arp-timeout', default=2.0,
+              help='Longest wait for ARP replies after each round in seconds')
+@click.option('--discovery', type=click.Choice(DISCOVERY_METHODS), default='auto',
+              help='Host discovery: ARP sweep or unprivileged ping sweep (auto = ARP when raw sockets are usable)')
+@click.option('--ping-ports', default=','.join(map(str, PING_PORTS)), callback=validate_ports,
+              help='TCP ports the ping sweep connects to')
+@click.option('--service-detection/--no-service-detection', default=True,
+              help='Banner-grab open ports to identify service and version')
+@click.option('--udp', is_flag=True, help='Also scan UDP ports with protocol-specific probes')
+@click.option('--udp-ports', default=UDP_DEFAULT_PORTS, callback=validate_ports,
+              help='UDP ports for --udp, same syntax as --ports (default: ports with a protocol probe)')
+@click.option('--udp-rate', type=int, default=DEFAULT_UDP_RATE, show_default=True,
+              help='UDP probes per second for --udp (0 = unpaced)')
+@click.option('--resolve/--no-resolve', default=True, help='Reverse-resolve hostnames')
+@click.option('--dns-concurrency', default=32, help='Concurrent reverse-DNS lookups')
+@click.option('--dns-timeout', default=2.0, help='Deadline per reverse-DNS lookup in seconds')
+@click.option('--incremental', is_flag=True,
+              help='Fully rescan only new or changed hosts; re-verify known open ports on the rest')
+@click.option('--checkpoint', help='Journal scan progress to this file so an interrupted scan can be resumed')
+@click.option('--resume', is_flag=True, help='Continue the scan recorded in --checkpoint')
+@click.option('--history/--no-history', default=True, help='Record the scan in the history database')
+@click.option('--db', 'db_path', default=DEFAULT_DB_PATH, show_default=True,
+              help='History database file')
+@click.option('--progress/--no-progress', default=True,
+              help='Show a live progress bar and a timing summary')
+@click.option('--metrics-json', help='Write stage timings, latencies and probe counters to this JSON file')
+@click.option('--metrics-port', type=int, default=None,
+              help='Serve Prometheus metrics on this port while the scan runs')
+@click.option('--metrics-host', default='127.0.0.1', help='Address for --metrics-port')
+def scan(network, ports, exclude_ports, randomize, timeout, timing, max_retries,
+         max_concurrent, max_per_host, workers, probe, event_loop, export_json, export_csv,
+         with_port, vendor_filter, mac_filter, output, output_format,
+         scan_type, syn_rate, arp_rate, arp_retries, arp_timeout, discovery, ping_ports,
+         service_detection, udp, udp_ports,
+         udp_rate, resolve, dns_concurrency, dns_timeout, incremental, checkpoint, resume, history, db_path, progress,
+         metrics_json, metrics_port, metrics_host):
     """Scan a network for devices and open ports
     
     Example: scanner.py scan 192.168.1.0/24
     """
+    if workers < 0:
+        raise click.BadParameter('must be 0 or more', param_hint='--workers')
+    workers = workers or os.cpu_count() or 1
+    if mac_filter is not None:
+        try:
+            mac_filter = parse_mac(mac_filter)
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint='--mac')
+    if incremental and (workers > 1 or scan_type == 'syn'):
+        raise click.UsageError('--incremental cannot be combined with --workers or --scan-type syn')
+    if resume and not checkpoint:
+        raise click.UsageError('--resume needs --checkpoint')
+    if resume and not (os.path.isfile(checkpoint) and os.access(checkpoint, os.R_OK)):
+        raise click.BadParameter(f'{checkpoint} is missing or unreadable, nothing to resume',
+                                 param_hint='--checkpoint')
+    if checkpoint and (workers > 1 or scan_type == 'syn' or incremental):
+        raise click.UsageError('--checkpoint cannot be combined with --workers, '
+                               '--scan-type syn or --incremental')
+    try:
+        event_loop = install_event_loop(event_loop)
+    except ImportError:
+        raise click.BadParameter('uvloop is not installed (pip install uvloop)', param_hint='--loop')
+    
     console.print(Panel.fit(
         "[bold cyan]Network Scanner v1.0[/bold cyan]\n"
         f"Scanning: {network}",
@@ -333,48 +2105,126 @@ def scan(network, ports, timeout, max_concurrent, export_json, export_csv, scan_
     config = ScanConfig(
         network=network,
         ports=ports,
+        exclude_ports=exclude_ports,
+        randomize=randomize,
         timeout=timeout,
+        timing=timing,
+        max_retries=max_retries,
         max_concurrent=max_concurrent,
-        scan_type=scan_type
+        max_per_host=max_per_host,
+        workers=workers,
+        probe=probe,
+        event_loop=event_loop,
+        scan_type=scan_type,
+        syn_rate=syn_rate,
+        arp_rate=arp_rate,
+        arp_retries=arp_retries,
+        arp_timeout=arp_timeout,
+        discovery=discovery,
+        ping_ports=ping_ports,
+        service_detection=service_detection,
+        udp=udp,
+        udp_ports=udp_ports,
+        udp_rate=udp_rate or None,
+        resolve_hostnames=resolve,
+        dns_concurrency=dns_concurrency,
+        dns_timeout=dns_timeout,
+        db_path=db_path if history else None,
+        incremental=incremental,
+        checkpoint=checkpoint,
+        resume=resume
     )
     
     # Create scanner
     scanner = NetworkScanner(config)
+    if scanner.vendors.is_expired() and os.path.exists(scanner.vendors.path):
+        console.print("[dim]The MAC vendor index is over 90 days old; "
+                      "refresh it with: scanner.py update-vendors[/dim]")
+    server = None
+    if metrics_port is not None:
+        server = MetricsServer(scanner.metrics, metrics_port, metrics_host).start()
+        console.print(f"[dim]Metrics at http://{metrics_host}:{metrics_port}/metrics[/dim]")
     
-    # Discover hosts
-    devices = scanner.discover_hosts_arp()
-    
-    if not devices:
-        console.print("[yellow]No devices found. Make sure you're running as Administrator.[/yellow]")
-        return
-    
-    # Scan ports
-    asyncio.run(scanner.scan_all_devices())
-    
-    # Display results
-    scanner.display_results()
-    
-    # Export if requested
-    if export_json:
-        scanner.export_json(export_json)
-    
-    if export_csv:
-        scanner.export_csv(export_csv)
+    try:
+        # Discover, enrich and port-scan hosts as a pipeline: each host is
+        # scanned as soon as its ARP reply arrives
+        writer = ResultWriter(output, RESULT_FIELDS, output_format) if output else None
+        try:
+            on_result = None
+            if writer:
+                def on_result(host):
+                    with scanner.metrics.stage('export'):
+                        writer.write(host.to_dict())
+            results = asyncio.run(run_pipeline(scanner, on_result, progress))
+        except CheckpointMismatch as e:
+            raise click.ClickException(str(e))
+        except KeyboardInterrupt:
+            if checkpoint:
+                console.print(f"\n[yellow]Interrupted: progress saved, continue with "
+                              f"--checkpoint {checkpoint} --resume[/yellow]")
+            raise SystemExit(130)
+        finally:
+            if writer:
+                writer.close()
+                console.print(f"[green]✓ Streamed {writer.count} results to {output}[/green]")
+        
+        if not results:
+            console.print("[yellow]No devices found. Make sure you're running as Administrator.[/yellow]")
+            return
+        
+        # Display results, narrowed to the hosts asked for
+        hosts = None
+        if with_port is not None or vendor_filter is not None or mac_filter is not None:
+            hosts = results.select(port=with_port, vendor=vendor_filter, mac=mac_filter)
+        scanner.display_results(hosts)
+        
+        # Export if requested
+        if export_json:
+            scanner.export_json(export_json, hosts)
+        
+        if export_csv:
+            scanner.export_csv(export_csv, hosts)
+        
+        if progress:
+            scanner.display_metrics()
+    finally:
+        if metrics_json:
+            scanner.metrics.write_json(metrics_json)
+            console.print(f"[green]✓ Scan metrics written to {metrics_json}[/green]")
+        if server:
+            server.close()
 
 
 @cli.command()
 @click.argument('network')
-def discover(network):
+@click.option('--arp-rate', type=int, default=DEFAULT_ARP_RATE,
+              help='ARP requests per second (0 = unpaced)')
+@click.option('--arp-retries', default=1, help='Extra ARP requests to hosts that did not answer')
+@click.option('--arp-timeout', default=2.0,
+              help='Longest wait for ARP replies after each round in seconds')
+@click.option('--discovery', type=click.Choice(DISCOVERY_METHODS), default='auto',
+              help='ARP sweep or unprivileged ping sweep (auto = ARP when raw sockets are usable)')
+@click.option('--ping-ports', default=','.join(map(str, PING_PORTS)), callback=validate_ports,
+              help='TCP ports the ping sweep connects to')
+@click.option('--history/--no-history', default=True, help='Record the devices in the history database')
+@click.option('--db', 'db_path', default=DEFAULT_DB_PATH, show_default=True,
+              help='History database file')
+def discover(network, arp_rate, arp_retries, arp_timeout, discovery, ping_ports, history, db_path):
     """Quick host discovery without port scanning
     
     Example: scanner.py discover 192.168.1.0/24
     """
     console.print(f"[cyan]Discovering hosts on {network}...[/cyan]\n")
     
-    config = ScanConfig(network=network)
+    config = ScanConfig(network=network, arp_rate=arp_rate, arp_retries=arp_retries,
+                        arp_timeout=arp_timeout, discovery=discovery, ping_ports=ping_ports,
+                        db_path=db_path if history else None)
     scanner = NetworkScanner(config)
     
-    devices = scanner.discover_hosts_arp()
+    started_at = time.time()
+    devices = scanner.discover_hosts()
+    scanner.collect(devices)
+    scanner.record_scan('discover', started_at)
     
     if devices:
         scanner.display_results()
@@ -382,5 +2232,280 @@ def discover(network):
         console.print("[yellow]No devices found[/yellow]")
 
 
+@cli.command()
+@click.argument('networks', nargs=-1)
+@click.option('--ports', default='1-1000', callback=validate_ports,
+              help="Ports to scan on new, moved and returned hosts ('' = none)")
+@click.option('--service-detection/--no-service-detection', default=True,
+              help='Banner-grab open ports found on new hosts')
+@click.option('--resolve/--no-resolve', default=True,
+              help='Reverse-resolve new hosts that DHCP or mDNS did not name')
+@click.option('--stale-after', default=STALE_AFTER, show_default=True,
+              help='Seconds a host may stay silent before it is verified with a unicast ARP request')
+@click.option('--check-interval', default=CHECK_INTERVAL, show_default=True,
+              help='Seconds between neighbour-table reads and stale-host checks')
+@click.option('--max-missed', default=MAX_MISSED, show_default=True,
+              help='Unanswered verifications before a host is reported gone')
+@click.option('--pcap', type=click.Path(exists=True, dir_okay=False),
+              help='Replay this capture file instead of listening (nothing is probed or scanned)')
+@click.option('--output', help='Stream one record per event to this file (.ndjson, .csv, optionally .gz)')
+@click.option('--output-format', type=click.Choice(OUTPUT_FORMATS), default=None,
+              help='Format for --output (default: from the file extension)')
+@click.option('--history/--no-history', default=True, help='Record hosts in the history database')
+@click.option('--db', 'db_path', default=DEFAULT_DB_PATH, show_default=True,
+              help='History database file')
+def monitor(networks, ports, service_detection, resolve, stale_after, check_interval, max_missed,
+            pcap, output, output_format, history, db_path):
+    """Keep the inventory current by listening instead of sweeping
+    
+    Hosts are learned from the ARP, DHCP and mDNS traffic on the network
+    and from the neighbour table as soon as they show up. Only new, moved
+    or returned hosts are port-scanned, and only hosts that go quiet are
+    probed, with a unicast ARP request. Runs until interrupted.
+    
+    Example: scanner.py monitor 192.168.1.0/24
+    """
+    try:
+        for network in networks:
+            ipaddress.ip_network(network, strict=False)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='NETWORKS')
+    if not networks and not pcap:
+        from multi_network_scanner import MultiNetworkScanner
+        networks = MultiNetworkScanner(db_path=None).get_local_networks()
+        if not networks:
+            raise click.UsageError('no local networks detected, pass NETWORKS')
+    
+    config = ScanConfig(network=','.join(networks) or pcap, ports=ports,
+                        service_detection=service_detection, resolve_hostnames=resolve,
+                        db_path=db_path if history else None)
+    scanner = NetworkScanner(config)
+    writer = ResultWriter(output, MONITOR_FIELDS, output_format) if output else None
+    
+    def on_record(event, device):
+        writer.write(dict(device.to_dict(), event=event))
+    
+    inventory = InventoryMonitor(scanner, list(networks), on_record if writer else None,
+                                 stale_after=stale_after, check_interval=check_interval,
+                                 max_missed=max_missed, neighbours=not pcap)
+    started_at = time.time()
+    try:
+        if pcap:
+            console.print(f"[cyan]Replaying {pcap}...[/cyan]")
+            inventory.replay(pcap)
+        else:
+            console.print(f"[cyan]Monitoring {', '.join(networks)} (Ctrl+C to stop)...[/cyan]")
+            asyncio.run(inventory.run())
+    except PermissionError:
+        raise click.ClickException('capturing traffic requires administrator privileges')
+    except KeyboardInterrupt:
+        console.print("[yellow]Monitor stopped[/yellow]")
+    finally:
+        if writer:
+            writer.close()
+            console.print(f"[green]✓ Streamed {writer.count} events to {output}[/green]")
+    
+    inventory.record(started_at)
+    present = sum(1 for host in inventory.monitor.table if not host.gone)
+    console.print(f"[green]✓ {present} hosts present, "
+                  f"{len(inventory.monitor.table) - present} gone, "
+                  f"{inventory.monitor.packets} packets inspected[/green]")
+
+
+@cli.command()
+@click.argument('networks', nargs=-1, required=True)
+@click.option('--ports', default='1-1000', callback=validate_ports,
+              help='Ports to scan (e.g., 1-1000, 22,80,8000-8100 or top100)')
+@click.option('--exclude-ports', default='', callback=validate_ports,
+              help='Ports to skip, same syntax as --ports')
+@click.option('--timing', type=click.Choice(list(TIMING_PROFILES)), default='normal',
+              help='Timing profile agents use for adaptive timeouts and retries')
+@click.option('--probe', type=click.Choice(PROBES), default='socket', help='Connect probe agents use')
+@click.option('--service-detection/--no-service-detection', default=True,
+              help='Have agents banner-grab open ports')
+@click.option('--udp', is_flag=True, help='Have agents also scan UDP ports')
+@click.option('--udp-ports', default=UDP_DEFAULT_PORTS, callback=validate_ports,
+              help='UDP ports for --udp, same syntax as --ports')
+@click.option('--resolve/--no-resolve', default=True, help='Have agents reverse-resolve hostnames')
+@click.option('--listen', default='0.0.0.0', show_default=True, help='Address to serve agents on')
+@click.option('--port', 'listen_port', default=DEFAULT_COORDINATOR_PORT, show_default=True,
+              help='Port to serve agents on')
+@click.option('--unit-prefix', default=UNIT_PREFIX, show_default=True,
+              help='Split networks into work units of at most this prefix length')
+@click.option('--lease', default=LEASE_SECONDS, show_default=True,
+              help='Seconds without word from an agent before its unit is reassigned')
+@click.option('--max-attempts', default=MAX_ATTEMPTS, show_default=True,
+              help='Leases per work unit before it is given up')
+@click.option('--token', envvar='SCANNER_TOKEN', help='Shared secret agents must present')
+@click.option('--export-json', help='Export merged results to JSON file')
+@click.option('--export-csv', help='Export merged results to CSV file')
+@click.option('--output', help='Stream every record received from agents to this file (.ndjson, .csv, optionally .gz)')
+@click.option('--output-format', type=click.Choice(OUTPUT_FORMATS), default=None,
+              help='Format for --output (default: from the file extension)')
+@click.option('--history/--no-history', default=True, help='Record the merged scan in the history database')
+@click.option('--db', 'db_path', default=DEFAULT_DB_PATH, show_default=True,
+              help='History database file')
+def coordinate(networks, ports, exclude_ports, timing, probe, service_detection, udp, udp_ports,
+               resolve, listen, listen_port, unit_prefix, lease, max_attempts, token, export_json, export_csv,
+               output, output_format, history, db_path):
+    """Split a scan into work units and hand them to scan agents
+
+    Agents (scanner.py agent) pull units for the networks they can reach,
+    scan them and stream devices back; units of agents that go quiet are
+    reassigned. Results are merged into one inventory.
+
+    Example: scanner.py coordinate 10.1.0.0/16 10.2.0.0/24 --ports top100
+    """
+    from distributed import Coordinator
+    
+    try:
+        for network in networks:
+            ipaddress.ip_network(network, strict=False)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='NETWORKS')
+    
+    config = ScanConfig(network=','.join(networks), ports=ports, exclude_ports=exclude_ports,
+                        timing=timing, probe=probe, service_detection=service_detection,
+                        udp=udp, udp_ports=udp_ports, resolve_hostnames=resolve, db_path=db_path if history else None)
+    scanner = NetworkScanner(config)
+    options = {name: getattr(config, name) for name in AGENT_OPTIONS}
+    
+    console.print(Panel.fit(
+        "[bold cyan]Network Scanner v1.0 - Coordinator[/bold cyan]\n"
+        f"Scanning: {', '.join(networks)}",
+        border_style="cyan"
+    ))
+    
+    writer = ResultWriter(output, RESULT_FIELDS, output_format) if output else None
+    coordinator = Coordinator(list(networks), ports, options, unit_prefix=unit_prefix, lease=lease,
+                              max_attempts=max_attempts, token=token,
+                              on_record=writer.write if writer else None, log=console.print)
+    started_at = time.time()
+    try:
+        records = asyncio.run(coordinator.serve(listen, listen_port))
+    except KeyboardInterrupt:
+        records = list(coordinator.inventory.values())
+        console.print("[yellow]Interrupted: keeping the results received so far[/yellow]")
+    finally:
+        if writer:
+            writer.close()
+            console.print(f"[green]✓ Streamed {writer.count} records to {output}[/green]")
+    
+    failed = [unit.network for unit in coordinator.units if unit.state != 'done']
+    if failed:
+        console.print(f"[yellow]Not scanned: {', '.join(failed)}[/yellow]")
+    
+    scanner.results.extend(records)
+    if not failed:
+        scanner.record_scan('full', started_at)
+    scanner.display_results()
+    if export_json:
+        scanner.export_json(export_json)
+    if export_csv:
+        scanner.export_csv(export_csv)
+
+
+@cli.command()
+@click.argument('url')
+@click.option('--network', 'networks', multiple=True,
+              help='Network this agent can reach and will scan (repeatable; default: detected local networks)')
+@click.option('--name', default=None, help='Agent name shown by the coordinator (default: hostname)')
+@click.option('--token', envvar='SCANNER_TOKEN', help='Shared secret the coordinator expects')
+@click.option('--workers', default=1,
+              help='Processes to shard each unit\'s connect scan across (0 = one per CPU core)')
+@click.option('--loop', 'event_loop', type=click.Choice(EVENT_LOOPS), default='auto',
+              help='Event loop (auto = uvloop when installed)')
+@click.option('--once', is_flag=True, help='Exit when the coordinator\'s scan is finished')
+def agent(url, networks, name, token, workers, event_loop, once):
+    """Run as a scan agent for a coordinator
+
+    Leases work units covering this agent's networks from the coordinator
+    at URL, scans them and streams the devices back. Without --once the
+    agent keeps polling, serving one coordinator run after another.
+
+    Example: scanner.py agent http://10.0.0.5:8765 --network 192.168.1.0/24
+    """
+    from distributed import ScanAgent
+    
+    if workers < 0:
+        raise click.BadParameter('must be 0 or more', param_hint='--workers')
+    try:
+        event_loop = install_event_loop(event_loop)
+    except ImportError:
+        raise click.BadParameter('uvloop is not installed (pip install uvloop)', param_hint='--loop')
+    if not networks:
+        from multi_network_scanner import MultiNetworkScanner
+        networks = MultiNetworkScanner(db_path=None).get_local_networks()
+        if not networks:
+            raise click.UsageError('no local networks detected, pass --network')
+    
+    base = ScanConfig(network='', workers=workers or os.cpu_count() or 1,
+                      event_loop=event_loop, db_path=None)
+    console.print(f"[cyan]Agent for {', '.join(networks)}, coordinator {url}[/cyan]")
+    scan_agent = ScanAgent(url, list(networks), agent_scanner(base), name=name, token=token,
+                           exit_when_done=once, log=console.print)
+    try:
+        asyncio.run(scan_agent.run())
+    except PermissionError as e:
+        raise click.ClickException(str(e))
+    except KeyboardInterrupt:
+        console.print("[yellow]Agent stopped[/yellow]")
+
+
+@cli.command()
+@click.option('--hours', default=24.0, help='Report changes from the last N hours')
+@click.option('--db', 'db_path', default=DEFAULT_DB_PATH, show_default=True,
+              help='History database file')
+def changes(hours, db_path):
+    """Show what changed on the network according to the scan history
+    
+    Example: scanner.py changes --hours 24
+    """
+    store = ScanStore(db_path)
+    since = time.time() - hours * 3600
+    report = store.changes_since(since)
+    store.close()
+    
+    console.print(f"[cyan]Changes since {datetime.fromtimestamp(since):%Y-%m-%d %H:%M}[/cyan]\n")
+    if not any(report.values()):
+        console.print("[green]No changes[/green]")
+        return
+    
+    table = Table(title="Network Changes", box=box.ROUNDED)
+    table.add_column("Change", style="bold")
+    table.add_column("IP Address", style="cyan", no_wrap=True)
+    table.add_column("MAC Address", style="magenta")
+    table.add_column("Details", style="yellow")
+    for row in report['new_devices']:
+        table.add_row("[green]new device[/green]", row['ip'], row['mac'],
+                      row['hostname'] or row['vendor'] or "")
+    for row in report['missing_devices']:
+        table.add_row("[red]missing[/red]", row['ip'], row['mac'],
+                      f"last seen {datetime.fromtimestamp(row['last_seen']):%Y-%m-%d %H:%M}")
+    for row in report['opened_ports']:
+        table.add_row("[green]port opened[/green]", row['ip'], row['mac'],
+                      f"{row['number']} ({row['service'] or 'unknown'})")
+    for row in report['closed_ports']:
+        table.add_row("[red]port closed[/red]", row['ip'], row['mac'],
+                      f"{row['number']} ({row['service'] or 'unknown'})")
+    console.print(table)
+
+
+@cli.command()
+def update_vendors():
+    """Download the IEEE OUI registries and rebuild the vendor index
+    
+    Example: scanner.py update-vendors
+    """
+    vendors = VendorDB()
+    console.print("[cyan]Downloading IEEE MA-L/MA-M/MA-S registries...[/cyan]")
+    try:
+        count = vendors.refresh()
+    except Exception as e:
+        console.print(f"[red]Vendor update failed: {e}[/red]")
+        return
+    console.print(f"[green]✓ Indexed {count} vendor prefixes in {vendors.path}[/green]")
+
+
 if __name__ == '__main__':
     cli()
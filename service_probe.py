@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Service Probe - Banner grabbing and service/version fingerprinting
+Used by scanner.py on ports already found open
+"""
+
+import asyncio
+import os
+import re
+import sys
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, List, Optional, Pattern, Tuple
+
+# ============================================================================
+# PORT -> SERVICE TABLE
+# ============================================================================
+
+# Well-known TCP services, used where no services database can be read
+COMMON_SERVICES = {
+    21: 'ftp', 22: 'ssh', 23: 'telnet', 25: 'smtp', 53: 'domain', 80: 'http',
+    110: 'pop3', 111: 'sunrpc', 135: 'msrpc', 139: 'netbios-ssn', 143: 'imap',
+    389: 'ldap', 443: 'https', 445: 'microsoft-ds', 465: 'smtps', 514: 'shell',
+    548: 'afp', 554: 'rtsp', 587: 'submission', 631: 'ipp', 636: 'ldaps',
+    993: 'imaps', 995: 'pop3s', 1433: 'ms-sql-s', 1723: 'pptp', 1883: 'mqtt',
+    2049: 'nfs', 3306: 'mysql', 3389: 'ms-wbt-server', 5060: 'sip',
+    5432: 'postgresql', 5900: 'vnc', 6379: 'redis', 8000: 'http-alt',
+    8080: 'http-proxy', 8443: 'https-alt', 8883: 'secure-mqtt', 9100: 'jetdirect',
+    27017: 'mongodb',
+}
+
+# Well-known UDP services, likewise
+COMMON_UDP_SERVICES = {
+    53: 'domain', 67: 'dhcps', 68: 'dhcpc', 69: 'tftp', 123: 'ntp', 137: 'netbios-ns',
+    138: 'netbios-dgm', 161: 'snmp', 162: 'snmptrap', 500: 'isakmp', 514: 'syslog',
+    520: 'route', 1900: 'ssdp', 3702: 'ws-discovery', 5060: 'sip', 5353: 'mdns',
+    11211: 'memcache',
+}
+
+
+def _services_path() -> str:
+    if sys.platform.startswith('win'):
+        return os.path.join(os.environ.get('SystemRoot', r'C:\Windows'),
+                            'System32', 'drivers', 'etc', 'services')
+    return '/etc/services'
+
+
+def load_port_table(path: Optional[str] = None, protocol: str = 'tcp') -> Dict[int, str]:
+    """
+    Build the port -> service name table for one protocol once.
+
+    Reads the system services database a single time (the same data
+    getservbyport consults on every call) and falls back to
+    COMMON_SERVICES or COMMON_UDP_SERVICES for ports it doesn't list.
+    """
+    table = dict(COMMON_UDP_SERVICES if protocol == 'udp' else COMMON_SERVICES)
+    try:
+        with open(path or _services_path(), encoding='utf-8', errors='replace') as f:
+            for line in f:
+                fields = line.split('#', 1)[0].split()
+                if len(fields) < 2 or '/' not in fields[1]:
+                    continue
+                number, _, listed = fields[1].partition('/')
+                if listed == protocol and number.isdigit():
+                    table.setdefault(int(number), fields[0])
+    except OSError:
+        pass
+    return table
+
+
+_port_tables: Dict[str, Dict[int, str]] = {}
+
+
+def service_for_port(port: int, protocol: str = 'tcp') -> str:
+    """Service conventionally registered for a TCP (or UDP) port, or 'unknown'"""
+    table = _port_tables.get(protocol)
+    if table is None:
+        table = _port_tables[protocol] = load_port_table(protocol=protocol)
+    return table.get(port, 'unknown')
+
+
+# ============================================================================
+# PROBE / SIGNATURE DATABASE
+# ============================================================================
+
+@dataclass(frozen=True)
+class Signature:
+    """A response pattern; version_group picks the version out of the match"""
+    service: str
+    pattern: Pattern[bytes]
+    version_group: Optional[int] = None
+    product: Optional[str] = None  # prefixed to the version when the banner lacks it
+
+
+@dataclass(frozen=True)
+class Probe:
+    """Payload sent to elicit a response, and the signatures it is matched against"""
+    name: str
+    payload: bytes
+    ports: FrozenSet[int]  # ports this probe is tried on first; empty = any port
+    signatures: Tuple[Signature, ...]
+
+
+def _sig(service: str, pattern: bytes, version_group: Optional[int] = None,
+         product: Optional[str] = None) -> Signature:
+    return Signature(service, re.compile(pattern, re.DOTALL), version_group, product)
+
+
+# Banners servers send unprompted (the "NULL probe")
+BANNER_SIGNATURES = (
+    _sig('ssh', rb'^SSH-[\d.]+-([^\r\n ]+)', 1),
+    _sig('ftp', rb'^220[ -][^\r\n]*?\b(vsFTPd [\d.]+|ProFTPD [\d.]+|Pure-FTPd|FileZilla Server [\d.]+)', 1),
+    _sig('ftp', rb'^220[ -][^\r\n]*FTP'),
+    _sig('smtp', rb'^220[ -][^\r\n]*?\b(Postfix|Exim [\d.]+|Microsoft ESMTP MAIL Service|Sendmail [\d./]+)', 1),
+    _sig('smtp', rb'^220[ -][^\r\n]*SMTP'),
+    _sig('pop3', rb'^\+OK[^\r\n]*?(Dovecot|POP3)', 1),
+    _sig('imap', rb'^\* OK[^\r\n]*?(Dovecot|IMAP4rev1)', 1),
+    _sig('mysql', rb'^.\x00\x00\x00\x0a([\d.]+[\w.-]*)\x00', 1, 'MySQL'),
+    _sig('vnc', rb'^RFB (\d{3}\.\d{3})\n', 1, 'RFB'),
+    _sig('telnet', rb'^\xff[\xfb-\xfe]'),
+    _sig('mqtt', rb'^\x20\x02'),
+)
+
+HTTP_SIGNATURES = (
+    _sig('http', rb'^HTTP/1\.[01] \d{3}.*?\r\nServer: ([^\r\n]+)', 1),
+    _sig('http', rb'^HTTP/1\.[01] \d{3}'),
+    _sig('ssl', rb'^\x15\x03[\x00-\x04]'),  # TLS alert: a TLS service got plain text
+    _sig('rtsp', rb'^RTSP/1\.0 \d{3}.*?\r\nServer: ([^\r\n]+)', 1),
+    _sig('rtsp', rb'^RTSP/1\.0 \d{3}'),
+)
+
+# Compiled once at import; probes are tried in order after the banner read
+PROBES = (
+    Probe('RedisPing', b'*1\r\n$4\r\nPING\r\n', frozenset({6379}),
+          (_sig('redis', rb'^\+PONG'), _sig('redis', rb'^-NOAUTH'))),
+    Probe('GetRequest', b'GET / HTTP/1.0\r\nUser-Agent: network-scanner\r\n\r\n', frozenset(),
+          HTTP_SIGNATURES),
+)
+
+
+def match(signatures: Tuple[Signature, ...], data: bytes) -> Optional[Tuple[str, Optional[str]]]:
+    """First signature matching data, as (service, version)"""
+    for signature in signatures:
+        found = signature.pattern.search(data)
+        if found is None:
+            continue
+        version = None
+        if signature.version_group is not None:
+            version = found.group(signature.version_group).decode('utf-8', 'replace').strip()
+            if signature.product:
+                version = f"{signature.product} {version}"
+        return signature.service, version
+    return None
+
+
+# ============================================================================
+# PROBER
+# ============================================================================
+
+class ServiceProber:
+    """
+    Async banner-grab and probe stage for open ports.
+
+    Each port gets one connection: the banner is read first, and if it
+    matches nothing, the probes meant for that port (then the generic ones)
+    are sent in turn until a signature matches. Every read has its own
+    deadline, and a semaphore of max_concurrent connections caps how many
+    ports are fingerprinted at once, so slow services never hold up the
+    scan itself. Those connections are not taken from the port scan's
+    slots; the caller sizes both out of one fd budget (see scanner.py's
+    connection_budget).
+    """
+    
+    def __init__(self, max_concurrent: int = 64, connect_timeout: float = 2.0,
+                 read_timeout: float = 2.0, banner_timeout: float = 1.0):
+        self.max_concurrent = max(1, max_concurrent)
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.banner_timeout = banner_timeout
+        self._loop = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+    
+    @staticmethod
+    def probes_for(port: int) -> List[Probe]:
+        """Probes targeting this port first, then the generic ones"""
+        specific = [probe for probe in PROBES if port in probe.ports]
+        generic = [probe for probe in PROBES if not probe.ports]
+        return specific + generic
+    
+    async def _read(self, reader: asyncio.StreamReader, timeout: float) -> bytes:
+        try:
+            return await asyncio.wait_for(reader.read(4096), timeout)
+        except (asyncio.TimeoutError, OSError):
+            return b''
+    
+    async def identify(self, ip: str, port: int) -> Tuple[str, Optional[str]]:
+        """Return (service, version) for an open port; falls back to the port table"""
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        async with self._semaphore:
+            try:
+                reader, writer = await asyncio.wait_for(asyncio.open_connection(ip, port),
+                                                        self.connect_timeout)
+            except (asyncio.TimeoutError, OSError):
+                return service_for_port(port), None
+            try:
+                banner = await self._read(reader, self.banner_timeout)
+                if banner:
+                    found = match(BANNER_SIGNATURES, banner)
+                    if found:
+                        return found
+                for probe in self.probes_for(port):
+                    if reader.at_eof():
+                        break
+                    try:
+                        writer.write(probe.payload)
+                        await writer.drain()
+                    except OSError:
+                        break
+                    found = match(probe.signatures, await self._read(reader, self.read_timeout))
+                    if found:
+                        return found
+                return service_for_port(port), None
+            finally:
+                writer.close()
+                try:
+                    await writer.wait_closed()
+                except OSError:
+                    pass
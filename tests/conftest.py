@@ -0,0 +1,28 @@
+import os
+import socket
+import sys
+
+import pytest
+
+# The modules live flat in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def listeners():
+    """Open TCP listeners on a loopback address; returns a factory giving their ports"""
+    sockets = []
+    
+    def listen(host: str = '127.0.0.1', count: int = 1):
+        ports = []
+        for _ in range(count):
+            sock = socket.socket()
+            sock.bind((host, 0))
+            sock.listen(16)
+            sockets.append(sock)
+            ports.append(sock.getsockname()[1])
+        return ports
+    
+    yield listen
+    for sock in sockets:
+        sock.close()
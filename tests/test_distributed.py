@@ -0,0 +1,115 @@
+import asyncio
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from distributed import API, Coordinator, merge_record, split_plan
+
+
+def test_split_plan_merges_overlaps_then_splits():
+    assert split_plan(['10.0.0.0/23', '10.0.1.0/24', '10.0.1.0/24', '10.0.4.0/25']) == [
+        '10.0.0.0/24', '10.0.1.0/24', '10.0.4.0/25']
+    assert split_plan(['192.168.0.0/22'], unit_prefix=23) == ['192.168.0.0/23', '192.168.2.0/23']
+
+
+def test_merge_record_unions_ports_and_keeps_known_fields():
+    inventory = {}
+    assert merge_record(inventory, {'ip': '10.0.0.5', 'mac': 'AA:BB:CC:00:00:01',
+                                    'hostname': 'nas', 'open_ports': [22],
+                                    'services': [{'port': 22, 'service': 'ssh', 'version': None}]})
+    assert not merge_record(inventory, {'ip': '10.0.0.5', 'mac': 'aa:bb:cc:00:00:01',
+                                        'hostname': None, 'vendor': 'Synology', 'open_ports': [80],
+                                        'services': [{'port': 22, 'service': 'ssh',
+                                                      'version': 'OpenSSH_9.6'}]})
+    record = inventory['aa:bb:cc:00:00:01', '10.0.0.5']
+    assert record['hostname'] == 'nas'
+    assert record['vendor'] == 'Synology'
+    assert record['open_ports'] == [22, 80]
+    assert record['services'] == [{'port': 22, 'service': 'ssh', 'version': 'OpenSSH_9.6'}]
+
+
+def run_with_client(coordinator, test):
+    """Run test(client) against the coordinator's API served in-process"""
+    async def main():
+        async with TestClient(TestServer(coordinator.app())) as client:
+            await test(client)
+    asyncio.run(main())
+
+
+async def register(client, networks):
+    response = await client.post(f'{API}/agents', json={'name': networks[0], 'networks': networks})
+    assert response.status == 200
+    return (await response.json())['agent_id']
+
+
+async def lease(client, agent_id):
+    response = await client.post(f'{API}/lease', json={'agent_id': agent_id})
+    return response.status, (await response.json())['unit'] if response.status == 200 else None
+
+
+def test_units_are_leased_reported_and_completed():
+    records = []
+    coordinator = Coordinator(['10.1.0.0/24', '10.2.0.0/24'], '22,80', log=lambda _: None,
+                              on_record=records.append)
+    
+    async def test(client):
+        agent = await register(client, ['10.2.0.0/16'])
+        status, unit = await lease(client, agent)
+        assert status == 200 and unit['network'] == '10.2.0.0/24' and unit['ports'] == '22,80'
+        # The other unit is out of this agent's reach
+        assert (await lease(client, agent))[0] == 204
+        
+        response = await client.post(f"{API}/units/{unit['id']}/devices", json={
+            'agent_id': agent, 'devices': [{'ip': '10.2.0.7', 'mac': 'aa:bb:cc:00:00:07',
+                                            'open_ports': [22]}]})
+        assert response.status == 200
+        response = await client.post(f"{API}/units/{unit['id']}/complete", json={'agent_id': agent})
+        assert response.status == 200
+        
+        other = await register(client, ['10.1.0.0/24'])
+        status, unit = await lease(client, other)
+        await client.post(f"{API}/units/{unit['id']}/complete", json={'agent_id': other})
+        assert (await lease(client, other))[0] == 410
+    
+    run_with_client(coordinator, test)
+    assert coordinator.finished
+    assert [record['network'] for record in records] == ['10.2.0.0/24']
+    assert list(coordinator.inventory) == [('aa:bb:cc:00:00:07', '10.2.0.7')]
+
+
+def test_expired_lease_is_requeued_and_late_reports_refused():
+    coordinator = Coordinator(['10.3.0.0/24'], '22', lease=30.0, max_attempts=2, log=lambda _: None)
+    
+    async def test(client):
+        first = await register(client, ['10.3.0.0/24'])
+        _, unit = await lease(client, first)
+        coordinator.expire_leases(now=coordinator.units[0].expires + 1)
+        assert coordinator.units[0].state == 'pending'
+        
+        second = await register(client, ['10.3.0.0/24'])
+        _, again = await lease(client, second)
+        assert again['id'] == unit['id']
+        # The first agent woke up: its results for the reassigned unit are refused
+        response = await client.post(f"{API}/units/{unit['id']}/devices",
+                                     json={'agent_id': first, 'devices': [{'ip': '10.3.0.1'}]})
+        assert response.status == 409
+        assert not coordinator.inventory
+        
+        # Out of attempts: the unit fails instead of going back to the queue
+        coordinator.expire_leases(now=coordinator.units[0].expires + 1)
+        assert coordinator.units[0].state == 'failed'
+        assert coordinator.finished
+    
+    run_with_client(coordinator, test)
+
+
+def test_token_is_required_when_set():
+    coordinator = Coordinator(['10.4.0.0/24'], '22', token='secret', log=lambda _: None)
+    
+    async def test(client):
+        response = await client.get(f'{API}/status')
+        assert response.status == 401
+        response = await client.get(f'{API}/status', headers={'Authorization': 'Bearer secret'})
+        assert response.status == 200
+        assert (await response.json())['units'][0]['network'] == '10.4.0.0/24'
+    
+    run_with_client(coordinator, test)
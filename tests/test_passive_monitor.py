@@ -0,0 +1,85 @@
+import pytest
+
+pytest.importorskip('scapy')
+from scapy.layers.dhcp import BOOTP, DHCP
+from scapy.layers.dns import DNS, DNSRR
+from scapy.layers.inet import IP, UDP
+from scapy.layers.l2 import ARP, Ether
+from scapy.utils import wrpcap
+
+from passive_monitor import PassiveMonitor
+
+LAPTOP, PRINTER, TV, SPOOFER = ('02:00:00:00:00:0a', '02:00:00:00:00:0b',
+                                '02:00:00:00:00:0c', '02:00:00:00:00:0d')
+BROADCAST = 'ff:ff:ff:ff:ff:ff'
+
+
+def at(time, packet):
+    packet.time = time
+    return packet
+
+
+def arp(time, ip, mac):
+    return at(time, Ether(src=mac, dst=BROADCAST) / ARP(op=1, hwsrc=mac, psrc=ip, pdst='10.5.0.1'))
+
+
+def dhcp(time, mac, kind, your_ip='0.0.0.0', hostname=None):
+    options = [('message-type', kind)] + ([('hostname', hostname)] if hostname else []) + ['end']
+    chaddr = bytes.fromhex(mac.replace(':', '')) + bytes(10)
+    return at(time, Ether(src=mac, dst=BROADCAST) / IP(src='0.0.0.0', dst='255.255.255.255')
+              / UDP(sport=68, dport=67) / BOOTP(op=1 if kind == 'request' else 2, chaddr=chaddr,
+                                                yiaddr=your_ip, xid=7)
+              / DHCP(options=options))
+
+
+def mdns(time, ip, mac, name):
+    return at(time, Ether(src=mac, dst='01:00:5e:00:00:fb') / IP(src=ip, dst='224.0.0.251')
+              / UDP(sport=5353, dport=5353)
+              / DNS(qr=1, aa=1, an=DNSRR(rrname=name, type='A', rdata=ip)))
+
+
+@pytest.fixture
+def replay(tmp_path):
+    """Replay packets through a monitor of 10.5.0.0/24; returns its events as tuples"""
+    def run(packets, **options):
+        path = str(tmp_path / 'capture.pcap')
+        wrpcap(path, packets)
+        events = []
+        monitor = PassiveMonitor(
+            ['10.5.0.0/24'], lambda event, host: events.append((event, host.ip, host.mac, host.hostname)),
+            neighbours=False, **options)
+        monitor.replay(path)
+        return events
+    return run
+
+
+def test_replay_reports_new_moved_gone_and_returned(replay):
+    events = replay([
+        arp(0, '10.5.0.10', LAPTOP),
+        arp(1, '10.9.0.10', LAPTOP),  # outside the monitored network
+        arp(3, '10.5.0.10', SPOOFER),
+        mdns(4, '10.5.0.30', TV, 'tv.local.'),
+        # Silent from here on: verified at 15 and 25, both unanswered
+        arp(30, '10.5.0.10', SPOOFER),
+    ], stale_after=10, check_interval=5, max_missed=2)
+    assert events == [
+        ('new', '10.5.0.10', LAPTOP, None),
+        ('moved', '10.5.0.10', SPOOFER, None),
+        ('new', '10.5.0.30', TV, 'tv.local'),
+        ('gone', '10.5.0.10', SPOOFER, None),
+        ('gone', '10.5.0.30', TV, 'tv.local'),
+        ('returned', '10.5.0.10', SPOOFER, None),
+    ]
+
+
+def test_dhcp_hostname_is_carried_over_to_the_leased_address(replay):
+    events = replay([
+        dhcp(0, PRINTER, 'request', hostname='printer'),  # no address yet
+        dhcp(1, PRINTER, 'offer', your_ip='10.5.0.20'),  # not taken yet
+        dhcp(2, PRINTER, 'ack', your_ip='10.5.0.20'),
+    ])
+    assert events == [('new', '10.5.0.20', PRINTER, 'printer')]
+
+
+def test_address_probes_are_ignored(replay):
+    assert replay([arp(0, '0.0.0.0', LAPTOP)]) == []
@@ -0,0 +1,42 @@
+import pytest
+
+from result_store import ResultStore, parse_mac
+
+
+@pytest.fixture
+def store():
+    return ResultStore(records=[
+        {'ip': '10.0.0.2', 'mac': 'AA:BB:CC:00:00:01', 'vendor': 'Dell Inc.', 'open_ports': [22, 3389]},
+        {'ip': '10.0.0.1', 'mac': 'aa:bb:cc:00:00:02', 'vendor': 'Apple, Inc.', 'open_ports': [22]},
+        {'ip': '10.0.0.3', 'mac': 'aa:bb:cc:00:00:01', 'vendor': 'Dell Inc.', 'open_ports': [80]},
+        {'ip': '10.0.0.4', 'mac': None, 'open_ports': [3389]},
+    ])
+
+
+def ips(hosts):
+    return [host.ip for host in hosts]
+
+
+def test_select_by_mac_uses_every_row_of_the_mac(store):
+    assert ips(store.select(mac='aa-bb-cc-00-00-01')) == ['10.0.0.2', '10.0.0.3']
+    assert store.select(mac='aa:bb:cc:00:00:09') == []
+
+
+def test_select_intersects_criteria(store):
+    assert ips(store.select(port=3389)) == ['10.0.0.2', '10.0.0.4']
+    assert ips(store.select(port=22, vendor='dell')) == ['10.0.0.2']
+    assert ips(store.select(port=22, mac='aa:bb:cc:00:00:02')) == ['10.0.0.1']
+    assert len(store.select()) == 4
+
+
+def test_repeat_sighting_keeps_a_single_mac_row(store):
+    store.add({'ip': '10.0.0.2', 'mac': 'aa:bb:cc:00:00:01', 'open_ports': [443]})
+    hosts = store.select(mac='aa:bb:cc:00:00:01')
+    assert ips(hosts) == ['10.0.0.2', '10.0.0.3']
+    assert hosts[0].open_ports() == [22, 443, 3389]
+
+
+def test_parse_mac():
+    assert parse_mac('AABB.CC00.0001') == 'aa:bb:cc:00:00:01'
+    with pytest.raises(ValueError):
+        parse_mac('aa:bb:cc')
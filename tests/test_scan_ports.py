@@ -0,0 +1,33 @@
+import json
+
+import pytest
+from click.testing import CliRunner
+
+import scanner
+
+HOST = '127.0.0.5'
+
+
+@pytest.fixture
+def scan(tmp_path):
+    """Run `scan HOST` against a private history db; returns the open ports found"""
+    def run(*args):
+        out = tmp_path / 'scan.json'
+        result = CliRunner().invoke(scanner.cli, [
+            'scan', f'{HOST}/32', '--discovery', 'ping', '--no-resolve', '--no-service-detection',
+            '--db', str(tmp_path / 'history.db'), '--export-json', str(out), *args])
+        assert result.exit_code == 0, result.output
+        devices = json.loads(out.read_text())['devices']
+        return sorted(port for device in devices for port in device['open_ports'])
+    return run
+
+
+def test_known_open_ports_outside_the_spec_are_not_probed(scan, listeners):
+    first, second = listeners(HOST, 2)
+    assert scan('--ports', f'{first},{second}') == sorted([first, second])
+    
+    # The history still has `first` open, but this run did not ask for it
+    assert scan('--ports', str(second)) == [second]
+    assert scan('--ports', f'{first},{second}', '--exclude-ports', str(first)) == [second]
+    # Re-verification of an unchanged host sticks to the spec as well
+    assert scan('--ports', str(second), '--incremental') == [second]
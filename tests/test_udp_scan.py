@@ -0,0 +1,100 @@
+import asyncio
+import socket
+import struct
+import threading
+
+import pytest
+
+import udp_scan
+from udp_scan import UdpScanner, identify
+
+LOOPBACK = '127.0.0.1'
+
+
+@pytest.fixture
+def responder():
+    """A loopback UDP socket answering every datagram with `reply` (None: stays silent)"""
+    sockets = []
+    
+    def start(reply):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind((LOOPBACK, 0))
+        sock.settimeout(0.1)
+        sockets.append(sock)
+        
+        def serve():
+            while sock.fileno() != -1:
+                try:
+                    _, peer = sock.recvfrom(2048)
+                except socket.timeout:
+                    continue
+                except OSError:
+                    return
+                if reply is not None:
+                    sock.sendto(reply, peer)
+        
+        threading.Thread(target=serve, daemon=True).start()
+        return sock.getsockname()[1]
+    
+    yield start
+    for sock in sockets:
+        sock.close()
+
+
+def closed_port():
+    """A loopback UDP port nothing listens on"""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind((LOOPBACK, 0))
+        return sock.getsockname()[1]
+
+
+def scan(ports, **options):
+    async def main():
+        scanner = UdpScanner(**options)
+        try:
+            return await scanner.scan(LOOPBACK, ports)
+        finally:
+            scanner.close()
+    return asyncio.run(main())
+
+
+def test_reply_means_open(responder):
+    port = responder(b'pong')
+    assert scan([port], wait=0.5) == {port: ('open', b'pong')}
+
+
+@pytest.mark.skipif(udp_scan.IP_RECVERR is None, reason='ICMP errors are only readable with IP_RECVERR')
+def test_port_unreachable_means_closed(responder):
+    open_port, closed = responder(b'pong'), closed_port()
+    results = scan([open_port, closed], wait=0.5)
+    assert results[open_port][0] == 'open'
+    assert results[closed] == ('closed', b'')
+
+
+def test_silence_means_open_filtered(responder):
+    port = responder(None)
+    assert scan([port], retries=1, wait=0.2) == {port: ('open|filtered', b'')}
+
+
+@pytest.mark.skipif(udp_scan.IP_RECVERR is None, reason='ICMP errors are only readable with IP_RECVERR')
+def test_error_queue_entries_set_closed_or_filtered():
+    scanner = UdpScanner()
+    host = scanner._hosts[LOOPBACK] = udp_scan._Host({1000, 1001})
+    
+    def extended_error(code):
+        # struct sock_extended_error, then the offender's address (ignored here)
+        data = struct.pack('=IBBBBII', 111, udp_scan.SO_EE_ORIGIN_ICMP, udp_scan.ICMP_DEST_UNREACH,
+                           code, 0, 0, 0) + bytes(16)
+        return [(socket.IPPROTO_IP, udp_scan.IP_RECVERR, data)]
+    
+    scanner._on_error((LOOPBACK, 1000), extended_error(udp_scan.ICMP_PORT_UNREACH))
+    scanner._on_error((LOOPBACK, 1001), extended_error(13))  # administratively prohibited
+    assert host.answers == {1000: ('closed', b''), 1001: ('filtered', b'')}
+    assert host.icmp_errors == 2
+    assert host.complete.is_set()
+
+
+def test_replies_are_identified_by_protocol():
+    ntp_reply = b'\x24' + bytes(47)  # version 4, mode 4 (server)
+    assert identify(123, ntp_reply) == ('ntp', None)
+    assert identify(11211, b'\x00\x01\x00\x00\x00\x01\x00\x00VERSION 1.6.21\r\n') == ('memcache', 'memcached 1.6.21')
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+UDP Scan - Batched UDP port scanning with protocol-specific probes
+Used by scanner.py
+"""
+
+import asyncio
+import errno
+import re
+import socket
+import struct
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Sequence, Set, Tuple
+
+from service_probe import Probe, Signature, match, service_for_port
+
+DEFAULT_RATE = 1000  # UDP probes per second across the scan
+MIN_HOST_RATE = 1.0  # retry pace for hosts throttling ICMP (Linux: ~1 error/s per peer)
+
+# ============================================================================
+# PROTOCOL PROBES
+# ============================================================================
+
+def _sig(service: str, pattern: bytes, version_group: Optional[int] = None,
+         product: Optional[str] = None) -> Signature:
+    return Signature(service, re.compile(pattern, re.DOTALL), version_group, product)
+
+
+# First byte of an NTP server reply: any leap indicator and version, mode 4
+_NTP_SERVER = b'[' + b''.join(re.escape(bytes([b])) for b in range(256) if b & 7 == 4) + b']'
+
+# Payloads that make a service on its well-known port answer, and what the
+# answer looks like. Any other port gets an empty datagram.
+UDP_PROBES = (
+    Probe('DNSVersionBind',
+          b'\x00\x06\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00\x07version\x04bind\x00\x00\x10\x00\x03',
+          frozenset({53}),
+          (_sig('domain', rb'^\x00\x06[\x80-\xff].*?\xc0\x0c\x00\x10\x00\x03.{6}.([\x20-\x7e]+)', 1),
+           _sig('domain', rb'^\x00\x06[\x80-\xff]'))),
+    Probe('NTPRequest', b'\x1b' + b'\x00' * 47, frozenset({123}),
+          (_sig('ntp', b'^' + _NTP_SERVER + b'.{47}'),)),
+    Probe('NBTStat',
+          b'\x80\xf0\x00\x10\x00\x01\x00\x00\x00\x00\x00\x00\x20' + b'CKAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+          b'\x00\x00\x21\x00\x01',
+          frozenset({137}),
+          (_sig('netbios-ns', rb'^\x80\xf0\x84'),)),
+    Probe('SNMPv1GetSysDescr',
+          b'\x30\x29\x02\x01\x00\x04\x06public\xa0\x1c\x02\x04\x4e\x53\x43\x4e\x02\x01\x00'
+          b'\x02\x01\x00\x30\x0e\x30\x0c\x06\x08\x2b\x06\x01\x02\x01\x01\x01\x00\x05\x00',
+          frozenset({161}),
+          (_sig('snmp', rb'^\x30.{1,3}\x02\x01\x00\x04\x06public\xa2.*?'
+                        rb'\x2b\x06\x01\x02\x01\x01\x01\x00\x04(?:[\x00-\x7f]|\x81.)([^\x00]+)', 1),
+           _sig('snmp', rb'^\x30.{1,3}\x02\x01[\x00-\x03]'))),
+    Probe('SSDPSearch',
+          b'M-SEARCH * HTTP/1.1\r\nHOST: 239.255.255.250:1900\r\nMAN: "ssdp:discover"\r\n'
+          b'MX: 1\r\nST: ssdp:all\r\n\r\n',
+          frozenset({1900}),
+          (_sig('ssdp', rb'(?i)^HTTP/1\.1 200.*?\r\nserver: *([^\r\n]+)', 1),
+           _sig('ssdp', rb'^HTTP/1\.1 200'))),
+    Probe('SIPOptions',
+          b'OPTIONS sip:nm SIP/2.0\r\nVia: SIP/2.0/UDP nm;branch=z9hG4bK-scan\r\n'
+          b'From: <sip:nm@nm>;tag=scan\r\nTo: <sip:nm2@nm2>\r\nCall-ID: 50000\r\n'
+          b'CSeq: 42 OPTIONS\r\nMax-Forwards: 70\r\nContent-Length: 0\r\n\r\n',
+          frozenset({5060}),
+          (_sig('sip', rb'(?i)^SIP/2\.0 \d{3}.*?\r\n(?:server|user-agent): *([^\r\n]+)', 1),
+           _sig('sip', rb'^SIP/2\.0 \d{3}'))),
+    Probe('mDNSServices',
+          b'\x00\x00\x00\x00\x00\x01\x00\x00\x00\x00\x00\x00'
+          b'\x09_services\x07_dns-sd\x04_udp\x05local\x00\x00\x0c\x80\x01',
+          frozenset({5353}),
+          (_sig('mdns', rb'^\x00\x00[\x80-\xff]'),)),
+    Probe('MemcachedVersion', b'\x00\x01\x00\x00\x00\x01\x00\x00version\r\n', frozenset({11211}),
+          (_sig('memcache', rb'^.{8}VERSION ([\d.]+)', 1, 'memcached'),)),
+)
+
+# Default --udp-ports: every port with a protocol probe
+DEFAULT_PORTS = ','.join(str(port) for port in sorted(set().union(*(p.ports for p in UDP_PROBES))))
+
+_probes_by_port = {port: probe for probe in UDP_PROBES for port in probe.ports}
+
+
+def payload_for(port: int) -> bytes:
+    probe = _probes_by_port.get(port)
+    return probe.payload if probe else b''
+
+
+def identify(port: int, data: bytes) -> Tuple[str, Optional[str]]:
+    """(service, version) for a UDP reply; falls back to the port table"""
+    probe = _probes_by_port.get(port)
+    if probe is not None:
+        found = match(probe.signatures, data)
+        if found:
+            return found
+    return service_for_port(port, 'udp'), None
+
+
+# ============================================================================
+# SCANNER
+# ============================================================================
+
+ICMP_DEST_UNREACH = 3
+ICMP_PORT_UNREACH = 3
+SO_EE_ORIGIN_ICMP = 2
+# Linux only; not every Python build exports the constant
+IP_RECVERR = getattr(socket, 'IP_RECVERR', 11 if sys.platform.startswith('linux') else None)
+SEND_ERRNOS = {errno.ENOBUFS, errno.EAGAIN, errno.EHOSTUNREACH, errno.ENETUNREACH,
+               errno.EPERM, errno.ECONNREFUSED, getattr(errno, 'EHOSTDOWN', errno.EHOSTUNREACH)}
+
+
+@dataclass
+class _Host:
+    """Probe state of one host being scanned"""
+    ports: Set[int]
+    answers: Dict[int, Tuple[str, bytes]] = field(default_factory=dict)
+    icmp_errors: int = 0
+    complete: asyncio.Event = field(default_factory=asyncio.Event)
+    
+    def answer(self, port: int, state: str, data: bytes = b''):
+        if port in self.ports and port not in self.answers:
+            self.answers[port] = (state, data)
+            if len(self.answers) == len(self.ports):
+                self.complete.set()
+
+
+class UdpScanner:
+    """
+    Batched UDP port scanner on one shared datagram socket.
+
+    Every probe of the scan - the protocol payload for the port (DNS, NTP,
+    SNMP, SSDP, ...) or an empty datagram - goes out of a single unconnected
+    socket in batches paced to `rate` per second, and the event loop reads
+    every answer off it: a UDP reply means open (and is matched against the
+    port's signatures), an ICMP port unreachable means closed, any other
+    unreachable means filtered. On Linux the ICMP errors an unconnected
+    socket provokes are read from its error queue (IP_RECVERR), which
+    carries the original destination; elsewhere they are invisible and
+    silent ports simply stay open|filtered.
+
+    Hosts rate-limit ICMP errors (Linux sends about one per second per peer
+    after a short burst), so silence from a host that does send unreachables
+    is likely a suppressed "closed". Unanswered probes are resent up to
+    `retries` times, `wait` seconds apart; a host that returned ICMP errors
+    is resent at the rate it produced them, but at least MIN_HOST_RATE.
+    """
+    
+    def __init__(self, rate: Optional[int] = DEFAULT_RATE, retries: int = 2,
+                 wait: float = 1.0, batch_size: int = 64):
+        self.rate = rate
+        self.retries = retries
+        self.wait = wait
+        self.batch_size = max(1, batch_size)
+        self._sock: Optional[socket.socket] = None
+        self._loop = None
+        self._hosts: Dict[str, _Host] = {}
+        self._next_send = 0.0
+    
+    def _open(self):
+        loop = asyncio.get_running_loop()
+        if self._sock is not None and self._loop is loop:
+            return
+        self.close()
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setblocking(False)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+        if IP_RECVERR is not None:
+            sock.setsockopt(socket.IPPROTO_IP, IP_RECVERR, 1)
+        sock.bind(('', 0))
+        loop.add_reader(sock.fileno(), self._on_readable)
+        self._sock, self._loop = sock, loop
+    
+    def close(self):
+        if self._sock is None:
+            return
+        try:
+            self._loop.remove_reader(self._sock.fileno())
+        except (RuntimeError, ValueError):
+            pass  # loop already closed
+        self._sock.close()
+        self._sock = self._loop = None
+    
+    # -- receiving ------------------------------------------------------------
+    
+    def _on_readable(self):
+        sock = self._sock
+        if IP_RECVERR is not None:
+            while True:  # ICMP errors first: they may explain silent probes
+                try:
+                    _, ancdata, _, address = sock.recvmsg(512, 512, socket.MSG_ERRQUEUE)
+                except (BlockingIOError, InterruptedError):
+                    break
+                except OSError:
+                    break
+                self._on_error(address, ancdata)
+        while True:
+            try:
+                data, (ip, port) = sock.recvfrom(65535)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                continue  # a pending ICMP error surfacing once; already queued above
+            host = self._hosts.get(ip)
+            if host is not None:
+                host.answer(port, 'open', data)
+    
+    def _on_error(self, address, ancdata):
+        if not address:
+            return
+        ip, port = address[:2]
+        host = self._hosts.get(ip)
+        if host is None:
+            return
+        for level, kind, data in ancdata:
+            if level != socket.IPPROTO_IP or kind != IP_RECVERR or len(data) < 16:
+                continue
+            _, origin, icmp_type, code, _, _, _ = struct.unpack_from('=IBBBBII', data)
+            if origin != SO_EE_ORIGIN_ICMP or icmp_type != ICMP_DEST_UNREACH:
+                continue
+            host.icmp_errors += 1
+            host.answer(port, 'closed' if code == ICMP_PORT_UNREACH else 'filtered')
+    
+    # -- sending --------------------------------------------------------------
+    
+    async def _pace(self, count: int):
+        """Reserve send slots for count probes under the scan-wide rate"""
+        if not self.rate:
+            await asyncio.sleep(0)
+            return
+        now = time.monotonic()
+        start = max(now, self._next_send)
+        self._next_send = start + count / self.rate
+        await asyncio.sleep(start - now)
+    
+    def _send(self, ip: str, port: int):
+        for _ in range(2):
+            try:
+                self._sock.sendto(payload_for(port), (ip, port))
+                return
+            except OSError as e:
+                # With IP_RECVERR an earlier ICMP error is also reported by the
+                # next send on the socket; that send didn't happen, so retry
+                if e.errno not in SEND_ERRNOS:
+                    raise
+    
+    async def _send_round(self, ip: str, ports: Sequence[int], host_rate: Optional[float]):
+        batch = 1 if host_rate else self.batch_size
+        for i in range(0, len(ports), batch):
+            chunk = ports[i:i + batch]
+            await self._pace(len(chunk))
+            for port in chunk:
+                self._send(ip, port)
+            if host_rate:
+                await asyncio.sleep(1 / host_rate)
+    
+    async def scan(self, ip: str, ports: Sequence[int]) -> Dict[int, Tuple[str, bytes]]:
+        """
+        Probe ports on one host; many hosts can be scanned concurrently.
+
+        Returns {port: (state, reply)} with state open, closed, filtered or
+        open|filtered (no answer at all); reply is the first datagram
+        received for open ports.
+        """
+        self._open()
+        host = self._hosts[ip] = _Host(set(ports))
+        pending = list(dict.fromkeys(ports))
+        host_rate = None
+        try:
+            for _ in range(self.retries + 1):
+                started = time.monotonic()
+                errors_before = host.icmp_errors
+                await self._send_round(ip, pending, host_rate)
+                try:
+                    await asyncio.wait_for(host.complete.wait(), self.wait)
+                except asyncio.TimeoutError:
+                    pass
+                pending = [port for port in pending if port not in host.answers]
+                if not pending:
+                    break
+                errors = host.icmp_errors - errors_before
+                if errors:
+                    host_rate = max(errors / (time.monotonic() - started), MIN_HOST_RATE)
+        finally:
+            del self._hosts[ip]
+        results = dict(host.answers)
+        for port in pending:
+            results[port] = ('open|filtered', b'')
+        return results
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+Vendor Database - Offline MAC vendor (OUI) lookups
+Compiles the IEEE MA-L/MA-M/MA-S registries into a memory-mapped prefix index
+"""
+
+import csv
+import io
+import mmap
+import os
+import struct
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from hostname_resolver import CACHE_DIR
+
+DEFAULT_INDEX_PATH = os.path.join(CACHE_DIR, 'oui.idx')
+
+# IEEE registries, longest prefix first: (prefix bits, CSV URL)
+IEEE_REGISTRIES = [
+    (36, 'https://standards-oui.ieee.org/oui36/oui36.csv'),  # MA-S
+    (28, 'https://standards-oui.ieee.org/oui28/mam.csv'),    # MA-M
+    (24, 'https://standards-oui.ieee.org/oui/oui.csv'),      # MA-L
+]
+PREFIX_BITS = [bits for bits, _ in IEEE_REGISTRIES]
+
+MAX_AGE = 90 * 24 * 3600  # suggest `update-vendors` once the index is older than this
+
+# File layout: header, one open-addressing hash table per prefix length
+# (longest first), then the interned vendor strings.
+MAGIC = b'OUIX'
+VERSION = 1
+HEADER = struct.Struct('<4sId' + 'I' * len(PREFIX_BITS))  # magic, version, built_at, slots
+SLOT = struct.Struct('<QI')  # prefix + 1 (0 = empty slot), string offset
+STRLEN = struct.Struct('<H')
+GOLDEN = 0x9E3779B97F4A7C15
+
+
+def _slot_index(key: int, slot_bits: int) -> int:
+    """Fibonacci hashing of a prefix onto a power-of-two table"""
+    return ((key * GOLDEN) & 0xFFFFFFFFFFFFFFFF) >> (64 - slot_bits)
+
+
+def mac_to_int(mac: str) -> Optional[int]:
+    """Parse any common MAC notation (aa:bb:.., aa-bb-.., aabb.cc..) to an int"""
+    digits = ''.join(c for c in mac if c not in ':-. ')
+    if len(digits) != 12:
+        return None
+    try:
+        return int(digits, 16)
+    except ValueError:
+        return None
+
+
+# ============================================================================
+# REGISTRY PARSING
+# ============================================================================
+
+def parse_ieee_csv(text: str) -> Iterable[Tuple[int, int, str]]:
+    """Yield (bits, prefix, vendor) from an IEEE registry CSV export"""
+    for row in csv.DictReader(io.StringIO(text)):
+        assignment = (row.get('Assignment') or '').strip()
+        vendor = (row.get('Organization Name') or '').strip()
+        if not assignment or not vendor:
+            continue
+        try:
+            yield len(assignment) * 4, int(assignment, 16), vendor
+        except ValueError:
+            continue
+
+
+def parse_ieee_text(text: str) -> Iterable[Tuple[int, int, str]]:
+    """
+    Yield (bits, prefix, vendor) from the IEEE plain-text registry format
+    (oui.txt, mam.txt, oui36.txt, iab.txt), as bundled with netaddr.
+    """
+    oui = None
+    for line in text.splitlines():
+        if '(hex)' in line:
+            oui = line.split('(hex)')[0].strip().replace('-', '')
+        elif '(base 16)' in line and oui:
+            left, _, vendor = line.partition('(base 16)')
+            left, vendor = left.strip(), vendor.strip()
+            if '-' in left:
+                # Sub-allocation such as "9CC000-9CCFFF": fixed digits give the length
+                start, end = left.split('-')
+                fixed = len(start)
+                while fixed and start[fixed - 1] == '0' and end[fixed - 1] == 'F':
+                    fixed -= 1
+                digits = oui + start[:fixed]
+            else:
+                digits = left
+            if vendor:
+                try:
+                    yield len(digits) * 4, int(digits, 16), vendor
+                except ValueError:
+                    pass
+            oui = None
+
+
+# ============================================================================
+# INDEX COMPILER
+# ============================================================================
+
+def compile_index(entries: Iterable[Tuple[int, int, str]], path: str) -> int:
+    """
+    Compile (bits, prefix, vendor) entries into an index file at path.
+
+    Vendor names are interned once in a string blob; each prefix length
+    gets a hash table at most half full. Written atomically. Returns the
+    number of prefixes indexed.
+    """
+    tables: Dict[int, Dict[int, str]] = {bits: {} for bits in PREFIX_BITS}
+    for bits, prefix, vendor in entries:
+        if bits in tables:
+            tables[bits].setdefault(prefix, vendor)
+    
+    strings = bytearray()
+    string_offsets: Dict[str, int] = {}
+    
+    def intern(vendor: str) -> int:
+        offset = string_offsets.get(vendor)
+        if offset is None:
+            encoded = vendor.encode('utf-8')[:0xFFFF]
+            offset = string_offsets[vendor] = len(strings)
+            strings.extend(STRLEN.pack(len(encoded)) + encoded)
+        return offset
+    
+    blobs = []
+    slot_counts = []
+    for bits in PREFIX_BITS:
+        table = tables[bits]
+        slot_bits = max(4, (len(table) * 2).bit_length())
+        slot_count = 1 << slot_bits
+        mask = slot_count - 1
+        slots: List[Tuple[int, int]] = [(0, 0)] * slot_count
+        for prefix, vendor in table.items():
+            key = prefix + 1
+            i = _slot_index(key, slot_bits)
+            while slots[i][0]:
+                i = (i + 1) & mask
+            slots[i] = (key, intern(vendor))
+        blobs.append(b''.join(SLOT.pack(k, v) for k, v in slots))
+        slot_counts.append(slot_count)
+    
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, time.time(), *slot_counts))
+        for blob in blobs:
+            f.write(blob)
+        f.write(strings)
+    os.replace(tmp, path)
+    return sum(len(t) for t in tables.values())
+
+
+def bundled_registry_entries() -> List[Tuple[int, int, str]]:
+    """Registry data shipped with netaddr, used to build an index offline"""
+    try:
+        import netaddr.eui
+    except ImportError:
+        return []
+    entries = []
+    directory = os.path.dirname(netaddr.eui.__file__)
+    for name in ('iab.txt', 'oui.txt'):
+        try:
+            with open(os.path.join(directory, name), encoding='utf-8', errors='replace') as f:
+                entries.extend(parse_ieee_text(f.read()))
+        except OSError:
+            continue
+    return entries
+
+
+def download_registry_entries(timeout: float = 30.0) -> List[Tuple[int, int, str]]:
+    """Fetch the current MA-S, MA-M and MA-L registries from the IEEE"""
+    import urllib.request  # only needed for explicit/expired refreshes
+    
+    entries = []
+    for _, url in IEEE_REGISTRIES:
+        request = urllib.request.Request(url, headers={'User-Agent': 'network-scanner'})
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            entries.extend(parse_ieee_csv(response.read().decode('utf-8', errors='replace')))
+    return entries
+
+
+# ============================================================================
+# LOOKUPS
+# ============================================================================
+
+class VendorDB:
+    """
+    Memory-mapped OUI vendor index.
+
+    Opening the index costs one mmap, and each lookup probes at most one
+    hash table per prefix length (MA-S, then MA-M, then MA-L), so the
+    longest matching prefix is found in O(1) without touching the network.
+    The index is built from netaddr's bundled registry when missing, and
+    re-downloaded from the IEEE only by refresh() (`update-vendors`), never
+    from a lookup: lookups run on the scan's event loop and must not block
+    on the network. is_expired() tells when a refresh is due.
+    """
+    
+    def __init__(self, path: str = DEFAULT_INDEX_PATH, max_age: float = MAX_AGE):
+        self.path = path
+        self.max_age = max_age
+        self._mm: Optional[mmap.mmap] = None
+        self._tables: List[Tuple[int, int, int]] = []  # (bits, slot_bits, offset)
+        self._names: Dict[int, str] = {}
+        self._opened = False
+    
+    # -- index management -----------------------------------------------------
+    
+    def is_expired(self) -> bool:
+        try:
+            return time.time() - os.path.getmtime(self.path) > self.max_age
+        except OSError:
+            return True
+    
+    def refresh(self, timeout: float = 30.0) -> int:
+        """Download the IEEE registries and rebuild the index (raises on failure)"""
+        count = compile_index(download_registry_entries(timeout), self.path)
+        self.close()
+        return count
+    
+    def build_offline(self) -> int:
+        """Build the index from locally bundled registry data"""
+        entries = bundled_registry_entries()
+        if not entries:
+            return 0
+        count = compile_index(entries, self.path)
+        self.close()
+        return count
+    
+    def _ensure_index(self):
+        if not os.path.exists(self.path):
+            self.build_offline()
+    
+    def open(self):
+        if self._opened:
+            return
+        self._opened = True
+        self._ensure_index()
+        try:
+            with open(self.path, 'rb') as f:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            self._mm = None
+            return
+        
+        magic, version, self.built_at, *slot_counts = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            return
+        offset = HEADER.size
+        self._tables = []
+        for bits, slot_count in zip(PREFIX_BITS, slot_counts):
+            self._tables.append((bits, slot_count.bit_length() - 1, offset))
+            offset += slot_count * SLOT.size
+        self._strings_offset = offset
+    
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+        self._mm = None
+        self._tables = []
+        self._names = {}
+        self._opened = False
+    
+    # -- lookups --------------------------------------------------------------
+    
+    def _string(self, offset: int) -> str:
+        name = self._names.get(offset)
+        if name is None:
+            start = self._strings_offset + offset
+            (length,) = STRLEN.unpack_from(self._mm, start)
+            start += STRLEN.size
+            name = self._names[offset] = self._mm[start:start + length].decode('utf-8', 'replace')
+        return name
+    
+    def lookup(self, mac: str) -> Optional[str]:
+        """Return the vendor registered for a MAC address, or None"""
+        self.open()
+        value = mac_to_int(mac or '')
+        if self._mm is None or value is None:
+            return None
+        
+        for bits, slot_bits, offset in self._tables:
+            key = (value >> (48 - bits)) + 1
+            mask = (1 << slot_bits) - 1
+            i = _slot_index(key, slot_bits)
+            while True:
+                slot_key, string_offset = SLOT.unpack_from(self._mm, offset + i * SLOT.size)
+                if slot_key == 0:
+                    break
+                if slot_key == key:
+                    return self._string(string_offset)
+                i = (i + 1) & mask
+        return None